@@ -0,0 +1,131 @@
+"""
+Measures how quickly a node answers control messages while it is saturated
+with data traffic, with control_priority disabled (using the transport
+selected with --transport) and enabled.
+
+A separate process floods the node with client messages, which are forwarded
+to 32 synthetic node peers. Meanwhile a query socket sends /p2psc/name every
+10 ms and waits for the reply. The synthetic peers use distinct addresses in
+127.0.0.0/8 with the port of a single sink socket (Linux routes the whole
+range to loopback).
+
+Run from the repository root:
+
+    python -m benchmarks.control [-d SECONDS] [--rate MESSAGES_PER_S] [--transport {asyncio,mmsg}]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import socket
+import statistics
+import time
+
+from p2psc import proto
+from p2psc.node import Node
+from p2psc.peerInfo import PeerInfo, PeerType
+
+NUM_PEERS = 32
+QUERY_INTERVAL = 0.01
+QUERY_TIMEOUT = 0.5
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def udp_socket(ip="127.0.0.1"):
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.bind((ip, 0))
+    s.setblocking(False)
+    return s
+
+
+def flood(addr, duration: float, rate: float):
+    """ Sends client messages to addr for duration seconds, at most rate messages per second (0: unlimited) """
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    dgram = proto.osc_dgram("/ALL/test", [1, 0.5, "abc"])
+    start = time.perf_counter()
+    sent = 0
+    while True:
+        elapsed = time.perf_counter() - start
+        if elapsed >= duration:
+            break
+        if rate > 0 and sent >= elapsed * rate:
+            time.sleep(0.001)
+            continue
+        for _ in range(100):
+            s.sendto(dgram, addr)
+        sent += 100
+    s.close()
+
+
+async def measure(control_priority: bool, udp_transport: str, duration: float, rate: float):
+    loop = asyncio.get_running_loop()
+    port = free_port()
+    node = Node({"name": "bench", "zeroconf": False, "ip": "127.0.0.1", "port": port,
+                 "control_priority": control_priority, "udp_transport": udp_transport})
+    node._loop = loop
+    node._transport, node._protocol = await node._create_endpoint(("127.0.0.1", port))
+    sink = udp_socket("0.0.0.0")
+    sink.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 16)
+    for i in range(NUM_PEERS):
+        node._registry.add_peer(PeerInfo((f"127.1.0.{i + 1}", sink.getsockname()[1]), [f"n{i}"], ["/test"],
+                                         PeerType.node))
+    query = udp_socket()
+    query_dgram = proto.osc_dgram(proto.NODENAME, [])
+
+    flooder = multiprocessing.get_context("spawn").Process(target=flood, args=(("127.0.0.1", port), duration, rate))
+    flooder.start()
+    await asyncio.sleep(0.5)  # wait for the flood to start
+
+    latencies = []
+    lost = 0
+    end = time.perf_counter() + duration - 1
+    while time.perf_counter() < end:
+        start = time.perf_counter()
+        query.sendto(query_dgram, ("127.0.0.1", port))
+        try:
+            await asyncio.wait_for(loop.sock_recv(query, 1024), QUERY_TIMEOUT)
+            latencies.append((time.perf_counter() - start) * 1e3)
+        except asyncio.TimeoutError:
+            lost += 1
+        await asyncio.sleep(QUERY_INTERVAL)
+
+    flooder.join()
+    node._transport.close()
+    await asyncio.sleep(0)
+    for s in [sink, query]:
+        s.close()
+    m = node.metrics
+    q = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else [float("nan")] * 99
+    return {
+        "queries": len(latencies) + lost,
+        "lost": lost,
+        "p50_ms": q[49],
+        "p99_ms": q[98],
+        "forwarded": m.packets_out,
+        "queue_drops": m.queue_drops,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Control message latency under load")
+    parser.add_argument("-d", dest="duration", type=float, default=4, help="Duration of the flood in seconds")
+    parser.add_argument("--rate", dest="rate", type=float, default=0,
+                        help="Messages per second sent by the flooder (default 0: as fast as possible)")
+    parser.add_argument("--transport", dest="transport", choices=["asyncio", "mmsg"], default="mmsg",
+                        help="udp_transport of the node without control_priority (default mmsg)")
+    args = parser.parse_args()
+
+    print(f"{'control_priority':>16} {'queries':>7} {'lost':>5} {'p50 ms':>8} {'p99 ms':>8} {'forwarded':>10} "
+          f"{'queue drops':>11}")
+    for control_priority in [False, True]:
+        r = asyncio.run(measure(control_priority, args.transport, args.duration, args.rate))
+        print(f"{str(control_priority):>16} {r['queries']:7} {r['lost']:5} {r['p50_ms']:8.2f} {r['p99_ms']:8.2f} "
+              f"{r['forwarded']:10} {r['queue_drops']:11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Compares the per-packet overhead of dispatching datagrams from OscProtocolUdp to
+a handler via one asyncio task per datagram (OscHandler.on_osc) and via a direct
+call (OscHandler.on_osc_sync).
+
+Run from the repository root:
+
+    python -m benchmarks.dispatch [-n PACKETS]
+"""
+import argparse
+import asyncio
+import time
+
+from p2psc import proto
+from p2psc.node import Node
+from p2psc.peerInfo import PeerInfo, PeerType
+from p2psc.peerProtocol import OscHandler, OscProtocolUdp
+
+
+class AsyncHandler(OscHandler):
+    def __init__(self) -> None:
+        self.count = 0
+
+    async def on_osc(self, addr, message):
+        self.count += 1
+
+
+class SyncHandler(OscHandler):
+    def __init__(self) -> None:
+        self.count = 0
+
+    def on_osc_sync(self, addr, message):
+        self.count += 1
+
+
+class AsyncNode(Node):
+    """ Node which dispatches every datagram as task (behaviour before on_osc_sync) """
+
+    def on_osc_sync(self, addr, message):
+        asyncio.ensure_future(self.on_osc(addr, message))
+
+    async def on_osc(self, addr, message):
+        Node.on_osc_sync(self, addr, message)
+
+
+class NullTransport:
+    def sendto(self, data, addr=None):
+        pass
+
+
+def make_node(cls):
+    node = cls({"name": "bench", "zeroconf": False, "ip": "127.0.0.1", "port": 3760})
+    node._transport = NullTransport()
+    node._registry.add_peer(PeerInfo(("127.0.0.1", 4000), ["B"], ["/test"], PeerType.node))
+    return node
+
+
+async def run(handler, dgrams, count):
+    """ Feeds all datagrams to the protocol and waits until the handler saw all of them """
+    protocol = OscProtocolUdp(handler)
+    addr = ("127.0.0.1", 5000)
+    start = time.perf_counter()
+    for dgram in dgrams:
+        protocol.datagram_received(dgram, addr)
+    while count() < len(dgrams):
+        await asyncio.sleep(0)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Datagram dispatch benchmark")
+    parser.add_argument("-n", dest="n", type=int, default=100000, help="Number of datagrams")
+    args = parser.parse_args()
+
+    dgrams = [proto.osc_dgram("/ALL/test", [i, 0.5]) for i in range(args.n)]
+    loop = asyncio.new_event_loop()
+
+    results = []
+    h = AsyncHandler()
+    results.append(("handler, task per datagram", loop.run_until_complete(run(h, dgrams, lambda: h.count))))
+    h = SyncHandler()
+    results.append(("handler, direct call", loop.run_until_complete(run(h, dgrams, lambda: h.count))))
+
+    for name, cls in [("node, task per datagram", AsyncNode), ("node, direct call", Node)]:
+        node = make_node(cls)
+        sent = [0]
+        node._transport.sendto = lambda data, addr: sent.__setitem__(0, sent[0] + 1)
+        results.append((name, loop.run_until_complete(run(node, dgrams, lambda: sent[0]))))
+    loop.close()
+
+    print(f"{args.n} datagrams")
+    for name, t in results:
+        print(f"{name:30} {t / args.n * 1e6:8.2f} us/packet {args.n / t:12.0f} packets/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Compares forwarding throughput and latency of a Node over loopback UDP with
+the default asyncio event loop and uvloop (if installed).
+
+A sender socket acts as client of the node, a receiver socket is registered as
+node peer which subscribes the sent path, so every message is forwarded once.
+
+Run from the repository root:
+
+    python -m benchmarks.eventloop [-n MESSAGES]
+"""
+import argparse
+import asyncio
+import socket
+import statistics
+import time
+
+from p2psc import proto
+from p2psc.common.eventloop import EVENT_LOOPS, setup_event_loop
+from p2psc.node import Node
+from p2psc.peerInfo import PeerInfo, PeerType
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def udp_socket():
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 22)
+    s.bind(("127.0.0.1", 0))
+    s.setblocking(False)
+    return s
+
+
+async def start_node():
+    port = free_port()
+    node = Node({"name": "bench", "zeroconf": False, "ip": "127.0.0.1", "port": port})
+    node._loop = asyncio.get_running_loop()
+    node._transport, node._protocol = await node._create_endpoint(("127.0.0.1", port))
+    return node, ("127.0.0.1", port)
+
+
+async def throughput(n):
+    """ Sends n messages in bursts and returns forwarded messages per second """
+    loop = asyncio.get_running_loop()
+    node, node_addr = await start_node()
+    sender, receiver = udp_socket(), udp_socket()
+    node._registry.add_peer(PeerInfo(receiver.getsockname(), ["B"], ["/test"], PeerType.node))
+    dgram = proto.osc_dgram("/ALL/test", [1, 0.5, "abc"])
+
+    received = 0
+    start = time.perf_counter()
+    for i in range(0, n, 100):
+        for _ in range(100):
+            sender.sendto(dgram, node_addr)
+        # wait for the burst to be forwarded
+        while received < i + 100:
+            try:
+                await asyncio.wait_for(loop.sock_recv(receiver, 1024), 1)
+            except asyncio.TimeoutError:
+                break  # lost datagrams
+            received += 1
+    elapsed = time.perf_counter() - start
+
+    node._transport.close()
+    sender.close()
+    receiver.close()
+    return received / elapsed, received / n
+
+
+async def latency(n):
+    """ Sends n messages one by one and returns forwarding latencies in microseconds """
+    loop = asyncio.get_running_loop()
+    node, node_addr = await start_node()
+    sender, receiver = udp_socket(), udp_socket()
+    node._registry.add_peer(PeerInfo(receiver.getsockname(), ["B"], ["/test"], PeerType.node))
+    dgram = proto.osc_dgram("/ALL/test", [1, 0.5, "abc"])
+
+    latencies = []
+    for _ in range(n):
+        start = time.perf_counter()
+        sender.sendto(dgram, node_addr)
+        await loop.sock_recv(receiver, 1024)
+        latencies.append((time.perf_counter() - start) * 1e6)
+
+    node._transport.close()
+    sender.close()
+    receiver.close()
+    return latencies
+
+
+async def run(n):
+    tp, ratio = await throughput(n)
+    lat = await latency(min(n, 5000))
+    q = statistics.quantiles(lat, n=100)
+    return tp, ratio, q[49], q[98]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Event loop forwarding benchmark")
+    parser.add_argument("-n", dest="n", type=int, default=20000, help="Number of messages")
+    args = parser.parse_args()
+
+    print(f"{args.n} messages over loopback")
+    for name in EVENT_LOOPS:
+        used = setup_event_loop(name)
+        if used != name:
+            print(f"{name:10} not available")
+            continue
+        tp, ratio, p50, p99 = asyncio.run(run(args.n))
+        print(f"{name:10} {tp:10.0f} msgs/s (delivered {ratio * 100:.1f}%)  latency p50 {p50:7.1f} us  p99 {p99:7.1f} us")
+    setup_event_loop("asyncio")
+
+
+if __name__ == "__main__":
+    main()
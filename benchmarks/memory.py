@@ -0,0 +1,89 @@
+"""
+Reports the memory used per peer for synthetic peers, created from OSC
+arguments like peerinfos received from the network.
+
++ `dict`: PeerInfo with an instance __dict__ and list fields (as before slots)
++ `slots`: PeerInfo with __slots__, tuple fields and interned strings
++ `registry`: slots PeerInfos added to a PeerRegistry (including indexes)
+
+Run from the repository root:
+
+    python -m benchmarks.memory [-n PEERS [PEERS ...]]
+"""
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+
+from p2psc import proto
+from p2psc.peerInfo import PeerInfo, PeerType
+from p2psc.peerRegistry import PeerRegistry
+
+GROUPS = [f"group{i}" for i in range(20)]
+PATHS = [f"/instrument{i // 10}/param{i % 10}" for i in range(200)]
+
+
+class DictPeerInfo:
+    """ Previous PeerInfo representation """
+
+    def __init__(self, addr, groups, paths, type, version=None) -> None:
+        self.addr = addr
+        self.paths = paths
+        self.groups = groups
+        self.type = type
+        self.version = version
+        self.last_update_t = time.time()
+
+
+def make_args(rnd: random.Random, i: int):
+    ptype = PeerType.node if i % 10 == 0 else PeerType.client
+    # strings are created for every peer, as when parsing received messages
+    return (("10.0.%d.%d" % (i // 250 % 250, i % 250), 1024 + i), ptype,
+            " ".join(rnd.sample(GROUPS, 2)), " ".join(rnd.sample(PATHS, 8)))
+
+
+def create(kind: str, n: int):
+    rnd = random.Random(1)
+    peers = []
+    registry = PeerRegistry("bench") if kind == "registry" else None
+    for i in range(n):
+        addr, ptype, groups, paths = make_args(rnd, i)
+        if kind == "dict":
+            pi = DictPeerInfo(addr, proto.str_to_list(groups), proto.str_to_list(paths), ptype)
+        else:
+            pi = PeerInfo(addr, proto.str_to_list(groups), proto.str_to_list(paths), ptype)
+        if registry is not None:
+            registry.add_peer(pi)
+        else:
+            peers.append(pi)
+    return registry if registry is not None else peers
+
+
+def measure(kind: str, n: int):
+    """ Returns the memory in bytes allocated per peer """
+    gc.collect()
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    peers = create(kind, n)
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    del peers
+    return used / n
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PeerInfo memory benchmark")
+    parser.add_argument("-n", dest="n", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="Numbers of peers")
+    args = parser.parse_args()
+
+    kinds = ["dict", "slots", "registry"]
+    print(f"{'peers':>8} " + " ".join(f"{k + ' B/peer':>16}" for k in kinds))
+    for n in args.n:
+        print(f"{n:8} " + " ".join(f"{measure(k, n):16.0f}" for k in kinds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Compares the wire size and parse time of full node peerinfos with a growing
+number of subscribed paths: as a single datagram, split into chunks and split
+into chunks of the zlib-compressed peerinfo.
+
+Parse time covers reassembling the chunks (if any), decompressing and parsing
+the peerinfo into a PeerInfo object.
+
+Run from the repository root:
+
+    python -m benchmarks.peerinfo [-s MAX_DATAGRAM_SIZE] [-r REPETITIONS]
+"""
+import argparse
+import time
+
+from pythonosc.osc_message import OscMessage
+
+from p2psc import proto
+from p2psc.chunks import ChunkAssembler, split_dgram
+from p2psc.node import Node
+from p2psc.peerInfo import PeerInfo, PeerType
+
+PATH_COUNTS = [10, 100, 1000, 5000, 20000]
+ADDR = ("127.0.0.1", 3760)
+
+
+def make_peerinfo(num_paths):
+    paths = [f"/instrument{i // 16}/param{i % 16}" for i in range(num_paths)]
+    return proto.osc_dgram(proto.PEERINFO, PeerInfo(ADDR, ["node", "A", "B"], paths, PeerType.node, 1).as_osc())
+
+
+def parse(dgrams):
+    assembler = ChunkAssembler()
+    for d in dgrams:
+        msg = OscMessage(d)
+        if msg.address == proto.PEERINFO_CHUNK:
+            dgram = assembler.add(ADDR, msg.params)
+            if dgram is None:
+                continue
+            msg = OscMessage(dgram)
+        return PeerInfo.from_osc(ADDR, msg.params)
+
+
+def measure(dgrams, reps):
+    start = time.perf_counter()
+    for _ in range(reps):
+        parse(dgrams)
+    return (time.perf_counter() - start) / reps * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peerinfo encoding benchmark")
+    parser.add_argument("-s", dest="size", type=int, default=Node.DEFAULT_MAX_DGRAM_SIZE,
+                        help="Maximum datagram size")
+    parser.add_argument("-r", dest="reps", type=int, default=50, help="Repetitions per measurement")
+    args = parser.parse_args()
+
+    print(f"{'paths':>6} {'encoding':>10} {'datagrams':>9} {'bytes':>9} {'largest':>8} {'parse us':>10}")
+    for n in PATH_COUNTS:
+        dgram = make_peerinfo(n)
+        encodings = {
+            "single": [dgram],
+            "chunked": split_dgram(dgram, args.size, 1, False),
+            "zlib": split_dgram(dgram, args.size, 1, True),
+        }
+        for name, dgrams in encodings.items():
+            assert parse(dgrams).paths == PeerInfo.from_osc(ADDR, OscMessage(dgram).params).paths
+            print(f"{n:6} {name:>10} {len(dgrams):9} {sum(map(len, dgrams)):9} {max(map(len, dgrams)):8} "
+                  f"{measure(dgrams, args.reps):10.1f}")
+
+
+if __name__ == "__main__":
+    main()
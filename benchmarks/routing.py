@@ -0,0 +1,257 @@
+"""
+Measures how routing scales with the number of node peers, paths per peer,
+wildcard density and number of groups.
+
+For every configuration a node is set up with synthetic node peers, which
+subscribe random paths out of /instr{0-99}/param{0-9} (a share of them as
+wildcards like /instr3/* or /instr3/param*) in one of the groups. Messages
+are sent by a client to /g0/instr{a}/param{b} and forwarded to all matching
+peers. The synthetic peers use distinct addresses in 127.0.0.0/8 with the
+port of a single sink socket (Linux routes the whole range to loopback).
+One more receiver peer subscribes /instr* in g0 and receives each message
+once.
+
+Reported per configuration:
+
++ get_by_path and PeerInfo.subscribes (linear scan over all peers) lookups/s
++ number of synthetic peers each message is forwarded to (fanout)
++ bytes allocated per handled message (tracemalloc peak, without sockets)
++ forwarded messages/s and p50/p99 latency over loopback UDP
+
+Run from the repository root:
+
+    python -m benchmarks.routing [-n MESSAGES] [--full] [-o results.json]
+
+Without --full each parameter is swept separately around the base
+configuration, with --full all combinations are measured.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import platform
+import random
+import socket
+import statistics
+import sys
+import time
+import tracemalloc
+
+from pythonosc.osc_message import OscMessage
+
+from p2psc import proto
+from p2psc.node import Node
+from p2psc.peerInfo import PeerInfo, PeerType
+
+BASE = {"peers": 100, "paths": 10, "wildcards": 0.1, "groups": 4}
+SWEEP = {
+    "peers": [10, 100, 1000],
+    "paths": [1, 10, 50],
+    "wildcards": [0.0, 0.1, 0.5],
+    "groups": [1, 4, 16],
+}
+NUM_PROBE_PATHS = 256
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def udp_socket(ip="127.0.0.1"):
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 22)
+    s.bind((ip, 0))
+    s.setblocking(False)
+    return s
+
+
+def random_path(rnd: random.Random, wildcards: float):
+    instr, param = rnd.randrange(100), rnd.randrange(10)
+    if rnd.random() >= wildcards:
+        return f"/instr{instr}/param{param}"
+    return rnd.choice([f"/instr{instr}/*", f"/instr{instr}/param*"])
+
+
+def make_peers(config: dict, sink_port: int):
+    rnd = random.Random(1)
+    peers = []
+    for i in range(config["peers"]):
+        addr = (f"127.{1 + i // 65536 % 254}.{i // 256 % 256}.{i % 256}", sink_port)
+        paths = [random_path(rnd, config["wildcards"]) for _ in range(config["paths"])]
+        peers.append(PeerInfo(addr, [f"n{i}", f"g{i % config['groups']}"], paths, PeerType.node))
+    return peers
+
+
+def probe_dgrams():
+    rnd = random.Random(2)
+    paths = [f"/g0/instr{rnd.randrange(100)}/param{rnd.randrange(10)}" for _ in range(NUM_PROBE_PATHS)]
+    return paths, [proto.osc_dgram(p, [1, 0.5, "abc"]) for p in paths]
+
+
+def make_node(config: dict, port: int, route_cache_size: int):
+    return Node({"name": "bench", "zeroconf": False, "ip": "127.0.0.1", "port": port,
+                 "route_cache_size": route_cache_size})
+
+
+def rate(fn, args, min_time=0.2):
+    """ Calls fn for each element of args until min_time passed, returns calls per second """
+    count = 0
+    start = time.perf_counter()
+    while True:
+        for a in args:
+            fn(a)
+        count += len(args)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return count / elapsed
+
+
+class CountingTransport:
+    def __init__(self) -> None:
+        self.count = 0
+
+    def sendto(self, data, addr=None):
+        self.count += 1
+
+
+def measure_inprocess(config: dict, route_cache_size: int):
+    node = make_node(config, 3760, route_cache_size)
+    peers = make_peers(config, 9)
+    for pi in peers:
+        node._registry.add_peer(pi)
+    paths, dgrams = probe_dgrams()
+    registry = node._registry
+    local_groups = registry.get_local_groups()
+
+    result = {
+        "get_by_path_ops": rate(lambda p: registry.get_by_path(p, PeerType.node), paths),
+        "subscribes_ops": rate(lambda p: [pi for pi in peers if pi.subscribes(p, local_groups)],
+                               paths[:16], min_time=0.1),
+    }
+
+    # Allocations while handling messages (including parsing), without socket calls
+    node._transport = CountingTransport()
+    client = ("127.0.0.1", 1)
+    messages = [OscMessage(d) for d in dgrams]
+    for m in messages:  # warm up caches
+        node.on_osc_sync(client, m)
+    node._transport.count = 0
+    tracemalloc.start()
+    total = 0
+    for d in dgrams:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        node.on_osc_sync(client, OscMessage(d))
+        total += tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    result["alloc_bytes_per_msg"] = total / len(dgrams)
+    result["fanout"] = node._transport.count / len(dgrams)
+    return result
+
+
+async def start_node(config: dict, route_cache_size: int):
+    port = free_port()
+    node = make_node(config, port, route_cache_size)
+    node._loop = asyncio.get_running_loop()
+    node._transport, node._protocol = await node._create_endpoint(("127.0.0.1", port))
+    return node, ("127.0.0.1", port)
+
+
+async def measure_loopback(config: dict, route_cache_size: int, n: int, n_latency: int):
+    loop = asyncio.get_running_loop()
+    node, node_addr = await start_node(config, route_cache_size)
+    sink = udp_socket("0.0.0.0")
+    sender, receiver = udp_socket(), udp_socket()
+    for pi in make_peers(config, sink.getsockname()[1]):
+        node._registry.add_peer(pi)
+    node._registry.add_peer(PeerInfo(receiver.getsockname(), ["receiver", "g0"], ["/instr*"], PeerType.node))
+    _, dgrams = probe_dgrams()
+
+    async def receive():
+        try:
+            await asyncio.wait_for(loop.sock_recv(receiver, 1024), 1)
+            return True
+        except asyncio.TimeoutError:
+            return False  # lost datagram
+
+    # Throughput: bursts of 100 messages
+    received = 0
+    start = time.perf_counter()
+    for i in range(0, n, 100):
+        for j in range(i, i + 100):
+            sender.sendto(dgrams[j % len(dgrams)], node_addr)
+        while received < i + 100 and await receive():
+            received += 1
+    elapsed = time.perf_counter() - start
+
+    # Latency: one message at a time
+    latencies = []
+    for i in range(n_latency):
+        start = time.perf_counter()
+        sender.sendto(dgrams[i % len(dgrams)], node_addr)
+        if await receive():
+            latencies.append((time.perf_counter() - start) * 1e6)
+
+    node._transport.close()
+    for s in [sink, sender, receiver]:
+        s.close()
+    q = statistics.quantiles(latencies, n=100)
+    return {
+        "msgs_per_s": received / elapsed,
+        "delivered": received / n,
+        "latency_p50_us": q[49],
+        "latency_p99_us": q[98],
+    }
+
+
+def configurations(full: bool):
+    if full:
+        keys = list(SWEEP)
+        return [dict(zip(keys, values)) for values in itertools.product(*SWEEP.values())]
+    configs = [dict(BASE)]
+    for key, values in SWEEP.items():
+        for v in values:
+            c = dict(BASE, **{key: v})
+            if c not in configs:
+                configs.append(c)
+    return configs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Routing benchmark")
+    parser.add_argument("-n", dest="n", type=int, default=5000, help="Number of messages for throughput")
+    parser.add_argument("-l", dest="n_latency", type=int, default=1000, help="Number of messages for latency")
+    parser.add_argument("--route-cache", dest="route_cache", type=int, default=0,
+                        help="Route cache size of the node (default 0 measures the subscription index)")
+    parser.add_argument("--full", action="store_true", help="Measure all combinations of parameters")
+    parser.add_argument("-o", dest="output", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'peers':>6} {'paths':>5} {'wildc':>5} {'groups':>6} {'fanout':>6} {'lookup/s':>9} {'scan/s':>8} "
+          f"{'alloc B':>8} {'msgs/s':>8} {'p50 us':>7} {'p99 us':>7}")
+    for config in configurations(args.full):
+        r = dict(config)
+        r.update(measure_inprocess(config, args.route_cache))
+        r.update(asyncio.run(measure_loopback(config, args.route_cache, args.n, args.n_latency)))
+        results.append(r)
+        print(f"{r['peers']:6} {r['paths']:5} {r['wildcards']:5.2f} {r['groups']:6} {r['fanout']:6.1f} "
+              f"{r['get_by_path_ops']:9.0f} {r['subscribes_ops']:8.0f} {r['alloc_bytes_per_msg']:8.0f} "
+              f"{r['msgs_per_s']:8.0f} {r['latency_p50_us']:7.1f} {r['latency_p99_us']:7.1f}")
+
+    if args.output is not None:
+        meta = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "args": vars(args),
+        }
+        with open(args.output, "w") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
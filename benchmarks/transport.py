@@ -0,0 +1,63 @@
+"""
+Compares the asyncio UDP transport with the batched recvmmsg/sendmmsg transport
+(p2psc.batchTransport) for a fan-out of each message to many peers over loopback.
+
+Run from the repository root:
+
+    python -m benchmarks.transport [-n MESSAGES] [-p PEERS]
+"""
+import argparse
+import asyncio
+import socket
+import time
+
+from p2psc import batchTransport
+
+
+async def fanout(create, n, peers):
+    loop = asyncio.get_running_loop()
+    transport, _ = await create(loop)
+
+    socks = []
+    for _ in range(peers):
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 22)
+        s.bind(("127.0.0.1", 0))
+        socks.append(s)
+    addrs = [s.getsockname() for s in socks]
+
+    dgram = b"/test\x00\x00\x00,i\x00\x00\x00\x00\x00\x01"
+    start = time.perf_counter()
+    for _ in range(n):
+        for a in addrs:
+            transport.sendto(dgram, a)
+        # one "packet" per loop iteration, as for incoming datagrams
+        await asyncio.sleep(0)
+    elapsed = time.perf_counter() - start
+
+    transport.close()
+    for s in socks:
+        s.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="UDP transport fan-out benchmark")
+    parser.add_argument("-n", dest="n", type=int, default=2000, help="Number of messages")
+    parser.add_argument("-p", dest="peers", type=int, default=60, help="Number of peers per message")
+    args = parser.parse_args()
+
+    def default(loop):
+        return loop.create_datagram_endpoint(asyncio.DatagramProtocol, local_addr=("127.0.0.1", 0))
+
+    def batch(loop):
+        return batchTransport.create_batch_datagram_endpoint(loop, asyncio.DatagramProtocol, ("127.0.0.1", 0))
+
+    print(f"{args.n} messages, fan-out to {args.peers} peers (recvmmsg/sendmmsg: {batchTransport.is_supported()})")
+    for name, create in [("asyncio", default), ("batch", batch)]:
+        t = asyncio.run(fanout(create, args.n, args.peers))
+        print(f"{name:10} {t / args.n * 1e6:8.2f} us/message {args.n * args.peers / t:12.0f} datagrams/s")
+
+
+if __name__ == "__main__":
+    main()
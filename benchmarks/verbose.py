@@ -0,0 +1,89 @@
+"""
+Measures the cost of logging on the forwarding path: throughput of client
+messages forwarded by a node with the loglevel of -v (INFO) and -vv (DEBUG)
+compared to the default (WARNING), with the default log limits and with rate
+limiting disabled. Also measures a flood of invalid datagrams, each of which
+logs a warning.
+
+Records are formatted and written to os.devnull using the format of p2psc.
+
+Run from the repository root:
+
+    python -m benchmarks.verbose [-n PACKETS]
+"""
+import argparse
+import logging
+import os
+import time
+
+from p2psc import proto
+from p2psc.common.logging import DEFAULT_LOG_LIMITS, configure_log_limits
+from p2psc.node import Node
+from p2psc.peerInfo import PeerInfo, PeerType
+from p2psc.peerProtocol import OscProtocolUdp
+
+LEVELS = [("off", logging.WARNING), ("-v", logging.INFO), ("-vv", logging.DEBUG)]
+
+
+class NullTransport:
+    def sendto(self, data, addr=None):
+        pass
+
+
+def make_protocol():
+    node = Node({"name": "bench", "zeroconf": False, "ip": "127.0.0.1", "port": 3760})
+    node._transport = NullTransport()
+    for i in range(4):
+        node._registry.add_peer(PeerInfo(("127.0.0.1", 4000 + i), [f"n{i}"], ["/test"], PeerType.node))
+    return OscProtocolUdp(node, node.metrics)
+
+
+def setup_null_logging(level):
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    handler = logging.StreamHandler(open(os.devnull, "w"))
+    handler.setFormatter(logging.Formatter("[%(asctime)s] (%(levelname)s) %(message)s", "%H:%M:%S"))
+    root.addHandler(handler)
+    root.setLevel(level)
+    return handler
+
+
+def run(protocol, dgrams):
+    addr = ("127.0.0.1", 5000)
+    start = time.perf_counter()
+    for dgram in dgrams:
+        protocol.datagram_received(dgram, addr)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hot path logging benchmark")
+    parser.add_argument("-n", dest="n", type=int, default=100000, help="Number of datagrams")
+    args = parser.parse_args()
+
+    dgrams = [proto.osc_dgram("/ALL/test", [i, 0.5, "abc"]) for i in range(args.n)]
+    invalid = [b"invalid" + i.to_bytes(4, "big") for i in range(args.n)]
+    unlimited = {category: {"every": 1, "max_per_s": None} for category in DEFAULT_LOG_LIMITS}
+    defaults = {category: dict(l) for category, l in DEFAULT_LOG_LIMITS.items()}
+
+    results = []
+    for limits_name, limits in [("default limits", defaults), ("no limits", unlimited)]:
+        configure_log_limits(limits)
+        for level_name, level in LEVELS:
+            handler = setup_null_logging(level)
+            t = run(make_protocol(), dgrams)
+            results.append((f"forward {level_name}, {limits_name}", t))
+            handler.stream.close()
+        handler = setup_null_logging(logging.WARNING)
+        results.append((f"invalid datagrams, {limits_name}", run(make_protocol(), invalid)))
+        handler.stream.close()
+    configure_log_limits(defaults)
+
+    print(f"{args.n} datagrams")
+    for name, t in results:
+        print(f"{name:36} {t / args.n * 1e6:8.2f} us/packet {args.n / t:12.0f} packets/s")
+
+
+if __name__ == "__main__":
+    main()
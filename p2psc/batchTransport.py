@@ -0,0 +1,363 @@
+import asyncio
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import socket
+import sys
+from typing import Callable, Dict, List, Tuple
+
+MAX_DGRAM_SIZE = 65507
+DEFAULT_BATCH_SIZE = 32
+# Maximum number of datagrams per sendmmsg call (UIO_MAXIOV is 1024)
+MAX_SEND_BATCH = 256
+# Maximum number of cached destination addresses
+MAX_SOCKADDRS = 4096
+# Default high watermark of the write buffer (as for asyncio transports), the low watermark is a quarter of it
+DEFAULT_HIGH_WATER = 64 * 1024
+
+_MSG_DONTWAIT = 0x40
+_RETRY_ERRNOS = (errno.EAGAIN, errno.EWOULDBLOCK)
+
+
+class _iovec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+
+class _sockaddr_in(ctypes.Structure):
+    _fields_ = [("sin_family", ctypes.c_ushort), ("sin_port", ctypes.c_uint8 * 2),
+                ("sin_addr", ctypes.c_uint8 * 4), ("sin_zero", ctypes.c_uint8 * 8)]
+
+
+class _msghdr(ctypes.Structure):
+    _fields_ = [("msg_name", ctypes.c_void_p), ("msg_namelen", ctypes.c_uint32),
+                ("msg_iov", ctypes.POINTER(_iovec)), ("msg_iovlen", ctypes.c_size_t),
+                ("msg_control", ctypes.c_void_p), ("msg_controllen", ctypes.c_size_t),
+                ("msg_flags", ctypes.c_int)]
+
+
+class _mmsghdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _msghdr), ("msg_len", ctypes.c_uint)]
+
+
+_word = ctypes.c_size_t
+_MMSGHDR_WORDS = ctypes.sizeof(_mmsghdr) // ctypes.sizeof(_word)
+_MSG_NAME_WORD = _msghdr.msg_name.offset // ctypes.sizeof(_word)
+
+
+def _load_libc():
+    """ Returns libc with recvmmsg/sendmmsg (Linux only) or None if they are not available """
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_mmsghdr), ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+        libc.sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_mmsghdr), ctypes.c_uint, ctypes.c_int]
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+_libc = _load_libc()
+
+
+def is_supported():
+    """ Returns true if recvmmsg/sendmmsg can be used on this platform """
+    return _libc is not None
+
+
+def _sockaddr(addr: Tuple[str, int]) -> _sockaddr_in:
+    sa = _sockaddr_in()
+    sa.sin_family = socket.AF_INET
+    sa.sin_port[:] = addr[1].to_bytes(2, "big")
+    sa.sin_addr[:] = socket.inet_aton(addr[0])  # raises OSError for hostnames
+    return sa
+
+
+class BatchDatagramTransport(asyncio.DatagramTransport):
+    """
+    UDP transport which receives up to batch_size datagrams with a single recvmmsg call and collects all
+    datagrams passed to sendto during one event loop iteration to send them with a single sendmmsg call.
+    Without recvmmsg/sendmmsg (see is_supported) the socket is still drained and flushed in batches,
+    but with one recvfrom/sendto call per datagram.
+    Up to read_batches batches are received each time the socket becomes readable.
+    The protocol's pause_writing is called if the datagrams waiting for the socket to become writable exceed
+    the high watermark, resume_writing once they are sent.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, sock: socket.socket, protocol: asyncio.DatagramProtocol,
+                 batch_size: int = DEFAULT_BATCH_SIZE, read_batches: int = 1) -> None:
+        super().__init__()
+        self._loop = loop
+        self._sock = sock
+        self._fd = sock.fileno()
+        self._protocol = protocol
+        self._batch_size = batch_size
+        self._read_batches = max(1, read_batches)
+        self._closing = False
+        self._queue = []  # type: List[Tuple[bytes, Tuple[str, int]]]
+        self._buffer_size = 0
+        self._flush_handle = None  # type: asyncio.Handle
+        self._writer_registered = False
+        self._high_water = DEFAULT_HIGH_WATER
+        self._low_water = DEFAULT_HIGH_WATER // 4
+        self._protocol_paused = False
+        self._sockaddrs = {}  # type: Dict[Tuple[str, int], int]
+        self._sockaddr_refs = []  # type: List[_sockaddr_in]
+
+        if _libc is not None:
+            self._init_mmsg()
+
+        self._loop.add_reader(self._fd, self._read_ready)
+        self._loop.call_soon(self._protocol.connection_made, self)
+
+    def _init_mmsg(self):
+        n = self._batch_size
+        # Receive buffers, iovecs, source addresses and headers are preallocated and reused
+        self._recv_bufs = [ctypes.create_string_buffer(MAX_DGRAM_SIZE) for _ in range(n)]
+        self._recv_iovs = (_iovec * n)()
+        self._recv_names = (_sockaddr_in * n)()
+        self._recv_msgs = (_mmsghdr * n)()
+        for i in range(n):
+            self._recv_iovs[i].iov_base = ctypes.addressof(self._recv_bufs[i])
+            self._recv_iovs[i].iov_len = MAX_DGRAM_SIZE
+            hdr = self._recv_msgs[i].msg_hdr
+            hdr.msg_iov = ctypes.pointer(self._recv_iovs[i])
+            hdr.msg_iovlen = 1
+            hdr.msg_name = ctypes.addressof(self._recv_names[i])
+
+        n = MAX_SEND_BATCH
+        self._send_iovs = (_iovec * n)()
+        self._send_msgs = (_mmsghdr * n)()
+        for i in range(n):
+            hdr = self._send_msgs[i].msg_hdr
+            hdr.msg_iov = ctypes.pointer(self._send_iovs[i])
+            hdr.msg_iovlen = 1
+            hdr.msg_namelen = ctypes.sizeof(_sockaddr_in)
+        # Setting struct fields through ctypes is slow, the send path writes to flat word views instead
+        self._send_iov_words = (_word * (2 * n)).from_buffer(self._send_iovs)
+        self._send_msg_words = (_word * (_MMSGHDR_WORDS * n)).from_buffer(self._send_msgs)
+
+    def get_extra_info(self, name, default=None):
+        if name == "socket":
+            return self._sock
+        if name == "sockname":
+            return self._sock.getsockname()
+        return default
+
+    def is_closing(self):
+        return self._closing
+
+    def get_write_buffer_size(self):
+        return self._buffer_size
+
+    def set_write_buffer_limits(self, high=None, low=None):
+        if high is None:
+            high = DEFAULT_HIGH_WATER if low is None else 4 * low
+        if low is None:
+            low = high // 4
+        if not high >= low >= 0:
+            raise ValueError(f"high ({high}) must be >= low ({low}) must be >= 0")
+        self._high_water = high
+        self._low_water = low
+        self._maybe_pause_protocol()
+
+    def get_write_buffer_limits(self):
+        return (self._low_water, self._high_water)
+
+    def _maybe_pause_protocol(self):
+        # Only count datagrams waiting for the socket, the queue of the current loop iteration is flushed anyway
+        if self._writer_registered and not self._protocol_paused and self._buffer_size > self._high_water:
+            self._protocol_paused = True
+            self._protocol.pause_writing()
+
+    def _maybe_resume_protocol(self):
+        if self._protocol_paused and self._buffer_size <= self._low_water:
+            self._protocol_paused = False
+            self._protocol.resume_writing()
+
+    def sendto(self, data, addr=None):
+        if self._closing:
+            return
+        if type(data) != bytes:
+            data = bytes(data)
+        self._queue.append((data, addr))
+        self._buffer_size += len(data)
+        if self._writer_registered:
+            self._maybe_pause_protocol()
+        elif self._flush_handle is None:
+            self._flush_handle = self._loop.call_soon(self._flush)
+
+    def close(self):
+        if self._closing:
+            return
+        self._closing = True
+        self._loop.remove_reader(self._fd)
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._writer_registered:
+            self._loop.remove_writer(self._fd)
+            self._writer_registered = False
+        # Try to send what's left, no retry
+        self._flush()
+        self._loop.call_soon(self._call_connection_lost)
+
+    def abort(self):
+        self._queue.clear()
+        self._buffer_size = 0
+        self.close()
+
+    def _call_connection_lost(self):
+        try:
+            self._protocol.connection_lost(None)
+        finally:
+            self._sock.close()
+
+    def _read_ready(self):
+        if _libc is not None:
+            self._recv_mmsg()
+            return
+
+        for _ in range(self._batch_size * self._read_batches):
+            try:
+                data, addr = self._sock.recvfrom(MAX_DGRAM_SIZE)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                self._protocol.error_received(e)
+                return
+            self._protocol.datagram_received(data, addr)
+
+    def _recv_mmsg(self):
+        msgs = self._recv_msgs
+        names = self._recv_names
+        for _ in range(self._read_batches):
+            for i in range(self._batch_size):
+                msgs[i].msg_hdr.msg_namelen = ctypes.sizeof(_sockaddr_in)
+            n = _libc.recvmmsg(self._fd, msgs, self._batch_size, _MSG_DONTWAIT, None)
+            if n < 0:
+                err = ctypes.get_errno()
+                if err not in _RETRY_ERRNOS and err != errno.EINTR:
+                    self._protocol.error_received(OSError(err, os.strerror(err)))
+                return
+
+            for i in range(n):
+                data = ctypes.string_at(self._recv_bufs[i], msgs[i].msg_len)
+                name = names[i]
+                addr = (socket.inet_ntoa(bytes(name.sin_addr)), int.from_bytes(bytes(name.sin_port), "big"))
+                self._protocol.datagram_received(data, addr)
+            if n < self._batch_size or self._closing:  # socket is drained or closed
+                return
+
+    def _on_writable(self):
+        self._loop.remove_writer(self._fd)
+        self._writer_registered = False
+        self._flush()
+
+    def _wait_writable(self):
+        if not self._closing:
+            self._loop.add_writer(self._fd, self._on_writable)
+            self._writer_registered = True
+            self._maybe_pause_protocol()
+
+    def _flush(self):
+        """ Sends all queued datagrams """
+        self._flush_handle = None
+        queue = self._queue
+        while len(queue) > 0:
+            if _libc is not None:
+                sent = self._send_mmsg(queue)
+            else:
+                sent = self._send_single(queue)
+            if sent is None:  # socket buffer is full
+                self._wait_writable()
+                return
+            for data, _ in queue[:sent]:
+                self._buffer_size -= len(data)
+            del queue[:sent]
+        self._maybe_resume_protocol()
+
+    def _send_single(self, queue):
+        data, addr = queue[0]
+        try:
+            self._sock.sendto(data, addr)
+        except (BlockingIOError, InterruptedError):
+            return None
+        except OSError as e:
+            self._protocol.error_received(e)
+        return 1
+
+    def _send_mmsg(self, queue):
+        n = min(len(queue), MAX_SEND_BATCH)
+        # Evict before the batch is built, headers of the batch point to the cached addresses until sendmmsg returns
+        if len(self._sockaddrs) + n > MAX_SOCKADDRS:
+            self._sockaddrs.clear()
+            self._sockaddr_refs.clear()
+        iov_words = self._send_iov_words
+        msg_words = self._send_msg_words
+        sockaddrs = self._sockaddrs
+        last_data = None
+        data_ptr = 0
+        for i in range(n):
+            data, addr = queue[i]
+            sa_ptr = sockaddrs.get(addr)
+            if sa_ptr is None:
+                try:
+                    sa_ptr = self._add_sockaddr(addr)
+                except (OSError, TypeError, ValueError):
+                    # Not an IPv4 address, let the socket resolve it
+                    if i == 0:
+                        return self._send_single(queue)
+                    n = i
+                    break
+            # Fan-out sends the same datagram to many peers
+            if data is not last_data:
+                # queue keeps a reference to data until it is sent
+                data_ptr = ctypes.cast(data, ctypes.c_void_p).value
+                last_data = data
+            iov_words[2 * i] = data_ptr
+            iov_words[2 * i + 1] = len(data)
+            msg_words[_MMSGHDR_WORDS * i + _MSG_NAME_WORD] = sa_ptr
+
+        sent = _libc.sendmmsg(self._fd, self._send_msgs, n, 0)
+        if sent >= 0:
+            return sent
+        err = ctypes.get_errno()
+        if err in _RETRY_ERRNOS:
+            return None
+        if err == errno.EINTR:
+            return 0
+        # The first datagram failed, drop it
+        self._protocol.error_received(OSError(err, os.strerror(err)))
+        return 1
+
+    def _add_sockaddr(self, addr):
+        """ Converts addr to a sockaddr_in and returns its address """
+        sa = _sockaddr(addr)
+        self._sockaddr_refs.append(sa)
+        self._sockaddrs[addr] = ctypes.addressof(sa)
+        return self._sockaddrs[addr]
+
+
+async def create_batch_datagram_endpoint(loop: asyncio.AbstractEventLoop,
+                                         protocol_factory: Callable[[], asyncio.DatagramProtocol],
+                                         local_addr: Tuple[str, int], batch_size: int = DEFAULT_BATCH_SIZE,
+                                         reuse_port: bool = False, read_batches: int = 1):
+    """
+    Creates a BatchDatagramTransport bound to local_addr, analogous to loop.create_datagram_endpoint
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.setblocking(False)
+        if reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(local_addr)
+    except OSError:
+        sock.close()
+        raise
+    protocol = protocol_factory()
+    transport = BatchDatagramTransport(loop, sock, protocol, batch_size, read_batches)
+    logging.debug(f"Created batch UDP transport on {local_addr} (recvmmsg/sendmmsg: {is_supported()})")
+    return transport, protocol
@@ -0,0 +1,97 @@
+import time
+import zlib
+from typing import Dict, List, Tuple
+
+from p2psc import proto
+
+# Flags of chunked transfers
+FLAG_ZLIB = 1
+
+# Size of a chunk message without data (address, type tags, 4 ints, blob size)
+CHUNK_OVERHEAD = len(proto.osc_string(proto.PEERINFO_CHUNK)) + len(proto.osc_string(",iiiib")) + 5 * 4
+
+
+def split_dgram(dgram: bytes, max_size: int, transfer_id: int, compress: bool = False) -> List[bytes]:
+    """
+    Returns chunk messages (proto.PEERINFO_CHUNK) for the given datagram, each at most max_size bytes
+    (including padding). The datagram is zlib-compressed if compress is set.
+    """
+    flags = 0
+    if compress:
+        dgram = zlib.compress(dgram)
+        flags |= FLAG_ZLIB
+    chunk_size = (max_size - CHUNK_OVERHEAD) // 4 * 4
+    if chunk_size <= 0:
+        raise ValueError(f"Datagram size limit too small: {max_size}")
+    count = max(1, -(-len(dgram) // chunk_size))
+    return [proto.osc_dgram(proto.PEERINFO_CHUNK, [transfer_id, i, count, flags, dgram[i * chunk_size:(i + 1) * chunk_size]])
+            for i in range(count)]
+
+
+class ChunkAssembler:
+    """
+    Reassembles datagrams from chunk messages. Only the latest transfer of each peer is kept, incomplete
+    transfers older than timeout seconds are dropped when a new transfer starts. Transfers whose data or
+    reassembled (decompressed) datagram exceed max_size bytes are rejected, and at most max_transfers
+    transfers are kept (the oldest one is dropped).
+    """
+    MAX_CHUNKS = 1024
+    MAX_TRANSFERS = 64
+
+    def __init__(self, timeout: float = 5, max_size: int = MAX_CHUNKS * 1400,
+                 max_transfers: int = MAX_TRANSFERS) -> None:
+        self._timeout = timeout
+        self._max_size = max_size
+        self._max_transfers = max_transfers
+        # addr -> [transfer id, start time, chunks, size of the received data]
+        self._transfers = {}  # type: Dict[Tuple, list]
+
+    def __len__(self):
+        return len(self._transfers)
+
+    def add(self, addr, args) -> bytes:
+        """
+        Adds a chunk (arguments of a chunk message), returns the reassembled datagram once all chunks
+        of the transfer were received, None otherwise. Raises ValueError for invalid transfers.
+        """
+        transfer_id, index, count, flags, data = args
+        if count > ChunkAssembler.MAX_CHUNKS:
+            raise ValueError(f"Too many chunks: {count}")
+
+        transfer = self._transfers.get(addr)
+        if transfer is None or transfer[0] != transfer_id or len(transfer[2]) != count:
+            now = time.time()
+            self._expire(now)
+            self._transfers.pop(addr, None)
+            if len(self._transfers) >= self._max_transfers:
+                del self._transfers[next(iter(self._transfers))]
+            transfer = self._transfers[addr] = [transfer_id, now, [None] * count, 0]
+        chunks = transfer[2]
+        if chunks[index] is not None:
+            transfer[3] -= len(chunks[index])
+        chunks[index] = data
+        transfer[3] += len(data)
+        if transfer[3] > self._max_size:
+            del self._transfers[addr]
+            raise ValueError(f"Transfer exceeds {self._max_size} bytes")
+
+        if any(c is None for c in chunks):
+            return None
+        del self._transfers[addr]
+        dgram = b"".join(chunks)
+        if flags & FLAG_ZLIB:
+            decompressor = zlib.decompressobj()
+            try:
+                dgram = decompressor.decompress(dgram, self._max_size)
+            except zlib.error as e:
+                raise ValueError(str(e))
+            if decompressor.unconsumed_tail:
+                raise ValueError(f"Decompressed transfer exceeds {self._max_size} bytes")
+            if not decompressor.eof:
+                raise ValueError("Incomplete compressed data")
+        return dgram
+
+    def _expire(self, now: float):
+        for addr, transfer in list(self._transfers.items()):
+            if now - transfer[1] > self._timeout:
+                del self._transfers[addr]
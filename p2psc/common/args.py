@@ -3,6 +3,7 @@ import argparse
 import random
 import string
 from p2psc import __version__
+from p2psc.common.eventloop import EVENT_LOOPS
 
 def parse_args(args):
     """Parse command line parameters
@@ -43,6 +44,26 @@ def parse_args(args):
         help="Set node name",
         default=None,
     )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        dest="workers",
+        help="Set number of routing worker processes",
+        default=None,
+    )
+    parser.add_argument(
+        "--loop",
+        dest="loop",
+        help="Set event loop implementation",
+        choices=EVENT_LOOPS,
+        default=None,
+    )
+    parser.add_argument(
+        "--profile",
+        dest="profile",
+        help="Profile the node and write the cProfile stats to this file on exit",
+        default=None,
+    )
     parser.add_argument(
         "--version",
         action="version",
@@ -21,6 +21,12 @@ class Config():
             "zeroconf": True,
             "ip": None,
             "port": 3760,
+            "route_cache_size": 1024,
+            "udp_transport": "asyncio",
+            "workers": 0,
+            "event_loop": "asyncio",
+            "max_datagram_size": 1400,
+            "peerinfo_compression": True,
         }
     
     def __loadConfig(self, path):
@@ -40,8 +46,11 @@ class Config():
         self.__configDict[key] = value
 
 
-    def get(self):
-        return self.__configDict
+    def get(self, key=None, default=None):
+        """ Returns the value for key (or default if it is not set). Returns the whole config if no key is given """
+        if key is None:
+            return self.__configDict
+        return self.__configDict.get(key, default)
 
     def save(self, path):
         js = json.dumps(self.__configDict, indent=2)
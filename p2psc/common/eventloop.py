@@ -0,0 +1,27 @@
+import asyncio
+import logging
+
+EVENT_LOOPS = ["asyncio", "uvloop"]
+
+
+def setup_event_loop(name: str):
+    """Set the event loop policy used for new event loops
+
+    Args:
+      name (str): one of EVENT_LOOPS. Falls back to "asyncio" if uvloop is not installed
+
+    Returns:
+      str: name of the event loop which is actually used
+    """
+    if name == "uvloop":
+        try:
+            import uvloop
+        except ImportError:
+            logging.warning("uvloop is not installed, using default asyncio event loop")
+        else:
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+            return "uvloop"
+    elif name != "asyncio":
+        logging.warning(f"Unknown event loop '{name}', using default asyncio event loop")
+    asyncio.set_event_loop_policy(None)
+    return "asyncio"
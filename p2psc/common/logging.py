@@ -1,8 +1,20 @@
 import logging
 import sys
+import time
+from typing import Dict
 
 _logger = logging.getLogger(__name__)
 
+# Default limits of log categories on hot paths: level, log every n-th record, maximum records per second
+DEFAULT_LOG_LIMITS = {
+    "forward": {"level": logging.INFO, "every": 1, "max_per_s": 20},
+    "peers": {"level": logging.INFO, "every": 1, "max_per_s": 50},
+    "peerinfo": {"level": logging.DEBUG, "every": 1, "max_per_s": 10},
+    "invalid": {"level": logging.WARNING, "every": 1, "max_per_s": 10},
+    "handler_error": {"level": logging.ERROR, "every": 1, "max_per_s": 10},
+}
+
+
 def setup_logging(loglevel):
     """Setup basic logging
 
@@ -13,3 +25,87 @@ def setup_logging(loglevel):
     logging.basicConfig(
         level=loglevel, stream=sys.stdout, format=logformat, datefmt="%H:%M:%S"
     )
+
+
+class SampledLog:
+    """
+    Log of one category on a hot path. Only every n-th record is emitted and at most max_per_s records per second,
+    the number of suppressed records is appended to the next emitted one.
+    Messages are formatted lazily (%-style), arguments which are expensive to compute should only be built
+    after enabled() returned true.
+    """
+
+    def __init__(self, category: str, level: int, every: int = 1, max_per_s: float = None) -> None:
+        self.category = category
+        self.level = level
+        self.configure(every, max_per_s)
+
+    def configure(self, every: int = 1, max_per_s: float = None):
+        self.every = max(1, every)
+        self.max_per_s = max_per_s
+        self.suppressed = 0
+        self._countdown = 1
+        self._window_t = 0.0
+        self._window_count = 0
+
+    def enabled(self) -> bool:
+        """
+        Returns true if the next record should be emitted, otherwise counts it as suppressed
+        """
+        if not logging.root.isEnabledFor(self.level):
+            return False
+        self._countdown -= 1
+        if self._countdown > 0:
+            self.suppressed += 1
+            return False
+        self._countdown = self.every
+        if self.max_per_s is not None:
+            now = time.monotonic()
+            if now - self._window_t >= 1:
+                self._window_t = now
+                self._window_count = 0
+            if self._window_count >= self.max_per_s:
+                self.suppressed += 1
+                return False
+            self._window_count += 1
+        return True
+
+    def log(self, msg: str, *args, exc_info=False):
+        """
+        Emits a record, without checking enabled()
+        """
+        if self.suppressed > 0:
+            msg += " (%d similar messages suppressed)"
+            args = args + (self.suppressed,)
+            self.suppressed = 0
+        logging.log(self.level, msg, *args, exc_info=exc_info)
+
+    def __call__(self, msg: str, *args, exc_info=False):
+        if self.enabled():
+            self.log(msg, *args, exc_info=exc_info)
+
+
+_sampled_logs = {}  # type: Dict[str, SampledLog]
+
+
+def get_sampled_log(category: str) -> SampledLog:
+    """
+    Returns the log of a category in DEFAULT_LOG_LIMITS
+    """
+    log = _sampled_logs.get(category)
+    if log is None:
+        limits = DEFAULT_LOG_LIMITS[category]
+        log = _sampled_logs[category] = SampledLog(category, limits["level"], limits["every"], limits["max_per_s"])
+    return log
+
+
+def configure_log_limits(limits: Dict[str, dict]):
+    """
+    Sets the limits ({"every": n, "max_per_s": x}) of log categories, a max_per_s of null disables rate limiting
+    """
+    for category, l in limits.items():
+        if category not in DEFAULT_LOG_LIMITS:
+            _logger.warning(f"Unknown log category: {category}")
+            continue
+        defaults = DEFAULT_LOG_LIMITS[category]
+        get_sampled_log(category).configure(l.get("every", defaults["every"]), l.get("max_per_s", defaults["max_per_s"]))
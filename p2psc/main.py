@@ -27,7 +27,8 @@ import sys
 
 from p2psc.common.args import parse_args
 from p2psc.common.config import Config
-from p2psc.common.logging import setup_logging
+from p2psc.common.eventloop import setup_event_loop
+from p2psc.common.logging import configure_log_limits, setup_logging
 from p2psc.node import Node
 
 __author__ = "Benedikt Wieder"
@@ -69,12 +70,18 @@ def main(args):
     args = parse_args(args)
     setup_logging(args.loglevel)
     signal.signal(signal.SIGINT, signal_handler)
-    asyncio.get_event_loop().run_until_complete(main_loop(args))
+    config = Config(args.config)
+    configure_log_limits(config.get("log_limits", {}))
+
+    if args.loop is not None:
+        config["event_loop"] = args.loop
+    config["event_loop"] = setup_event_loop(config.get("event_loop", "asyncio"))
+
+    asyncio.run(main_loop(args, config))
 
 
-async def main_loop(args):
+async def main_loop(args, config: Config):
     global node
-    config = Config(args.config)
 
     if args.name is not None:
         config["name"] = args.name
@@ -85,6 +92,13 @@ async def main_loop(args):
     if args.port is not None:
         config["port"] = int(args.port)
 
+    if args.workers is not None:
+        config["workers"] = int(args.workers)
+
+    if args.profile is not None:
+        config["profile_file"] = args.profile
+        config["profile"] = True
+
     if config["ip"] is None:
         for _ in range(MAX_IP_GET_ATTEMPTS):
             logging.info("Trying to find this hosts primary IP address.. ")
@@ -99,6 +113,7 @@ async def main_loop(args):
         exit(1)
 
     logging.info(f"Using IP address: {config['ip']}")
+    logging.info(f"Using event loop: {config['event_loop']}")
 
     node = Node(config)
 
@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import os
+from bisect import bisect_left
+from typing import Callable, Dict, List, Tuple
+
+# Upper bounds of histogram buckets
+FANOUT_BUCKETS = [0, 1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024]
+LATENCY_BUCKETS = [1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 1e-1]  # in seconds
+
+PREFIX = "p2psc_"
+
+
+class Histogram:
+    """
+    Histogram with fixed buckets, the last bucket counts all values above the largest bound
+    """
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: List[float]) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float):
+        """
+        Returns the upper bound of the bucket containing the given quantile (inf for the last bucket)
+        """
+        if self.count == 0:
+            return 0
+        rank = q * self.count
+        total = 0
+        for i, c in enumerate(self.counts):
+            total += c
+            if total >= rank and c > 0:
+                return self.bounds[i] if i < len(self.bounds) else float("inf")
+        return float("inf")
+
+
+class Metrics:
+    """
+    Counters and histograms of a node. Counters are plain attributes, which are incremented directly.
+    """
+    COUNTERS = ["packets_in", "bytes_in", "packets_out", "bytes_out", "parse_errors", "handler_errors",
+                "dropped_bundles", "unrouted_messages", "peerinfo_bytes_in", "peerinfo_bytes_out",
+                "rate_limited_messages", "backpressure_drops", "queue_drops"]
+
+    def __init__(self) -> None:
+        self.packets_in = 0
+        self.bytes_in = 0
+        self.packets_out = 0
+        self.bytes_out = 0
+        self.parse_errors = 0
+        self.handler_errors = 0
+        # Bundles and messages which were not forwarded to any peer
+        self.dropped_bundles = 0
+        self.unrouted_messages = 0
+        self.peerinfo_bytes_in = 0
+        self.peerinfo_bytes_out = 0
+        # Messages from clients dropped by rate limits and datagrams not sent while the transport was paused
+        self.rate_limited_messages = 0
+        self.backpressure_drops = 0
+        # Received data messages dropped because too many were waiting to be handled
+        self.queue_drops = 0
+        self.forwards = {}  # type: Dict[Tuple[str, int], int]
+        # Number of destinations of forwarded messages and time to handle a received datagram
+        self.fanout = Histogram(FANOUT_BUCKETS)
+        self.handler_latency = Histogram(LATENCY_BUCKETS)
+        # Time received datagrams wait in the queue before they are handled (with control priority)
+        self.queue_wait = Histogram(LATENCY_BUCKETS)
+        # Time spent in each handler, only recorded while profiling (handler name -> histogram)
+        self.handler_times = {}  # type: Dict[str, Histogram]
+
+    def observe_handler(self, name: str, seconds: float):
+        h = self.handler_times.get(name)
+        if h is None:
+            h = self.handler_times[name] = Histogram(LATENCY_BUCKETS)
+        h.observe(seconds)
+
+    def prune_forwards(self, peers):
+        """
+        Removes the forward counters of peers which are not in peers
+        """
+        for addr in [a for a in self.forwards if a not in peers]:
+            del self.forwards[addr]
+
+    def values(self, gauges: Dict[str, float] = None) -> List[Tuple[str, float]]:
+        """
+        Returns all counters, the given gauges and a summary of each histogram as (name, value) pairs
+        """
+        values = [(name, getattr(self, name)) for name in Metrics.COUNTERS]
+        values.extend((gauges or {}).items())
+        for name, h in [("fanout", self.fanout), ("handler_latency", self.handler_latency),
+                        ("queue_wait", self.queue_wait)]:
+            values.extend([(f"{name}_count", h.count), (f"{name}_sum", h.sum),
+                           (f"{name}_p50", h.quantile(0.5)), (f"{name}_p99", h.quantile(0.99))])
+        for name, h in self.handler_times.items():
+            values.extend([(f"handler_time_{name}_count", h.count), (f"handler_time_{name}_sum", h.sum),
+                           (f"handler_time_{name}_p99", h.quantile(0.99))])
+        return values
+
+    def to_text(self, gauges: Dict[str, float] = None) -> str:
+        """
+        Returns all metrics in the Prometheus text format
+        """
+        lines = []
+        for name in Metrics.COUNTERS:
+            lines.append(f"# TYPE {PREFIX}{name}_total counter")
+            lines.append(f"{PREFIX}{name}_total {getattr(self, name)}")
+        for name, value in (gauges or {}).items():
+            lines.append(f"# TYPE {PREFIX}{name} gauge")
+            lines.append(f"{PREFIX}{name} {value}")
+
+        lines.append(f"# TYPE {PREFIX}forwards_total counter")
+        for addr, count in self.forwards.items():
+            lines.append(f'{PREFIX}forwards_total{{peer="{addr[0]}:{addr[1]}"}} {count}')
+
+        for name, h in [("fanout", self.fanout), ("handler_latency_seconds", self.handler_latency),
+                        ("queue_wait_seconds", self.queue_wait)]:
+            lines.append(f"# TYPE {PREFIX}{name} histogram")
+            _histogram_lines(lines, PREFIX + name, "", h)
+        if len(self.handler_times) > 0:
+            lines.append(f"# TYPE {PREFIX}handler_seconds histogram")
+        for handler, h in self.handler_times.items():
+            _histogram_lines(lines, PREFIX + "handler_seconds", f'handler="{handler}",', h)
+        return "\n".join(lines) + "\n"
+
+
+def _histogram_lines(lines: List[str], name: str, labels: str, h: Histogram):
+    total = 0
+    for bound, count in zip(h.bounds + ["+Inf"], h.counts):
+        total += count
+        lines.append(f'{name}_bucket{{{labels}le="{bound}"}} {total}')
+    labels = f"{{{labels[:-1]}}}" if labels else ""
+    lines.append(f"{name}_sum{labels} {h.sum}")
+    lines.append(f"{name}_count{labels} {h.count}")
+
+
+def write_text(path: str, text: str):
+    """
+    Replaces the file at path with text, readers never see a partially written file
+    """
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+async def serve_http(get_text: Callable[[], str], host: str, port: int) -> asyncio.AbstractServer:
+    """
+    Serves the text returned by get_text to every HTTP request
+    """
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            # Read the request line and headers, the request itself doesn't matter
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            body = get_text().encode()
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                         + f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            logging.debug(f"Metrics request failed: {e}")
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    logging.info(f"Serving metrics on http://{host}:{port}/")
+    return server
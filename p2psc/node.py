@@ -1,29 +1,99 @@
 import asyncio
 import logging
-from typing import Tuple, Union
+import signal
+import socket
+import time
+from typing import Dict, List, Tuple, Union
 
 import zeroconf
 from p2psc.common.config import Config
-from p2psc.peerProtocol import OscHandler, OscProtocolUdp
+from p2psc.common.logging import get_sampled_log
+from p2psc.peerProtocol import LazyOscMessage, OscHandler, OscProtocolUdp, PriorityOscProtocolUdp
 from p2psc.peerInfo import PeerInfo, PeerType
 from pythonosc.osc_message import OscMessage
 from pythonosc.osc_bundle import OscBundle
-from pythonosc.osc_bundle_builder import OscBundleBuilder, IMMEDIATELY
 
 from p2psc.peerRegistry import PeerRegistry
+from p2psc.routeCache import RouteCache
 from p2psc.zconf import NodeZconf
-from p2psc import proto
+from p2psc import batchTransport, proto, tracing
+from p2psc.chunks import ChunkAssembler, split_dgram
+from p2psc.metrics import Metrics, serve_http, write_text
+from p2psc.profiling import Profiler
+from p2psc.rateLimit import RateLimiter
+from p2psc.tracing import Tracer
+
+_log_forward = get_sampled_log("forward")
+_log_invalid = get_sampled_log("invalid")
+_log_peerinfo = get_sampled_log("peerinfo")
+
+
+def _format_params(message: Union[OscMessage, LazyOscMessage]):
+    """
+    Returns the arguments of a message for logging, forwarded messages may have invalid arguments
+    """
+    try:
+        return message.params
+    except Exception:
+        return f"<{message.size} bytes, invalid arguments>"
 
 
 class Node(OscHandler):
+    # Interval of regular tasks (cleanup and peerinfo updates) in seconds
+    DEFAULT_UPDATE_INTERVAL = 3
+    # Peerinfo messages to other nodes which exceed this size are split into chunks
+    DEFAULT_MAX_DGRAM_SIZE = 1400
+    # What to drop while the transport's write buffer is above its high watermark: "data" drops forwarded
+    # messages and bundles (control messages are still sent), "none" buffers everything
+    DROP_POLICIES = ("data", "none")
+    # With control_priority, up to this many batches of datagrams are read each time the socket becomes readable
+    PRIORITY_READ_BATCHES = 16
+
     def __init__(self, config: Config) -> None:
         self._registry = PeerRegistry(config["name"])
+        self._routes = RouteCache(self._registry, config.get("route_cache_size", RouteCache.DEFAULT_SIZE))
         self._addr = (config["ip"], config["port"])
         self._running = False
         self._transport = None  # type: asyncio.DatagramTransport
         self._protocol = None  # type: OscProtocolUdp
         self._loop_task = None
         self._config = config
+        self._update_interval = config.get("update_interval", Node.DEFAULT_UPDATE_INTERVAL)
+        self._num_workers = config.get("workers", 0)
+        if self._num_workers > 0 and not hasattr(socket, "SO_REUSEPORT"):
+            logging.warning("SO_REUSEPORT is not supported on this platform, routing workers are disabled")
+            self._num_workers = 0
+        self._workers = None  # type: WorkerPool
+        self.metrics = Metrics()
+        self._metrics_server = None  # type: asyncio.AbstractServer
+        self._profiler = Profiler(config.get("profile_file"))
+        self.tracer = None  # type: Tracer
+        if config.get("trace"):
+            self.tracer = Tracer(config.get("trace_size", tracing.DEFAULT_SIZE),
+                                 config.get("trace_sample_every", tracing.DEFAULT_SAMPLE_EVERY))
+        self._limiter = None  # type: RateLimiter
+        if config.get("client_rate_limit") or config.get("group_rate_limits"):
+            self._limiter = RateLimiter(config.get("client_rate_limit"), config.get("group_rate_limits"))
+        self._writing_paused = False
+        drop_policy = config.get("send_drop_policy", "data")
+        if drop_policy not in Node.DROP_POLICIES:
+            logging.warning(f"Unknown send_drop_policy {drop_policy}, using data")
+            drop_policy = "data"
+        self._drop_data = drop_policy == "data"
+
+        # Versioned peerinfo of this node: state of the current version and deltas which are not sent yet
+        self._peerinfo_version = 0
+        self._peerinfo_groups = self._registry.get_local_groups()
+        self._peerinfo_paths = set()
+        self._peerinfo_deltas = []  # type: List[bytes]
+        self._peerinfo_local_version = self._registry.local_version
+        self._peerinfo_msg = (None, None)  # type: Tuple[int, bytes]
+        self._max_dgram_size = config.get("max_datagram_size", Node.DEFAULT_MAX_DGRAM_SIZE)
+        self._compress_peerinfo = config.get("peerinfo_compression", True)
+        self._transfer_id = 0
+        self._chunks = ChunkAssembler(max_size=ChunkAssembler.MAX_CHUNKS * self._max_dgram_size)
+        # Response to peerinfos requests for a registry generation: (generation, bundles)
+        self._peerinfos_cache = (None, [])  # type: Tuple[int, List[bytes]]
 
         self._enable_zeroconf = config["zeroconf"]
         if self._enable_zeroconf:
@@ -31,13 +101,21 @@ class Node(OscHandler):
 
         self._osc_handlers = {
             proto.PEERINFO: self.__osc_peerinfo,        
-            proto.PEERINFOS: self.__osc_peerinfo,        
+            proto.PEERINFOS: self.__osc_peerinfos,
+            proto.PEERINFO_DELTA: self.__osc_peerinfo_delta,
+            proto.PEERINFO_VERSION: self.__osc_peerinfo_version,
+            proto.PEERINFO_CHUNK: self.__osc_peerinfo_chunk,
             proto.DISCONNECT: self.__osc_disconnect,        
             proto.GET_PATHS: self.__osc_get_paths,        
             proto.NODENAME: self.__osc_nodename,        
             proto.PEERNAMES: self.__osc_peernames,        
             proto.GROUPS: self.__osc_groups,
+            proto.STATS: self.__osc_stats,
+            proto.PROFILE: self.__osc_profile,
+            proto.TRACE: self.__osc_trace,
         }
+        # Names of handlers in timing metrics, e.g. "peerinfo_delta"
+        self._handler_names = {p: p[len(proto.P2PSC_PREFIX) + 2:].replace("/", "_") for p in self._osc_handlers}
 
     async def serve(self):
 
@@ -48,14 +126,75 @@ class Node(OscHandler):
             return
         self._running = True
 
-        self._transport, self._protocol = await self._loop.create_datagram_endpoint(lambda: OscProtocolUdp(self), local_addr=('0.0.0.0', self._addr[1]))
+        bind_addr = (self._config.get("bind_ip", "0.0.0.0"), self._addr[1])
+        self._transport, self._protocol = await self._create_endpoint(bind_addr, reuse_port=self._num_workers > 0)
+        self._set_write_buffer_limits()
+
+        if self._num_workers > 0:
+            # imported here to avoid a circular import (workers extend Node)
+            from p2psc.workers import WorkerPool
+            self._workers = WorkerPool(self, self._num_workers)
+            await self._workers.start()
 
         if self._enable_zeroconf:
             await self._zconf.serve()
 
+        if self._config.get("profile"):
+            self._profiler.start()
+
+        if self.tracer is not None:
+            try:
+                self._loop.add_signal_handler(signal.SIGUSR1, self.dump_trace)
+            except (AttributeError, NotImplementedError, RuntimeError, ValueError):
+                logging.warning("Unable to dump traces on SIGUSR1 on this platform")
+
+        if self._config.get("metrics_port"):
+            self._metrics_server = await serve_http(self.get_metrics_text, "127.0.0.1", self._config["metrics_port"])
+
         self._loop_task = asyncio.create_task(self.__loop())
         await self._loop_task
 
+    async def _create_endpoint(self, local_addr: Tuple[str, int], reuse_port: bool = False):
+        """
+        Creates the UDP endpoint using the transport selected in the config ("asyncio" or "mmsg").
+        Control priority needs to read ahead of handling data messages, which the batch transport always does.
+        """
+        if self._config.get("control_priority", False):
+            return await batchTransport.create_batch_datagram_endpoint(
+                self._loop, self._create_protocol, local_addr, reuse_port=reuse_port,
+                read_batches=Node.PRIORITY_READ_BATCHES)
+        if self._config.get("udp_transport", "asyncio") == "mmsg":
+            if batchTransport.is_supported():
+                return await batchTransport.create_batch_datagram_endpoint(
+                    self._loop, self._create_protocol, local_addr, reuse_port=reuse_port)
+            logging.warning("recvmmsg/sendmmsg are not supported on this platform, using default transport")
+        return await self._loop.create_datagram_endpoint(self._create_protocol, local_addr=local_addr,
+                                                         reuse_port=reuse_port or None)
+
+    def _create_protocol(self) -> OscProtocolUdp:
+        """
+        With control_priority, control messages are handled ahead of data messages
+        """
+        if self._config.get("control_priority", False):
+            return PriorityOscProtocolUdp(self, self.metrics, self.tracer,
+                                          self._config.get("data_queue_size", PriorityOscProtocolUdp.DEFAULT_QUEUE_SIZE))
+        return OscProtocolUdp(self, self.metrics, self.tracer)
+
+    def _set_write_buffer_limits(self):
+        if self._config.get("write_buffer_high") is None:
+            return
+        try:
+            self._transport.set_write_buffer_limits(self._config["write_buffer_high"], self._config.get("write_buffer_low"))
+        except (AttributeError, NotImplementedError):
+            logging.warning("The transport doesn't support write buffer limits")
+
+    def _publish_registry(self):
+        """
+        Publishes changes of the registry to the routing workers (if any)
+        """
+        if self._workers is not None:
+            self._workers.publish(self._registry)
+
     async def __loop(self):
         """
         Handles regular tasks
@@ -63,18 +202,24 @@ class Node(OscHandler):
         self._running = True
         while self._running:
             try:
-                await asyncio.sleep(3)
+                await asyncio.sleep(self._update_interval)
             except asyncio.CancelledError:
                 self._running = False
                 if self._enable_zeroconf:
                     await self._zconf.stop()
                 break
             self._registry.cleanup()
-            info = self._get_peerinfo_msg()
+            self._publish_registry()
+            self._send_peerinfo_updates()
 
-            # TODO: Only update peerinfos on change // implement ACK for peerinfo
-            for pi in self._registry.get_by_type(PeerType.node):
-                self._transport.sendto(info, pi.addr)
+            self.metrics.prune_forwards(self._registry.addr_peer_map)
+            if self._limiter is not None:
+                self._limiter.prune()
+            if self._config.get("metrics_file"):
+                try:
+                    write_text(self._config["metrics_file"], self.get_metrics_text())
+                except OSError as e:
+                    logging.warning(f"Unable to write metrics: {e}")
 
     def stop(self):
         """
@@ -86,23 +231,164 @@ class Node(OscHandler):
         self._running = False
         self._loop_task.cancel()
         self._transport.close()
+        if self._workers is not None:
+            self._workers.stop()
+        if self._metrics_server is not None:
+            self._metrics_server.close()
+        self._profiler.stop()
+        if self.tracer is not None:
+            self.dump_trace()
+
+    def _send_peerinfo_updates(self):
+        """
+        Sends changes of the peerinfo to other nodes, or the current version if nothing changed.
+        Nodes which miss a version request the full peerinfo. Nodes which never sent a versioned peerinfo
+        (e.g. older versions of p2psc, which don't support versions and chunks) receive the full peerinfo.
+        """
+        self._update_peerinfo_version()
+        msgs = self._peerinfo_deltas
+        self._peerinfo_deltas = []
+        if len(msgs) == 0:
+            msgs = [proto.osc_dgram(proto.PEERINFO_VERSION, [self._peerinfo_version])]
+        msgs = [d for m in msgs for d in self._split_peerinfo(m)]
+        full = [self._get_peerinfo_msg()]
+        for pi in self._registry.get_by_type(PeerType.node):
+            for m in (msgs if pi.version is not None else full):
+                self._sendto(m, pi.addr)
+                self.metrics.peerinfo_bytes_out += len(m)
+
+    def _update_peerinfo_version(self):
+        """
+        Increments the peerinfo version and records a delta if local groups or paths changed
+        """
+        if self._registry.local_version == self._peerinfo_local_version:
+            return
+        self._peerinfo_local_version = self._registry.local_version
+        groups = self._registry._local_groups
+        paths = set(self._registry._local_paths)
+        if groups == self._peerinfo_groups and paths == self._peerinfo_paths:
+            return
+        self._peerinfo_version += 1
+        data = proto.peerinfo_delta_args(self._peerinfo_version, groups,
+                                         sorted(paths - self._peerinfo_paths), sorted(self._peerinfo_paths - paths))
+        self._peerinfo_deltas.append(proto.osc_dgram(proto.PEERINFO_DELTA, data))
+        self._peerinfo_groups = list(groups)
+        self._peerinfo_paths = paths
 
     def _get_peerinfo_msg(self):
-        paths = self._registry.get_local_paths()
-        groups = self._registry.get_local_groups()
-        data = PeerInfo(self._addr, groups, paths, PeerType.node).as_osc()
-        return proto.osc_dgram(proto.PEERINFO, data)
+        self._update_peerinfo_version()
+        version, dgram = self._peerinfo_msg
+        if version != self._peerinfo_version:
+            data = PeerInfo(self._addr, self._peerinfo_groups, sorted(self._peerinfo_paths),
+                            PeerType.node, self._peerinfo_version).as_osc()
+            dgram = proto.osc_dgram(proto.PEERINFO, data)
+            self._peerinfo_msg = (self._peerinfo_version, dgram)
+        return dgram
+
+    def _split_peerinfo(self, dgram: bytes) -> List[bytes]:
+        """
+        Returns the datagrams to send a peerinfo message to other nodes: the message itself if it doesn't exceed
+        the size limit, chunks of the (compressed) message otherwise
+        """
+        if len(dgram) <= self._max_dgram_size:
+            return [dgram]
+        self._transfer_id = (self._transfer_id + 1) % (1 << 31)
+        return split_dgram(dgram, self._max_dgram_size, self._transfer_id, self._compress_peerinfo)
+
+    def _request_peerinfo(self, addr: Tuple[str, int]):
+        dgram = proto.osc_dgram(proto.PEERINFO, [])
+        self._sendto(dgram, addr)
+        self.metrics.peerinfo_bytes_out += len(dgram)
+
+    def _sendto(self, dgram: bytes, addr: Tuple[str, int]):
+        """
+        Sends a message which isn't forwarded (forwarding is counted separately)
+        """
+        self.metrics.packets_out += 1
+        self.metrics.bytes_out += len(dgram)
+        self._transport.sendto(dgram, addr)
+
+    def get_stats(self) -> List[Tuple[str, float]]:
+        """
+        Returns counters, gauges and histogram summaries of this node as (name, value) pairs
+        """
+        return self.metrics.values(self._get_gauges())
+
+    def get_metrics_text(self) -> str:
+        """
+        Returns all metrics in the Prometheus text format
+        """
+        return self.metrics.to_text(self._get_gauges())
+
+    def dump_trace(self):
+        """
+        Writes the latency distribution of traced datagrams to the trace file or the log
+        """
+        text = self.tracer.dump()
+        path = self._config.get("trace_file")
+        if path is None:
+            logging.info(text)
+            return
+        try:
+            write_text(path, text)
+            logging.info(f"Wrote latency traces to {path}")
+        except OSError as e:
+            logging.warning(f"Unable to write latency traces: {e}")
+
+    def _get_gauges(self):
+        return {
+            "registry_nodes": len(self._registry._path_index[PeerType.node]),
+            "registry_clients": len(self._registry._path_index[PeerType.client]),
+            "route_cache_entries": len(self._routes),
+            "route_cache_hits": self._routes.hits,
+            "route_cache_misses": self._routes.misses,
+            "peerinfo_updates_applied": self._registry.updates_applied,
+            "peerinfo_updates_skipped": self._registry.updates_skipped,
+            "write_buffer_bytes": self._get_write_buffer_size(),
+            "queued_datagrams": self._protocol.queued if self._protocol is not None else 0,
+        }
+
+    def _get_write_buffer_size(self) -> int:
+        try:
+            return self._transport.get_write_buffer_size()
+        except (AttributeError, NotImplementedError):  # no transport or no write buffer
+            return 0
+
+    def pause_writing(self):
+        logging.warning("Write buffer full, " + ("dropping forwarded messages" if self._drop_data else "buffering"))
+        self._writing_paused = True
+
+    def resume_writing(self):
+        logging.info(f"Write buffer drained, resuming ({self.metrics.backpressure_drops} datagrams dropped so far)")
+        self._writing_paused = False
+
+    def _get_node(self, addr: Tuple[str, int]) -> PeerInfo:
+        """
+        Returns the peerinfo of the node with the given address, or None if it's unknown or not a node
+        """
+        try:
+            pi = self._registry.get_peer(addr)
+        except LookupError:
+            return None
+        return pi if pi.type == PeerType.node else None
 
     def _zconf_node_callback(self, addr: Union[Tuple[str, int], None], state: zeroconf.ServiceStateChange):
         """
         Called by Zeroconf when a MDNS service changed state
         """
+        if self._profiler.timing:
+            self._timed("zconf", self._handle_zconf, addr, state)
+        else:
+            self._handle_zconf(addr, state)
+
+    def _handle_zconf(self, addr: Union[Tuple[str, int], None], state: zeroconf.ServiceStateChange):
         if state == zeroconf.ServiceStateChange.Removed:
             try:
                 logging.info(f"MDNS REMOVE node with addr: {addr}")
                 self._registry.remove_peer(addr)
             except LookupError:
                 logging.warning(f"MDNS REMOVED for unknown node: {addr}")
+            self._publish_registry()
             return
         try:
             self._registry.get_peer(addr).refresh()
@@ -111,93 +397,260 @@ class Node(OscHandler):
             logging.info(f"MDNS DISCOVERED node at {addr}")
             pi = PeerInfo(addr, type=PeerType.node)
             self._registry.add_peer(pi)
+        self._publish_registry()
 
-    async def on_osc(self, addr: Tuple[str, int], message: Union[OscBundle, OscMessage]):
+    async def on_osc(self, addr: Tuple[str, int], message: Union[OscBundle, OscMessage, LazyOscMessage]):
         """ 
         Handle incoming OSC messages
         """
+        self.on_osc_sync(addr, message)
+
+    def on_osc_sync(self, addr: Tuple[str, int], message: Union[OscBundle, OscMessage, LazyOscMessage]):
+        """ 
+        Handle incoming OSC messages, called directly by the protocol as nothing here needs to be awaited
+        """
+        timing = self._profiler.timing
         if type(message) == OscBundle:
-            logging.error("OSC Bundle messages are not supported yet!")
+            if timing:
+                self._timed("forward_bundle", self._route_bundle, addr, message)
+            else:
+                self._route_bundle(addr, message)
+            self._publish_registry()
             return
 
         # Peerinfo messages are handled locally
         if proto.get_group_from_path(message.address) == proto.P2PSC_PREFIX:
             self._handle_local(addr, message)
+            self._publish_registry()
             return
 
         # All other messages are forwarded to clients/nodes depending on sender
+        if timing:
+            self._timed("forward", self._forward, addr, message)
+        else:
+            self._forward(addr, message)
+
+    def _timed(self, name: str, handler, *args):
+        """
+        Calls handler and records its execution time in the metrics
+        """
+        start = time.perf_counter()
+        try:
+            handler(*args)
+        finally:
+            self.metrics.observe_handler(name, time.perf_counter() - start)
+
+    def _forward(self, addr: Tuple[str, int], message: Union[OscMessage, LazyOscMessage]):
+        tracer = self.tracer
+        traced = tracer is not None and tracer.active
+        peer_type = self._get_peer_type(addr)
+        metrics = self.metrics
+        if peer_type == PeerType.client and self._limiter is not None \
+                and not self._limiter.allow(addr, message.address):
+            metrics.rate_limited_messages += 1
+            return
+        dgram, dsts = self._route(peer_type, message)
+        if traced:
+            tracer.routed()
+        metrics.fanout.observe(len(dsts))
+        if len(dsts) == 0:
+            metrics.unrouted_messages += 1
+            return
+        if self._writing_paused and self._drop_data:
+            metrics.backpressure_drops += len(dsts)
+            return
+        metrics.packets_out += len(dsts)
+        metrics.bytes_out += len(dgram) * len(dsts)
+        forwards = metrics.forwards
+        for dst in dsts:
+            self._transport.sendto(dgram, dst)
+            forwards[dst] = forwards.get(dst, 0) + 1
+        if traced:
+            tracer.end(len(dsts))
+        # Only decode the arguments of lazily parsed messages if they are actually logged
+        if peer_type == PeerType.client and _log_forward.enabled():
+            _log_forward.log("Forwarding %s %s to %s", message.address, _format_params(message), dsts)
+
+    def _get_peer_type(self, addr: Tuple[str, int]) -> PeerType:
         try:
-            peer_type = self._registry.get_peer(addr).type  # type: PeerInfo
+            return self._registry.get_peer(addr).type
         except LookupError:
             # If we don't know the peer we simply assume it is a client requesting us to forward the message
             # TODO: Any implications here?!
-            peer_type = PeerType.client
+            return PeerType.client
 
+    def _route(self, peer_type: PeerType, message: Union[OscMessage, LazyOscMessage]) -> Tuple[bytes, List[Tuple[str, int]]]:
+        """
+        Returns the datagram to forward and its destinations for a message sent by a peer of the given type
+        """
         # Messages from clients are only forwarded to nodes
         if peer_type == PeerType.client:
-            for pi in self._registry.get_by_path(message.address, filter_type=PeerType.node):
-                logging.info(
-                    f"Forwarding {message.address} {message.params} to {pi.addr}")
-                self._transport.sendto(message.dgram, pi.addr)
-        else:  # Messages from nodes are only forwarded to clients
-            # remove group from path
-            m = proto.osc_dgram(proto.remove_group_from_path(
-                message.address), message.params)
-            for pi in self._registry.get_by_path(message.address, filter_type=PeerType.client):
-                self._transport.sendto(m, pi.addr)
+            return message.dgram, self._routes.get(message.address, PeerType.node)
+
+        # Messages from nodes are only forwarded to clients
+        dsts = self._routes.get(message.address, PeerType.client)
+        if len(dsts) == 0:
+            return None, dsts
+        # remove group from path
+        m = proto.replace_address(message.dgram, proto.remove_group_from_path(message.address))
+        return m, dsts
+
+    def _route_bundle(self, addr: Tuple[str, int], bundle: OscBundle):
+        """
+        Forwards all messages in a bundle. Messages are re-packed into one bundle per destination, which keeps
+        the timetag of the original bundle. Nested bundles are forwarded separately with their own timetag.
+        """
+        peer_type = self._get_peer_type(addr)
+        limiter = self._limiter if peer_type == PeerType.client else None
+        metrics = self.metrics
+        dst_contents = {}  # type: Dict[Tuple[str, int], List[bytes]]
+        for content in bundle:
+            if type(content) == OscBundle:
+                self._route_bundle(addr, content)
+                continue
+            if proto.get_group_from_path(content.address) == proto.P2PSC_PREFIX:
+                self._handle_local(addr, content)
+                continue
+            if limiter is not None and not limiter.allow(addr, content.address):
+                metrics.rate_limited_messages += 1
+                continue
+            dgram, dsts = self._route(peer_type, content)
+            for dst in dsts:
+                dst_contents.setdefault(dst, []).append(dgram)
+
+        # Nested bundles may already have ended the trace
+        tracer = self.tracer
+        traced = tracer is not None and tracer.active
+        if traced:
+            tracer.routed()
+        metrics.fanout.observe(len(dst_contents))
+        if len(dst_contents) == 0:
+            metrics.dropped_bundles += 1
+            return
+        if self._writing_paused and self._drop_data:
+            metrics.backpressure_drops += len(dst_contents)
+            return
+        timetag = proto.bundle_timetag(bundle.dgram)
+        forwards = metrics.forwards
+        for dst, contents in dst_contents.items():
+            dgram = proto.bundle_dgram(timetag, contents)
+            self._transport.sendto(dgram, dst)
+            metrics.packets_out += 1
+            metrics.bytes_out += len(dgram)
+            forwards[dst] = forwards.get(dst, 0) + 1
+        if traced:
+            tracer.end(len(dst_contents))
 
     def __osc_peerinfo(self, addr, message: OscMessage):
         if len(message.params) == 0:
-            logging.debug(f"Peer {addr} requested info")
-            self._transport.sendto(self._get_peerinfo_msg(), addr)
+            _log_peerinfo("Peer %s requested info", addr)
+            dgram = self._get_peerinfo_msg()
+            # Clients don't support chunked peerinfos
+            dgrams = self._split_peerinfo(dgram) if self._get_node(addr) is not None else [dgram]
+            for d in dgrams:
+                self._sendto(d, addr)
+                self.metrics.peerinfo_bytes_out += len(d)
+            return
+        # Periodic updates usually don't change anything
+        digest = proto.payload_digest(message.dgram)
+        if self._registry.refresh_if_unchanged(addr, digest):
             return
         if not proto.is_valid_peerinfo(message.params):
-            logging.warning(
-                f"Received invalid peerinfo from {addr}: {message.params}")
+            _log_invalid("Received invalid peerinfo from %s: %s", addr, message.params)
             return
-        self._registry.add_peer(PeerInfo.from_osc(addr, message.params))
+        self._registry.add_peer(PeerInfo.from_osc(addr, message.params), digest)
     
+    def __osc_peerinfo_delta(self, addr, message: OscMessage):
+        if not proto.is_valid_peerinfo_delta(message.params):
+            _log_invalid("Received invalid peerinfo delta from %s: %s", addr, message.params)
+            return
+        version, groups, added, removed = message.params
+        pi = self._get_node(addr)
+        if pi is None or pi.version is None or pi.version + 1 != version:
+            _log_peerinfo("Missed peerinfo version of %s, requesting full peerinfo", addr)
+            self._request_peerinfo(addr)
+            return
+        removed = set(proto.str_to_list(removed))
+        paths = [p for p in pi.paths if p not in removed] + proto.str_to_list(added)
+        self._registry.add_peer(PeerInfo(addr, proto.str_to_list(groups), paths, PeerType.node, version))
+
+    def __osc_peerinfo_version(self, addr, message: OscMessage):
+        if not proto.is_valid_peerinfo_version(message.params):
+            _log_invalid("Received invalid peerinfo version from %s: %s", addr, message.params)
+            return
+        pi = self._get_node(addr)
+        if pi is None or pi.version != message.params[0]:
+            _log_peerinfo("Missed peerinfo version of %s, requesting full peerinfo", addr)
+            self._request_peerinfo(addr)
+            return
+        pi.refresh()
+
+    def __osc_peerinfo_chunk(self, addr, message: OscMessage):
+        # Reassembly buffers and decompresses data, so only known nodes may send chunks
+        if self._get_node(addr) is None:
+            _log_invalid("Received peerinfo chunk from unknown node %s", addr)
+            return
+        if not proto.is_valid_peerinfo_chunk(message.params):
+            _log_invalid("Received invalid peerinfo chunk from %s", addr)
+            return
+        try:
+            dgram = self._chunks.add(addr, message.params)
+            if dgram is None:
+                return
+            message = OscMessage(dgram)
+        except Exception as e:
+            _log_invalid("Failed to reassemble peerinfo from %s: %s", addr, e)
+            return
+        if message.address not in (proto.PEERINFO, proto.PEERINFO_DELTA):
+            _log_invalid("Received chunked message with unexpected path from %s: %s", addr, message.address)
+            return
+        self._osc_handlers[message.address](addr, message)
+
+    def _get_peerinfos_msgs(self) -> List[bytes]:
+        """
+        Returns bundles containing the peerinfos of all known nodes, each within the datagram size limit
+        """
+        generation, bundles = self._peerinfos_cache
+        if generation != self._registry.generation:
+            msgs = [proto.osc_dgram(proto.PEERINFO, pi.as_osc()) for pi in self._registry.get_by_type(PeerType.node)]
+            bundles = proto.pack_bundles(proto.IMMEDIATELY_TIMETAG, msgs, self._max_dgram_size)
+            self._peerinfos_cache = (self._registry.generation, bundles)
+        return bundles
+
     def __osc_peerinfos(self, addr, message: OscMessage):
-        bb = OscBundleBuilder(IMMEDIATELY)
-        for pi in self._registry.get_by_type(PeerType.node):
-            bb.add_content(proto.osc_message(proto.PEERINFO, pi.as_osc()))
-        self._transport.sendto(bb.build().dgram, addr)
+        for dgram in self._get_peerinfos_msgs():
+            self._sendto(dgram, addr)
+            self.metrics.peerinfo_bytes_out += len(dgram)
 
     def __osc_disconnect(self,addr, message: OscMessage):
         try:
             self._registry.remove_peer(addr)
         except LookupError:
-            logging.warning(f"DISCONNECT request from unregistered peer: {addr}")
+            _log_invalid("DISCONNECT request from unregistered peer: %s", addr)
     
     def __osc_get_paths(self,addr, message: OscMessage):
         if len(message.params) == 0:
             paths = proto.list_to_str(self._registry._local_paths)
             msg = proto.osc_dgram(proto.GET_PATHS, [self._registry._node_name, paths])
-            self._transport.sendto(msg, addr)
+            self._sendto(msg, addr)
             return
         if len(message.params) > 1 or type(message.params[0]) != str:
-            logging.warning(
-                f"Received Invalid Message from {addr}: {message.address}, {message.params}")
+            _log_invalid("Received Invalid Message from %s: %s, %s", addr, message.address, message.params)
             return
-        for pi in self._registry.get_by_type(PeerType.node):
-            if len(pi.groups) < 1:
-                continue
-            if message.params[0] == pi.groups[0]:
-                paths = proto.list_to_str(pi.paths)
-                msg = proto.osc_dgram(proto.GET_PATHS, [pi.groups[0], paths])
-                self._transport.sendto(msg, addr)
+        for pi in self._registry.get_by_name(message.params[0]):
+            paths = proto.list_to_str(pi.paths)
+            msg = proto.osc_dgram(proto.GET_PATHS, [pi.groups[0], paths])
+            self._sendto(msg, addr)
 
     def __osc_nodename(self, addr, message: OscMessage):
         if len(message.params) > 1:
-            logging.warning(
-                f"Received Invalid Message from {addr}: {message.address}, {message.params}")
+            _log_invalid("Received Invalid Message from %s: %s, %s", addr, message.address, message.params)
         elif len(message.params) == 0:
             msg = proto.osc_dgram(proto.NODENAME, [self._registry._node_name])
-            self._transport.sendto(msg, addr)
+            self._sendto(msg, addr)
         else:
             if type(message.params[0]) != str:
-                logging.warning(
-                    f"Received Invalid name from {addr}: {message.address}, {message.params}")
+                _log_invalid("Received Invalid name from %s: %s, %s", addr, message.address, message.params)
             elif message.params[0] == "":
                 self._registry.set_name(self._config["name"])
             else:
@@ -205,42 +658,63 @@ class Node(OscHandler):
 
     def __osc_peernames(self, addr, message: OscMessage):
         if len(message.params) != 0:
-            logging.warning(
-                f"Received Invalid Message from {addr}: {message.address}, {message.params}")
+            _log_invalid("Received Invalid Message from %s: %s, %s", addr, message.address, message.params)
             return
-        names = []
-        for pi in self._registry.get_by_type(PeerType.node):
-            if len(pi.groups) > 0:
-                names.append(pi.groups[0])
-
+        names = self._registry.get_names()
         msg = proto.osc_dgram(proto.PEERNAMES, [proto.list_to_str(names)])
-        self._transport.sendto(msg, addr)
+        self._sendto(msg, addr)
 
     def __osc_groups(self, addr, message: OscMessage):
         if len(message.params) == 0:
             groups = self._registry._local_groups
             msg = proto.osc_dgram(proto.GROUPS, [proto.list_to_str(groups)])
-            self._transport.sendto(msg, addr)
+            self._sendto(msg, addr)
             return
         if len(message.params) > 1 or type(message.params[0]) != str:
-            logging.warning(
-                f"Received Invalid Message from {addr}: {message.address}, {message.params}")
+            _log_invalid("Received Invalid Message from %s: %s, %s", addr, message.address, message.params)
             return
 
-        for pi in self._registry.get_by_type(PeerType.node):
-            if len(pi.groups) < 1:
-                continue
-            if message.params[0] == pi.groups[0]:
-                msg = proto.osc_dgram(proto.GROUPS, [proto.list_to_str(pi.groups)])
-                self._transport.sendto(msg, addr)
+        for pi in self._registry.get_by_name(message.params[0]):
+            msg = proto.osc_dgram(proto.GROUPS, [proto.list_to_str(pi.groups)])
+            self._sendto(msg, addr)
+
+    def __osc_profile(self, addr, message: OscMessage):
+        if len(message.params) > 1 or (len(message.params) == 1 and type(message.params[0]) != int):
+            _log_invalid("Received Invalid Message from %s: %s, %s", addr, message.address, message.params)
+            return
+        if len(message.params) == 1:
+            if message.params[0]:
+                self._profiler.start()
+            else:
+                self._profiler.stop()
+        # Reply with the current state: handler timing and cProfile capture enabled
+        msg = proto.osc_dgram(proto.PROFILE, [int(self._profiler.timing), int(self._profiler.capturing)])
+        self._sendto(msg, addr)
+
+    def __osc_trace(self, addr, message: OscMessage):
+        args = []
+        if self.tracer is not None:
+            self.dump_trace()
+            args = [v for pair in self.tracer.summary() for v in pair]
+        self._sendto(proto.osc_dgram(proto.TRACE, args), addr)
+
+    def __osc_stats(self, addr, message: OscMessage):
+        args = [v for name_value in self.get_stats() for v in name_value]
+        self._sendto(proto.osc_dgram(proto.STATS, args), addr)
 
     def _handle_local(self, addr, message: OscMessage):
         """
         Handles OSC messages for local node
         """
-        try:
-            self._osc_handlers[message.address](addr, message)
-        except KeyError:
-            logging.info("Received Message with p2psc prefix but unknown path!")
+        if message.address in proto.PEERINFO_PATHS:
+            self.metrics.peerinfo_bytes_in += message.size
+        handler = self._osc_handlers.get(message.address)
+        if handler is None:
+            _log_invalid("Received Message with p2psc prefix but unknown path from %s: %s", addr, message.address)
+            return
+        if self._profiler.timing:
+            self._timed(self._handler_names[message.address], handler, addr, message)
+        else:
+            handler(addr, message)
 
             
\ No newline at end of file
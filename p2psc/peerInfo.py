@@ -1,7 +1,7 @@
 from enum import Enum
-import re
+import sys
 import time
-from typing import List
+from typing import Iterable, List, Tuple
 
 from p2psc import proto
 
@@ -10,14 +10,24 @@ class PeerType(Enum):
     node = 0
     client = 1
 
+def intern_all(strings: Iterable[str]) -> Tuple[str, ...]:
+    """ Returns a tuple of the given strings, which are interned to share them between peers """
+    return tuple(map(sys.intern, strings))
+
+
 class PeerInfo:
+    __slots__ = ("addr", "paths", "groups", "type", "version", "last_update_t")
+
     NODE_EXPIRY_T = 20  # in seconds
 
-    def __init__(self, addr, groups: List[str] = [], paths: List[str] = [], type: PeerType = PeerType.client) -> None:
+    def __init__(self, addr, groups: Iterable[str] = (), paths: Iterable[str] = (), type: PeerType = PeerType.client, version: int = None) -> None:
+        if isinstance(addr, tuple) and len(addr) == 2 and isinstance(addr[0], str):
+            addr = (sys.intern(addr[0]), addr[1])
         self.addr = addr
-        self.paths = paths
-        self.groups = groups
+        self.paths = intern_all(paths)  # type: Tuple[str, ...]
+        self.groups = intern_all(groups)  # type: Tuple[str, ...]
         self.type = type
+        self.version = version  # peerinfo version of nodes, None if unknown
         self.last_update_t = time.time()
 
     @staticmethod
@@ -27,21 +37,28 @@ class PeerInfo:
         Raises and exception if message is invalid TODO: Which?
         """
         # NOTE: Optional address in peerinfo?
-        return PeerInfo(addr, type=PeerType(osc_args[0]), groups=proto.str_to_list(osc_args[1]), paths=proto.str_to_list(osc_args[2]))
+        version = osc_args[3] if len(osc_args) > 3 else None
+        return PeerInfo(addr, type=PeerType(osc_args[0]), groups=proto.str_to_list(osc_args[1]), paths=proto.str_to_list(osc_args[2]), version=version)
 
     def as_osc(self):
         """
         Returns an OSC message which contains all information in this peerinfo
         """
-        return proto.peerinfo_args(self.type.value, self.addr, self.groups, self.paths)
+        return proto.peerinfo_args(self.type.value, self.addr, self.groups, self.paths, self.version)
     
     def refresh(self):
         self.last_update_t = time.time()
 
-    def is_expired(self):
+    def expiry_t(self):
+        """ Returns the time at which this peer expires, None for clients (which never expire) """
+        if self.type == PeerType.client:
+            return None
+        return self.last_update_t + PeerInfo.NODE_EXPIRY_T
+
+    def is_expired(self, now: float = None):
         if self.type == PeerType.client:
             return False
-        return time.time() >= self.last_update_t + PeerInfo.NODE_EXPIRY_T
+        return (time.time() if now is None else now) >= self.expiry_t()
 
     def subscribes(self, path:str, local_groups:List[str]):
         """
@@ -60,23 +77,10 @@ class PeerInfo:
             return False
 
         path = proto.remove_group_from_path(path)
-        # NOTE: Almost 1:1 copy from pythonosc, see: https://github.com/attwad/python-osc
-        # First convert the address_pattern into a matchable regexp.
-        # '?' in the OSC Address Pattern matches any single character.
-        # Let's consider numbers and _ "characters" too here, it's not said
-        # explicitly in the specification but it sounds good.
-        escaped_address_pattern = re.escape(path)
-        pattern = escaped_address_pattern.replace('\\?', '\\w?')
-        # '*' in the OSC Address Pattern matches any sequence of zero or more
-        # characters.
-        pattern = pattern.replace('\\*', '[\w|\+]*')
-        # The rest of the syntax in the specification is like the re module so
-        # we're fine.
-        pattern = pattern + '$'
-        patterncompiled = re.compile(pattern)
+        pattern = proto.pattern_regex(path)
 
         for p in self.paths:
-            if (patterncompiled.match(p)
-                    or (('*' in p) and re.match(p.replace('*', '[^/]*?/*'), path))):
+            if (pattern.match(p)
+                    or (('*' in p) and proto.subscription_regex(p).match(path))):
                 return True
-        return False
\ No newline at end of file
+        return False
@@ -1,43 +1,208 @@
-
-
 import abc
 import asyncio
+import collections
 import logging
+import time
 from typing import Tuple, Union
 
 from pythonosc.osc_message import OscMessage
 from pythonosc.osc_bundle import OscBundle
 
+from p2psc import proto
+from p2psc.common.logging import get_sampled_log
+from p2psc.metrics import Metrics
+from p2psc.tracing import Tracer
+
+_log_invalid = get_sampled_log("invalid")
+_log_handler_error = get_sampled_log("handler_error")
+
+# Datagrams starting with this are control messages for the node
+_CONTROL_PREFIX = ('/' + proto.P2PSC_PREFIX + '/').encode()
+
+
+class LazyOscMessage():
+    """
+    OSC message which only decodes its address on creation. 
+    Type tags and arguments are decoded on first access, which is never needed for forwarding the raw datagram.
+    """
+    __slots__ = ("_dgram", "_address", "_message")
+
+    def __init__(self, dgram: bytes) -> None:
+        self._dgram = dgram
+        # raises ValueError/UnicodeDecodeError for invalid addresses
+        self._address = dgram[:dgram.index(b"\x00")].decode()
+        self._message = None  # type: OscMessage
+
+    def _parse(self) -> OscMessage:
+        if self._message is None:
+            self._message = OscMessage(self._dgram)
+        return self._message
+
+    @property
+    def address(self) -> str:
+        return self._address
+
+    @property
+    def dgram(self) -> bytes:
+        return self._dgram
+
+    @property
+    def size(self) -> int:
+        return len(self._dgram)
+
+    @property
+    def params(self):
+        return self._parse().params
+
+    def __iter__(self):
+        return iter(self.params)
+
+
 class OscHandler():
-    async def on_osc(self, addr: Tuple[str, int], message: Union[OscBundle, OscMessage]):
+    def on_osc_sync(self, addr: Tuple[str, int], message: Union[OscBundle, OscMessage, LazyOscMessage]):
+        """
+        Called directly from datagram_received for every message. 
+        The default implementation schedules on_osc as a task, handlers which never await should override this.
+        """
+        asyncio.ensure_future(self.on_osc(addr, message))
+
+    async def on_osc(self, addr: Tuple[str, int], message: Union[OscBundle, OscMessage, LazyOscMessage]):
         raise NotImplementedError()
 
+    def pause_writing(self):
+        """
+        Called when the write buffer of the transport exceeds its high watermark
+        """
+        pass
+
+    def resume_writing(self):
+        """
+        Called when the write buffer of the transport drained below its low watermark
+        """
+        pass
+
+
 class OscProtocolUdp(asyncio.DatagramProtocol):
-    def __init__(self, handler: OscHandler):
+    def __init__(self, handler: OscHandler, metrics: Metrics = None, tracer: Tracer = None):
         self._handler = handler
+        self._metrics = metrics
+        self._tracer = tracer
         self._transport = None  # type: asyncio.DatagramTransport
 
-    def datagram_received(self, dgram, addr):
-        """Called when a UDP message is received """
+    def datagram_received(self, dgram, addr, received_t: float = None):
+        """
+        Called when a UDP message is received. received_t is the time (perf_counter) the datagram was received
+        at if it was queued before
+        """
+        metrics = self._metrics
+        tracer = self._tracer
+        traced = tracer is not None and tracer.begin(received_t)
+        if metrics is not None:
+            start = time.perf_counter()
+            metrics.packets_in += 1
+            metrics.bytes_in += len(dgram)
+            if received_t is not None:
+                metrics.queue_wait.observe(start - received_t)
 
         # Parse OSC message
         try:
             if OscBundle.dgram_is_bundle(dgram):
                 msg = OscBundle(dgram)
             elif OscMessage.dgram_is_message(dgram):
-                msg = OscMessage(dgram)
+                msg = LazyOscMessage(dgram)
+                # Messages for the local node are always fully parsed, everything else is parsed on demand
+                if proto.get_group_from_path(msg.address) == proto.P2PSC_PREFIX:
+                    msg = OscMessage(dgram)
             else:
                 raise  # Invalid message
         except:
-            logging.warning(f"Received invalid OSC from {addr}")
+            _log_invalid("Received invalid OSC from %s", addr)
+            if metrics is not None:
+                metrics.parse_errors += 1
+            if traced:
+                tracer.discard()
             return
 
-        asyncio.ensure_future(self._handler.on_osc(addr, msg))
+        if traced:
+            tracer.parsed()
+        try:
+            self._handler.on_osc_sync(addr, msg)
+        except Exception:
+            _log_handler_error("Error while handling OSC from %s", addr, exc_info=True)
+            if metrics is not None:
+                metrics.handler_errors += 1
+        if traced:
+            # Not forwarded
+            tracer.discard()
+        if metrics is not None:
+            metrics.handler_latency.observe(time.perf_counter() - start)
 
     def connection_made(self, transport):
         self._transport = transport
 
+    @property
+    def queued(self) -> int:
+        """ Number of received datagrams which are not handled yet """
+        return 0
+
+    def pause_writing(self):
+        self._handler.pause_writing()
+
+    def resume_writing(self):
+        self._handler.resume_writing()
+
     def connection_lost(self, exc):
         logging.info(f"Connection lost: {str(exc)}")
         self._transport = None
 
+
+
+class PriorityOscProtocolUdp(OscProtocolUdp):
+    """
+    Handles control messages (/p2psc/...) as soon as they are received. Other messages and bundles are queued
+    and handled in batches of at most budget datagrams per event loop iteration, so control messages, timers and
+    reading the socket never wait for more than one batch. If the queue is full, the oldest datagram is dropped.
+    """
+    DEFAULT_QUEUE_SIZE = 4096
+    DEFAULT_BUDGET = 16
+
+    def __init__(self, handler: OscHandler, metrics: Metrics = None, tracer: Tracer = None,
+                 queue_size: int = DEFAULT_QUEUE_SIZE, budget: int = DEFAULT_BUDGET):
+        super().__init__(handler, metrics, tracer)
+        self._queue = collections.deque()  # type: collections.deque[Tuple[bytes, Tuple[str, int], float]]
+        self._queue_size = max(1, queue_size)
+        self._budget = max(1, budget)
+        self._drain_handle = None  # type: asyncio.Handle
+
+    @property
+    def queued(self) -> int:
+        return len(self._queue)
+
+    def datagram_received(self, dgram, addr):
+        if dgram.startswith(_CONTROL_PREFIX):
+            OscProtocolUdp.datagram_received(self, dgram, addr)
+            return
+        queue = self._queue
+        if len(queue) >= self._queue_size:
+            queue.popleft()
+            if self._metrics is not None:
+                self._metrics.queue_drops += 1
+        queue.append((dgram, addr, time.perf_counter()))
+        if self._drain_handle is None:
+            self._drain_handle = asyncio.get_event_loop().call_soon(self._drain)
+
+    def _drain(self):
+        self._drain_handle = None
+        queue = self._queue
+        for _ in range(min(self._budget, len(queue))):
+            dgram, addr, received_t = queue.popleft()
+            OscProtocolUdp.datagram_received(self, dgram, addr, received_t)
+        if len(queue) > 0:
+            self._drain_handle = asyncio.get_event_loop().call_soon(self._drain)
+
+    def connection_lost(self, exc):
+        if self._drain_handle is not None:
+            self._drain_handle.cancel()
+            self._drain_handle = None
+        self._queue.clear()
+        super().connection_lost(exc)
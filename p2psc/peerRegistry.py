@@ -1,8 +1,13 @@
-import logging
+import heapq
+import time
 from typing import Dict, List, Tuple
 from p2psc import proto
+from p2psc.common.logging import get_sampled_log
 
 from p2psc.peerInfo import PeerInfo, PeerType
+from p2psc.subscriptionIndex import SubscriptionIndex
+
+_log_peers = get_sampled_log("peers")
 
 
 class PeerRegistry:
@@ -10,32 +15,82 @@ class PeerRegistry:
         self._node_name = name
         self.addr_peer_map = {}  # type: Dict[Tuple, PeerInfo]
         self._local_groups = [name]
+        self._local_group_set = {name}
         self._local_paths = []
-
+        # Number of clients subscribing each group/path, the lists above are derived from these
+        self._local_group_counts = {}  # type: Dict[str, int]
+        self._local_path_counts = {}  # type: Dict[str, int]
+        # Incremented whenever the local groups or paths change
+        self.local_version = 0
+        self._path_index = {t: SubscriptionIndex() for t in PeerType}  # type: Dict[PeerType, SubscriptionIndex]
+        # Node peers by group and by name (first group), updated in _index_peer/_unindex_peer
+        self._group_index = {}  # type: Dict[str, SubscriptionIndex]
+        self._name_map = {}  # type: Dict[str, Dict[Tuple, None]]
+        self._node_groups = {}  # type: Dict[Tuple, List[str]]
+        # Incremented on every change of the registry, used to invalidate derived data (e.g. routes)
+        self.generation = 0
+        # Digest of the last peerinfo payload of each peer, used to skip unchanged updates
+        self._peer_digests = {}  # type: Dict[Tuple, bytes]
+        self.updates_applied = 0
+        self.updates_skipped = 0
+        # Min-heap of (expiry time, addr) with at most one valid entry per node (see _expiry_t).
+        # Refreshed peers are rescheduled lazily when their entry is popped.
+        self._expiry_heap = []  # type: List[Tuple[float, Tuple]]
+        self._expiry_t = {}  # type: Dict[Tuple, float]
 
     def get_local_paths(self) -> List[str]:
         """
         Return all paths subscribed by clients connected to this node
         """
-        paths = []
-        for pi in filter(lambda x: x.type == PeerType.client,  self.addr_peer_map.values()):
-            paths.extend(pi.paths)
-        return paths
+        return list(self._local_paths)
 
     def get_local_groups(self) -> List[str]:
         """
         Return all groups subscribed by clients connected to this node
         """
-        groups = []
-        for pi in filter(lambda x: x.type == PeerType.client,  self.addr_peer_map.values()):
-            groups.extend(pi.groups)
-        groups = list(set(groups)) # remove duplicates
-        groups.insert(0, self._node_name) # Insert own name as first element in groups
-        return groups
+        return list(self._local_groups)
+
+    @staticmethod
+    def _update_counts(counts: Dict[str, int], old: List[str], new: List[str]) -> bool:
+        """
+        Applies the difference between old and new to counts, returns True if a key was added or removed
+        """
+        old, new = dict.fromkeys(old), dict.fromkeys(new)  # remove duplicates, keep order
+        changed = False
+        for k in new:
+            if k in old:
+                continue
+            n = counts.get(k, 0)
+            counts[k] = n + 1
+            changed |= n == 0
+        for k in old:
+            if k in new:
+                continue
+            if counts[k] == 1:
+                del counts[k]
+                changed = True
+            else:
+                counts[k] -= 1
+        return changed
+
+    def _update_local(self, old: PeerInfo = None, new: PeerInfo = None):
+        """
+        Updates local groups and paths after the peerinfo of a peer changed from old to new (None if not registered)
+        """
+        old_groups, old_paths = (old.groups, old.paths) if old is not None and old.type == PeerType.client else ((), ())
+        new_groups, new_paths = (new.groups, new.paths) if new is not None and new.type == PeerType.client else ((), ())
 
-    def _update_local(self):
-        self._local_groups = self.get_local_groups()
-        self._local_paths = self.get_local_paths()
+        if self._update_counts(self._local_group_counts, old_groups, new_groups):
+            self._update_local_groups()
+        if self._update_counts(self._local_path_counts, old_paths, new_paths):
+            self._local_paths = list(self._local_path_counts)
+            self.local_version += 1
+
+    def _update_local_groups(self):
+        # Own name is the first group
+        self._local_groups = [self._node_name] + [g for g in self._local_group_counts if g != self._node_name]
+        self._local_group_set = set(self._local_groups)
+        self.local_version += 1
 
     def get_by_type(self, t: PeerType) -> List[PeerInfo]:
         """
@@ -43,14 +98,83 @@ class PeerRegistry:
         """
         return list(filter(lambda x: x.type == t,  self.addr_peer_map.values()))
 
+    def get_by_group(self, group: str) -> List[PeerInfo]:
+        """
+        Return all node peerinfos which are in the given group
+        """
+        index = self._group_index.get(group)
+        if index is None:
+            return []
+        return [self.addr_peer_map[a] for a in index.peers()]
+
+    def get_by_name(self, name: str) -> List[PeerInfo]:
+        """
+        Return all node peerinfos with the given name (first group)
+        """
+        return [self.addr_peer_map[a] for a in self._name_map.get(name, ())]
+
+    def get_names(self) -> List[str]:
+        """
+        Return the names of all known nodes
+        """
+        return list(self._name_map)
+
     def get_by_path(self, path: str, filter_type: PeerType = None) -> List[PeerInfo]:
         """
         Return all peerinfos subscribed to the given path
         """
-        if filter_type is None:
-            return list(filter(lambda x: x.subscribes(path, local_groups=self._local_groups),  self.addr_peer_map.values()))
-        else:
-            return list(filter(lambda x: x.type == filter_type and x.subscribes(path, local_groups=self._local_groups),  self.addr_peer_map.values()))
+        group = proto.get_group_from_path(path)
+        subpath = proto.remove_group_from_path(path)
+        types = PeerType if filter_type is None else [filter_type]
+
+        peers = []
+        for t in types:
+            if group == proto.ALL_NODES_GROUP:
+                index = self._path_index[t]
+            elif t == PeerType.client:
+                # Clients receive messages for all groups subscribed by this node
+                if group not in self._local_group_set:
+                    continue
+                index = self._path_index[t]
+            else:
+                index = self._group_index.get(group)
+                if index is None:
+                    continue
+            peers.extend(self.addr_peer_map[a] for a in index.match(subpath))
+        return peers
+
+    def _index_peer(self, pi: PeerInfo):
+        self._path_index[pi.type].add(pi.addr, pi.paths)
+        if pi.type != PeerType.node:
+            return
+
+        groups = list(dict.fromkeys(pi.groups))  # remove duplicates
+        self._node_groups[pi.addr] = groups
+        for g in groups:
+            index = self._group_index.get(g)
+            if index is None:
+                index = self._group_index[g] = SubscriptionIndex()
+            index.add(pi.addr, pi.paths)
+        if len(groups) > 0:
+            self._name_map.setdefault(groups[0], {})[pi.addr] = None
+
+    def _unindex_peer(self, addr):
+        for index in self._path_index.values():
+            index.remove(addr)
+
+        groups = self._node_groups.pop(addr, None)
+        if groups is None:
+            return
+        for g in groups:
+            index = self._group_index[g]
+            index.remove(addr)
+            if len(index) == 0:
+                del self._group_index[g]
+        if len(groups) > 0:
+            names = self._name_map[groups[0]]
+            del names[addr]
+            if len(names) == 0:
+                del self._name_map[groups[0]]
 
     def get_peer(self, addr) -> PeerInfo:
         """
@@ -68,34 +192,81 @@ class PeerRegistry:
         if addr not in self.addr_peer_map:
             raise LookupError()
         
-        logging.info(f"REMOVED: Peer {addr} from registry")
-        del self.addr_peer_map[addr]
-        self._update_local()
-        
+        _log_peers("REMOVED: Peer %s from registry", addr)
+        self._remove(addr)
+
+    def _remove(self, addr):
+        pi = self.addr_peer_map.pop(addr)
+        self._peer_digests.pop(addr, None)
+        self._expiry_t.pop(addr, None)
+        self._unindex_peer(addr)
+        self._update_local(pi, None)
+        self.generation += 1
 
-    def add_peer(self, pi: PeerInfo):
+    def _schedule_expiry(self, pi: PeerInfo):
+        t = pi.expiry_t()
+        if t is None:
+            return
+        self._expiry_t[pi.addr] = t
+        heapq.heappush(self._expiry_heap, (t, pi.addr))
+
+    def refresh_if_unchanged(self, addr, digest: bytes) -> bool:
         """
-        Add PeerInfo to registry
+        Refreshes the peer and returns True if the digest matches the payload of its last update
+        """
+        if digest is None or self._peer_digests.get(addr) != digest:
+            return False
+        self.addr_peer_map[addr].refresh()
+        self.updates_skipped += 1
+        return True
+
+    def add_peer(self, pi: PeerInfo, digest: bytes = None):
+        """
+        Add PeerInfo to registry. digest identifies the payload the PeerInfo was created from (see refresh_if_unchanged)
         """
         if pi.addr not in self.addr_peer_map:
-            logging.info(f"ADDED: Peer {pi.addr} to registry")
+            _log_peers("ADDED: Peer %s to registry", pi.addr)
         else:
             # This is rather spammy running multiple nodes
             # logging.debug(f"Peer {pi.addr} updated registry")
             pass
+        old = self.addr_peer_map.get(pi.addr)
         self.addr_peer_map[pi.addr] = pi
+        if digest is None:
+            self._peer_digests.pop(pi.addr, None)
+        else:
+            self._peer_digests[pi.addr] = digest
+        self.updates_applied += 1
+        self._unindex_peer(pi.addr)
+        self._index_peer(pi)
+        # An existing entry expires earlier and is rescheduled in cleanup
+        if pi.addr not in self._expiry_t:
+            self._schedule_expiry(pi)
 
-        self._update_local()
+        self._update_local(old, pi)
+        self.generation += 1
 
-    def cleanup(self):
+    def cleanup(self, now: float = None):
         """
-        Remove expired peerinfos from registry
+        Remove expired peerinfos from registry. Only peers whose scheduled expiry time has passed are checked.
         """
-        for pi in list(self.addr_peer_map.values()):
-            if pi.is_expired():
-                logging.info(f"EXPIRED: Removing Peer {pi.addr} from registry")
-                del self.addr_peer_map[pi.addr]
+        if now is None:
+            now = time.time()
+        heap = self._expiry_heap
+        while len(heap) > 0 and heap[0][0] <= now:
+            t, addr = heapq.heappop(heap)
+            if self._expiry_t.get(addr) != t:
+                continue  # stale entry of a removed or rescheduled peer
+            del self._expiry_t[addr]
+            pi = self.addr_peer_map[addr]
+            if pi.is_expired(now):
+                _log_peers("EXPIRED: Removing Peer %s from registry", addr)
+                self._remove(addr)
+            else:
+                # refreshed since the entry was scheduled (or changed to a client)
+                self._schedule_expiry(pi)
 
     def set_name(self, name:str):
         self._node_name = name
-        self._update_local()
+        self._update_local_groups()
+        self.generation += 1
@@ -0,0 +1,37 @@
+import cProfile
+import logging
+
+
+class Profiler:
+    """
+    Runtime switchable profiling: timing of message handlers (see Node) and, if an output path is given,
+    a cProfile capture of everything running in the event loop thread which is written when profiling stops.
+    """
+
+    def __init__(self, path: str = None) -> None:
+        self.path = path
+        self.timing = False
+        self._profile = None  # type: cProfile.Profile
+
+    @property
+    def capturing(self):
+        return self._profile is not None
+
+    def start(self):
+        self.timing = True
+        if self.path is not None and self._profile is None:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+            logging.info(f"Started profiling, writing profile to {self.path} when stopped")
+
+    def stop(self):
+        self.timing = False
+        if self._profile is None:
+            return
+        self._profile.disable()
+        try:
+            self._profile.dump_stats(self.path)
+            logging.info(f"Wrote profile to {self.path}")
+        except OSError as e:
+            logging.error(f"Unable to write profile: {e}")
+        self._profile = None
@@ -1,9 +1,16 @@
 from argparse import ArgumentError
+from functools import lru_cache
 import hashlib
+import re
 from typing import *
 
 from pythonosc.osc_message_builder import OscMessageBuilder
 
+# Prefix of OSC bundle datagrams, followed by an 8 byte timetag
+BUNDLE_PREFIX = b"#bundle\x00"
+# Raw timetag of bundles which should be handled immediately
+IMMEDIATELY_TIMETAG = (1).to_bytes(8, "big")
+
 # Groups
 ALL_NODES_GROUP = "ALL"
 
@@ -16,6 +23,18 @@ P2PSC_PREFIX = "p2psc"
 # Request peerinfo
 PEERINFO = '/'+P2PSC_PREFIX + "/peerinfo"
 
+# Changes of a node's peerinfo since the previous version (sent between nodes)
+PEERINFO_DELTA = PEERINFO + "/delta"
+
+# Current peerinfo version of a node (sent between nodes if nothing changed)
+PEERINFO_VERSION = PEERINFO + "/version"
+
+# Part of a peerinfo (or peerinfo delta) message which is too large for a single datagram
+PEERINFO_CHUNK = PEERINFO + "/chunk"
+
+# Paths of messages which synchronize peerinfos
+PEERINFO_PATHS = {PEERINFO, PEERINFO_DELTA, PEERINFO_VERSION, PEERINFO_CHUNK}
+
 # request peerinfo for all nodes except local node
 PEERINFOS = '/'+P2PSC_PREFIX + "/peerinfos"
 
@@ -32,6 +51,15 @@ GROUPS = '/'+P2PSC_PREFIX + "/groups"
 # Get paths for node (if no node is provided returns local paths)
 GET_PATHS = '/'+P2PSC_PREFIX + "/paths"
 
+# Get runtime metrics of the node as pairs of name and value
+STATS = '/'+P2PSC_PREFIX + "/stats"
+
+# Enable (1) or disable (0) profiling of the node, replies with the current state
+PROFILE = '/'+P2PSC_PREFIX + "/profile"
+
+# Dumps the latency traces of the node, replies with a summary of the traces
+TRACE = '/'+P2PSC_PREFIX + "/trace"
+
 
 
 
@@ -49,6 +77,53 @@ def osc_dgram(path, args):
     return mb.build().dgram
 
 
+def osc_string(s: str):
+    """ Encodes a string as null-terminated OSC-string, padded to a multiple of 4 bytes """
+    b = s.encode()
+    return b + b"\x00" * (4 - len(b) % 4)
+
+
+def replace_address(dgram: bytes, address: str):
+    """ Returns a copy of the message datagram with a new address. 
+    Type tags and arguments are copied as they are, without decoding/encoding them """
+    end = dgram.index(b"\x00")
+    return b"".join((osc_string(address), memoryview(dgram)[end + 4 - end % 4:]))
+
+
+def bundle_timetag(dgram: bytes):
+    """ Returns the raw (8 byte) timetag of an OSC bundle datagram """
+    return dgram[len(BUNDLE_PREFIX):len(BUNDLE_PREFIX) + 8]
+
+
+def bundle_dgram(timetag: bytes, contents: List[bytes]):
+    """ Builds an OSC bundle datagram from a raw timetag and encoded messages/bundles """
+    parts = [BUNDLE_PREFIX, timetag]
+    for c in contents:
+        parts.append(len(c).to_bytes(4, "big"))
+        parts.append(c)
+    return b"".join(parts)
+
+
+def pack_bundles(timetag: bytes, contents: List[bytes], max_size: int) -> List[bytes]:
+    """
+    Packs encoded messages into as few bundles as possible, each at most max_size bytes.
+    Contents which don't fit into a bundle on their own are packed into a separate bundle.
+    """
+    bundles = []
+    current = []
+    size = len(BUNDLE_PREFIX) + len(timetag)
+    for c in contents:
+        if len(current) > 0 and size + 4 + len(c) > max_size:
+            bundles.append(bundle_dgram(timetag, current))
+            current = []
+            size = len(BUNDLE_PREFIX) + len(timetag)
+        current.append(c)
+        size += 4 + len(c)
+    if len(current) > 0 or len(bundles) == 0:
+        bundles.append(bundle_dgram(timetag, current))
+    return bundles
+
+
 def remove_group_from_path(path: str):
     return '/'+'/'.join(path.split('/')[2:])
 
@@ -57,6 +132,38 @@ def get_group_from_path(path: str):
     return path.split('/')[1]
 
 
+def is_pattern(path: str):
+    """ Returns true if the given path contains OSC wildcard characters """
+    return '*' in path or '?' in path
+
+
+@lru_cache(maxsize=4096)
+def pattern_regex(pattern: str):
+    """ Returns a compiled regex for an (incoming) OSC address pattern. 
+    The regex must match the full subscribed path. """
+    # NOTE: Almost 1:1 copy from pythonosc, see: https://github.com/attwad/python-osc
+    # '?' in the OSC Address Pattern matches any single character.
+    # Let's consider numbers and _ "characters" too here, it's not said
+    # explicitly in the specification but it sounds good.
+    pattern = re.escape(pattern).replace('\\?', '\\w?')
+    # '*' in the OSC Address Pattern matches any sequence of zero or more
+    # characters.
+    pattern = pattern.replace('\\*', '[\\w|\\+]*')
+    # The rest of the syntax in the specification is like the re module so
+    # we're fine.
+    return re.compile(pattern + '$')
+
+
+@lru_cache(maxsize=4096)
+def subscription_regex(path: str):
+    """ Returns a compiled regex for a subscribed path containing wildcards ('*').
+    The regex matches the beginning of incoming paths, i.e. "/test*" matches any path starting with "/test" """
+    try:
+        return re.compile(path.replace('*', '[^/]*?/*'))
+    except re.error:
+        return re.compile(re.escape(path).replace('\\*', '[^/]*?/*'))
+
+
 def str_to_list(s: str):
     """ Convert a space seperated list string to list"""
     return list(filter(''.__ne__, s.split(STR_LIST_SEP)))
@@ -67,16 +174,45 @@ def list_to_str(groups: List[str]):
     return STR_LIST_SEP.join(groups)
 
 
-def peerinfo_args(ptype: int, addr: Tuple[str, int], groups: List[str], paths: List[str]):
-    """ Converts peer data into a list for osc_args. groups and paths are formatted as space-seperated lists (proto.STR_LIST_SEP) """
+def peerinfo_args(ptype: int, addr: Tuple[str, int], groups: List[str], paths: List[str], version: int = None):
+    """ Converts peer data into a list for osc_args. groups and paths are formatted as space-seperated lists (proto.STR_LIST_SEP).
+    The peerinfo version is only added for nodes """
     if groups is None:
         raise ArgumentError(
             f"Trying to convert non-sharable Node to osc_args {addr}")
-    return [ptype, STR_LIST_SEP.join(groups), STR_LIST_SEP.join(paths)]
+    args = [ptype, STR_LIST_SEP.join(groups), STR_LIST_SEP.join(paths)]
+    if version is not None:
+        args.append(version)
+    return args
 
 
 def is_valid_peerinfo(args):
-    return len(args) == 3 and type(args[0]) == int and type(args[1]) == str and type(args[2]) == str
+    return (len(args) in (3, 4) and type(args[0]) == int and type(args[1]) == str and type(args[2]) == str
+            and (len(args) == 3 or type(args[3]) == int))
+
+
+def peerinfo_delta_args(version: int, groups: List[str], added_paths: List[str], removed_paths: List[str]):
+    """ Converts a peerinfo delta into a list for osc_args. Groups are always sent completely """
+    return [version, STR_LIST_SEP.join(groups), STR_LIST_SEP.join(added_paths), STR_LIST_SEP.join(removed_paths)]
+
+
+def is_valid_peerinfo_delta(args):
+    return len(args) == 4 and type(args[0]) == int and all(type(a) == str for a in args[1:])
+
+
+def is_valid_peerinfo_version(args):
+    return len(args) == 1 and type(args[0]) == int
+
+
+def is_valid_peerinfo_chunk(args):
+    """ Chunk arguments: transfer id, index, number of chunks, flags, data """
+    return (len(args) == 5 and all(type(a) == int for a in args[:4]) and type(args[4]) == bytes
+            and 0 <= args[1] < args[2])
+
+
+def payload_digest(data: bytes):
+    """ Returns a short digest of a message payload, used to detect unchanged messages """
+    return hashlib.blake2b(data, digest_size=16).digest()
 
 
 def hash(addr: Tuple[str, int]):
@@ -0,0 +1,100 @@
+import time
+from typing import Dict, Tuple
+
+from p2psc import proto
+
+# Maximum number of sender and group buckets each, the oldest bucket is removed to add a new one
+MAX_BUCKETS = 10000
+
+
+class TokenBucket:
+    """
+    Allows rate messages per second on average and bursts of up to burst messages
+    """
+    __slots__ = ("rate", "burst", "tokens", "t")
+
+    def __init__(self, rate: float, burst: float, now: float) -> None:
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = self.burst
+        self.t = now
+
+    def consume(self, now: float) -> bool:
+        """
+        Takes a token and returns True, or returns False if there is none left
+        """
+        tokens = self.tokens + (now - self.t) * self.rate
+        self.t = now
+        if tokens > self.burst:
+            tokens = self.burst
+        if tokens < 1:
+            self.tokens = tokens
+            return False
+        self.tokens = tokens - 1
+        return True
+
+    def is_full(self, now: float) -> bool:
+        """
+        Returns True if the bucket refilled to its burst size, a new bucket would behave the same
+        """
+        return self.tokens + (now - self.t) * self.rate >= self.burst
+
+
+class RateLimiter:
+    """
+    Limits the messages forwarded for each sender and for each group using token buckets.
+    Limits are dicts with "rate" (messages per second) and "burst" (defaults to one second worth of messages).
+    group_limits maps group names to limits, the limit of "*" applies to each group without its own limit.
+    """
+
+    def __init__(self, sender_limit: dict = None, group_limits: Dict[str, dict] = None) -> None:
+        self._sender_limit = None if sender_limit is None else _parse_limit(sender_limit)
+        self._group_limits = {g: _parse_limit(l) for g, l in (group_limits or {}).items()}
+        self._senders = {}  # type: Dict[Tuple[str, int], TokenBucket]
+        self._groups = {}  # type: Dict[str, TokenBucket]
+
+    def allow(self, addr: Tuple[str, int], path: str, now: float = None) -> bool:
+        """
+        Returns True if a message from addr to path may be forwarded
+        """
+        if now is None:
+            now = time.monotonic()
+        if self._sender_limit is not None:
+            bucket = self._senders.get(addr)
+            if bucket is None:
+                bucket = _add_bucket(self._senders, addr, self._sender_limit, now)
+            if not bucket.consume(now):
+                return False
+        if len(self._group_limits) > 0:
+            group = proto.get_group_from_path(path)
+            bucket = self._groups.get(group)
+            if bucket is None:
+                limit = self._group_limits.get(group, self._group_limits.get("*"))
+                if limit is None:
+                    return True
+                bucket = _add_bucket(self._groups, group, limit, now)
+            if not bucket.consume(now):
+                return False
+        return True
+
+    def prune(self, now: float = None):
+        """
+        Removes the buckets which are full again, they are recreated when needed
+        """
+        if now is None:
+            now = time.monotonic()
+        for buckets in [self._senders, self._groups]:
+            for key in [k for k, b in buckets.items() if b.is_full(now)]:
+                del buckets[key]
+
+
+def _add_bucket(buckets: dict, key, limit: Tuple[float, float], now: float) -> TokenBucket:
+    if len(buckets) >= MAX_BUCKETS:
+        del buckets[next(iter(buckets))]
+    bucket = buckets[key] = TokenBucket(*limit, now)
+    return bucket
+
+
+def _parse_limit(limit: dict) -> Tuple[float, float]:
+    rate = float(limit["rate"])
+    return rate, float(limit.get("burst", rate))
@@ -0,0 +1,51 @@
+from collections import OrderedDict
+from typing import List, Tuple
+
+from p2psc.peerInfo import PeerType
+from p2psc.peerRegistry import PeerRegistry
+
+
+class RouteCache:
+    """
+    Bounded LRU cache for the destination addresses of an OSC path. 
+    Entries are keyed by (path, peer type of the destinations) and the whole cache is invalidated 
+    whenever the generation of the underlying PeerRegistry changes.
+    """
+    DEFAULT_SIZE = 1024
+
+    def __init__(self, registry: PeerRegistry, maxsize: int = DEFAULT_SIZE) -> None:
+        self._registry = registry
+        self._maxsize = maxsize
+        self._routes = OrderedDict()  # type: OrderedDict[Tuple[str, PeerType], List[Tuple[str, int]]]
+        self._generation = registry.generation
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._routes)
+
+    def get(self, path: str, filter_type: PeerType) -> List[Tuple[str, int]]:
+        """
+        Returns the addresses of all peers with the given type which subscribe the given path
+        """
+        if self._generation != self._registry.generation:
+            self._routes.clear()
+            self._generation = self._registry.generation
+
+        key = (path, filter_type)
+        addrs = self._routes.get(key)
+        if addrs is not None:
+            self.hits += 1
+            self._routes.move_to_end(key)
+            return addrs
+
+        self.misses += 1
+        addrs = [pi.addr for pi in self._registry.get_by_path(path, filter_type=filter_type)]
+        if self._maxsize > 0:
+            self._routes[key] = addrs
+            if len(self._routes) > self._maxsize:
+                self._routes.popitem(last=False)
+        return addrs
+
+    def clear(self):
+        self._routes.clear()
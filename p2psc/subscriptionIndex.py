@@ -0,0 +1,170 @@
+import re
+from typing import Dict, Hashable, Iterable, List, Tuple
+
+from p2psc import proto
+
+
+class _TrieNode:
+    __slots__ = ("children", "peers", "wildcards")
+
+    def __init__(self) -> None:
+        self.children = {}  # type: Dict[str, _TrieNode]
+        # Peers subscribing the literal path ending at this node (addr -> refcount)
+        self.peers = {}  # type: Dict[Hashable, int]
+        # Wildcard subscriptions whose literal prefix ends at this node (path -> {addr -> refcount})
+        self.wildcards = {}  # type: Dict[str, Dict[Hashable, int]]
+
+    def is_empty(self):
+        return not (self.children or self.peers or self.wildcards)
+
+
+def _literal_prefix_len(segments: List[str]):
+    """ Returns the number of leading path segments which do not contain any regex syntax """
+    for i, seg in enumerate(segments):
+        if re.escape(seg) != seg:
+            return i
+    return len(segments)
+
+
+def _incr(d: Dict[Hashable, int], addr):
+    d[addr] = d.get(addr, 0) + 1
+
+
+def _decr(d: Dict[Hashable, int], addr):
+    if d[addr] <= 1:
+        del d[addr]
+    else:
+        d[addr] -= 1
+
+
+class SubscriptionIndex:
+    """
+    Per-segment trie over all paths subscribed by a set of peers.
+
+    Literal paths are stored at the trie node of their last segment. Wildcard subscriptions (containing '*')
+    are stored at the node of their longest literal prefix and are only evaluated for incoming paths which
+    share this prefix. Incoming OSC address patterns ('?', '*') are matched segment by segment.
+    """
+
+    def __init__(self) -> None:
+        self._root = _TrieNode()
+        self._peer_paths = {}  # type: Dict[Hashable, Tuple[str, ...]]
+
+    def __len__(self):
+        return len(self._peer_paths)
+
+    def __contains__(self, addr):
+        return addr in self._peer_paths
+
+    def peers(self):
+        """
+        Returns the addresses of all indexed peers
+        """
+        return self._peer_paths.keys()
+
+    def add(self, addr, paths: Iterable[str]):
+        """
+        Index all paths for the given peer, replacing previously indexed paths
+        """
+        self.remove(addr)
+        paths = tuple(paths)
+        self._peer_paths[addr] = paths
+        for p in paths:
+            self._insert(addr, p)
+
+    def remove(self, addr):
+        """
+        Remove all paths for the given peer from the index (no-op for unknown peers)
+        """
+        paths = self._peer_paths.pop(addr, None)
+        if paths is None:
+            return
+        for p in paths:
+            self._delete(addr, p)
+
+    def match(self, path: str) -> Dict[Hashable, int]:
+        """
+        Returns the addresses of all peers subscribing the given path (without group) as ordered set
+        """
+        found = {}
+        pattern = proto.is_pattern(path)
+        segments = path.split('/')
+
+        # Wildcard subscriptions are matched along the raw path
+        node = self._root
+        for seg in segments:
+            self._match_wildcards(node, path, found)
+            node = node.children.get(seg)
+            if node is None:
+                break
+        else:
+            self._match_wildcards(node, path, found)
+            if not pattern:
+                found.update(node.peers)
+
+        if pattern:
+            self._match_pattern(self._root, segments, 0, found)
+        return found
+
+    @staticmethod
+    def _match_wildcards(node: _TrieNode, path: str, found: Dict):
+        for p, peers in node.wildcards.items():
+            if proto.subscription_regex(p).match(path):
+                found.update(peers)
+
+    def _match_pattern(self, node: _TrieNode, segments: List[str], i: int, found: Dict):
+        if i == len(segments):
+            found.update(node.peers)
+            return
+        seg = segments[i]
+        if not proto.is_pattern(seg):
+            child = node.children.get(seg)
+            if child is not None:
+                self._match_pattern(child, segments, i + 1, found)
+            return
+        regex = proto.pattern_regex(seg)
+        for key, child in node.children.items():
+            if regex.match(key):
+                self._match_pattern(child, segments, i + 1, found)
+
+    def _insert(self, addr, path: str):
+        segments = path.split('/')
+        wildcard = '*' in path
+        if wildcard:
+            segments = segments[:_literal_prefix_len(segments)]
+
+        node = self._root
+        for seg in segments:
+            child = node.children.get(seg)
+            if child is None:
+                child = node.children[seg] = _TrieNode()
+            node = child
+
+        if wildcard:
+            _incr(node.wildcards.setdefault(path, {}), addr)
+        else:
+            _incr(node.peers, addr)
+
+    def _delete(self, addr, path: str):
+        segments = path.split('/')
+        wildcard = '*' in path
+        if wildcard:
+            segments = segments[:_literal_prefix_len(segments)]
+
+        trail = [self._root]
+        for seg in segments:
+            trail.append(trail[-1].children[seg])
+
+        node = trail[-1]
+        if wildcard:
+            _decr(node.wildcards[path], addr)
+            if len(node.wildcards[path]) == 0:
+                del node.wildcards[path]
+        else:
+            _decr(node.peers, addr)
+
+        # Prune empty nodes
+        for i in range(len(segments), 0, -1):
+            if not trail[i].is_empty():
+                break
+            del trail[i - 1].children[segments[i - 1]]
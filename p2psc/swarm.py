@@ -0,0 +1,350 @@
+"""
+Runs a swarm of nodes on loopback ports with synthetic clients, e.g. to reproduce the behaviour of
+larger networks on a single machine:
+
+    p2psc-swarm -n 16 -m 64 --processes 4
+
+Nodes are bound to consecutive ports starting at the base port and discover each other through
+StaticDiscovery instead of zeroconf. Clients are attached to the nodes in turn, subscribe random
+paths out of a shared pool and send messages to random paths of the pool at a fixed rate.
+The report contains the time until all nodes know the paths of all other nodes (convergence),
+the ratio of delivered to expected messages and the CPU time used by each node.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import random
+import sys
+import time
+from typing import Dict, List, Tuple
+
+import zeroconf
+
+from p2psc import proto
+from p2psc.common.logging import setup_logging
+from p2psc.node import Node
+from p2psc.peerInfo import PeerType
+
+_WAIT_INTERVAL = 0.05  # in seconds
+
+
+class SwarmNode(Node):
+    """
+    Node which measures the CPU time spent handling messages
+    """
+
+    def __init__(self, config) -> None:
+        super().__init__(config)
+        self.cpu_time = 0.0
+        self.messages = 0
+
+    def on_osc_sync(self, addr, message):
+        start = time.thread_time()
+        super().on_osc_sync(addr, message)
+        self.cpu_time += time.thread_time() - start
+        self.messages += 1
+
+
+class StaticDiscovery:
+    """
+    Stand-in for zeroconf which announces a fixed set of node addresses to local nodes,
+    repeating the announcement regularly like zeroconf service updates
+    """
+
+    def __init__(self, addrs: List[Tuple[str, int]], interval: float) -> None:
+        self._addrs = addrs
+        self._interval = interval
+        self._nodes = []  # type: List[Node]
+        self._task = None
+
+    def add(self, node: Node):
+        self._nodes.append(node)
+
+    def start(self):
+        self._task = asyncio.ensure_future(self.__loop())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    def announce(self, state: zeroconf.ServiceStateChange):
+        for node in self._nodes:
+            for addr in self._addrs:
+                if addr != node._addr:
+                    node._zconf_node_callback(addr, state)
+
+    async def __loop(self):
+        self.announce(zeroconf.ServiceStateChange.Added)
+        while True:
+            await asyncio.sleep(self._interval)
+            self.announce(zeroconf.ServiceStateChange.Updated)
+
+
+class SwarmClient(asyncio.DatagramProtocol):
+    """
+    Synthetic client which registers at a node and counts received messages
+    """
+
+    def __init__(self, node_addr: Tuple[str, int], groups: List[str], paths: List[str]) -> None:
+        self.node_addr = node_addr
+        self.groups = groups
+        self.paths = paths
+        self.received = 0
+        self.transport = None  # type: asyncio.DatagramTransport
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.transport.sendto(proto.osc_dgram(proto.PEERINFO, proto.peerinfo_args(
+            PeerType.client.value, None, self.groups, self.paths)), self.node_addr)
+
+    def datagram_received(self, data, addr):
+        self.received += 1
+
+    def send(self, path: str, seq: int):
+        self.transport.sendto(proto.osc_dgram(f"/{proto.ALL_NODES_GROUP}{path}", [seq]), self.node_addr)
+
+
+def node_addrs(num_nodes: int, base_port: int) -> List[Tuple[str, int]]:
+    return [("127.0.0.1", base_port + i) for i in range(num_nodes)]
+
+
+def client_subscriptions(args) -> List[Tuple[int, List[str]]]:
+    """
+    Returns the node index and the subscribed paths of each client
+    """
+    rnd = random.Random(args.seed)
+    pool = path_pool(args)
+    return [(i % args.nodes, rnd.sample(pool, min(args.paths, len(pool)))) for i in range(args.clients)]
+
+
+def path_pool(args) -> List[str]:
+    return [f"/swarm/p{i}" for i in range(args.path_pool)]
+
+
+def expected_node_paths(args) -> Dict[int, set]:
+    paths = {i: set() for i in range(args.nodes)}
+    for node, p in client_subscriptions(args):
+        paths[node].update(p)
+    return paths
+
+
+def is_converged(node: Node, addrs: List[Tuple[str, int]], expected: Dict[int, set]):
+    """
+    Returns True if the node knows the paths of all other nodes
+    """
+    for i, addr in enumerate(addrs):
+        if addr == node._addr:
+            continue
+        pi = node._registry.addr_peer_map.get(addr)
+        if pi is None or pi.version is None or set(pi.paths) != expected[i]:
+            return False
+    return True
+
+
+async def wait_for(cond, timeout: float):
+    start = time.perf_counter()
+    while not cond():
+        if time.perf_counter() - start > timeout:
+            return False
+        await asyncio.sleep(_WAIT_INTERVAL)
+    return True
+
+
+async def run_swarm(args, indexes: List[int], barrier=None) -> dict:
+    """
+    Runs the nodes with the given indexes and their clients, returns the measurements of this part of the swarm
+    """
+    loop = asyncio.get_running_loop()
+    addrs = node_addrs(args.nodes, args.base_port)
+    nodes = {}  # type: Dict[int, SwarmNode]
+    for i in indexes:
+        nodes[i] = SwarmNode({"name": f"node{i}", "zeroconf": False, "ip": addrs[i][0], "bind_ip": addrs[i][0],
+                              "port": addrs[i][1], "update_interval": args.interval})
+    tasks = [asyncio.ensure_future(n.serve()) for n in nodes.values()]
+    if not await wait_for(lambda: all(n._transport is not None for n in nodes.values()), 5):
+        raise RuntimeError("Failed to start nodes")
+    if barrier is not None:
+        await loop.run_in_executor(None, barrier.wait)
+
+    # Discovery and client registration
+    start = time.perf_counter()
+    discovery = StaticDiscovery(addrs, args.interval)
+    for n in nodes.values():
+        discovery.add(n)
+    discovery.start()
+    clients = []  # type: List[Tuple[int, SwarmClient]]
+    for node_index, paths in client_subscriptions(args):
+        if node_index in nodes:
+            _, client = await loop.create_datagram_endpoint(
+                lambda: SwarmClient(addrs[node_index], [], paths), local_addr=("127.0.0.1", 0))
+            clients.append((node_index, client))
+
+    expected_paths = expected_node_paths(args)
+    converged = await wait_for(lambda: all(is_converged(n, addrs, expected_paths) for n in nodes.values()),
+                               args.timeout)
+    convergence_t = time.perf_counter() - start if converged else None
+    if barrier is not None:
+        await loop.run_in_executor(None, barrier.wait)
+
+    # Load
+    rnd = random.Random(args.seed + indexes[0] + 1)
+    pool = path_pool(args)
+    sent = {}  # type: Dict[str, Dict[str, int]] node index -> path -> number of messages
+    for n in nodes.values():
+        n.cpu_time = 0.0
+        n.messages = 0
+    load_start = time.perf_counter()
+    due = 0.0
+    seq = 0
+    while time.perf_counter() - load_start < args.duration:
+        due += args.rate * _WAIT_INTERVAL
+        while due >= 1:
+            due -= 1
+            for node_index, client in clients:
+                path = rnd.choice(pool)
+                client.send(path, seq)
+                per_node = sent.setdefault(str(node_index), {})
+                per_node[path] = per_node.get(path, 0) + 1
+                seq += 1
+        await asyncio.sleep(_WAIT_INTERVAL)
+    await asyncio.sleep(max(1.0, args.interval))  # wait for messages in flight
+
+    result = {
+        "convergence_t": convergence_t,
+        "sent": sent,
+        "received": sum(c.received for _, c in clients),
+        "nodes": {str(i): {"cpu_time": n.cpu_time, "messages": n.messages} for i, n in nodes.items()},
+    }
+
+    discovery.stop()
+    for _, c in clients:
+        c.transport.close()
+    for n in nodes.values():
+        n.stop()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return result
+
+
+def _run_process(args, indexes: List[int], barrier, results):
+    setup_logging(args.loglevel)
+    try:
+        results.put(asyncio.run(run_swarm(args, indexes, barrier)))
+    except Exception as e:
+        barrier.abort()
+        results.put({"error": repr(e)})
+
+
+def run_processes(args) -> List[dict]:
+    """
+    Runs the swarm in args.processes processes, returns the measurements of all processes
+    """
+    num = min(args.processes, args.nodes)
+    if num <= 1:
+        return [asyncio.run(run_swarm(args, list(range(args.nodes))))]
+    ctx = multiprocessing.get_context("spawn")
+    barrier = ctx.Barrier(num)
+    results = ctx.Queue()
+    processes = [ctx.Process(target=_run_process, args=(args, list(range(i, args.nodes, num)), barrier, results))
+                 for i in range(num)]
+    for p in processes:
+        p.start()
+    parts = [results.get() for _ in processes]
+    for p in processes:
+        p.join()
+    for part in parts:
+        if "error" in part:
+            raise RuntimeError(f"Swarm process failed: {part['error']}")
+    return parts
+
+
+def summarize(args, parts: List[dict]) -> dict:
+    """
+    Combines the measurements of all processes
+    """
+    # Messages from clients are forwarded to the clients of all other nodes which subscribe the path
+    subscribers = {}  # type: Dict[Tuple[int, str], int]
+    for node_index, paths in client_subscriptions(args):
+        for p in paths:
+            subscribers[(node_index, p)] = subscribers.get((node_index, p), 0) + 1
+    sent = 0
+    expected = 0
+    for part in parts:
+        for node_index, paths in part["sent"].items():
+            for p, count in paths.items():
+                sent += count
+                expected += count * sum(subscribers.get((i, p), 0) for i in range(args.nodes) if i != int(node_index))
+    received = sum(part["received"] for part in parts)
+    convergence = [part["convergence_t"] for part in parts]
+    nodes = {}
+    for part in parts:
+        nodes.update(part["nodes"])
+    return {
+        "nodes": args.nodes,
+        "clients": args.clients,
+        "processes": min(args.processes, args.nodes),
+        "convergence_t": None if None in convergence else max(convergence),
+        "sent": sent,
+        "expected": expected,
+        "received": received,
+        "delivery_ratio": received / expected if expected > 0 else None,
+        "node_stats": {i: dict(s, cpu_percent=s["cpu_time"] / args.duration * 100)
+                       for i, s in sorted(nodes.items(), key=lambda x: int(x[0]))},
+    }
+
+
+def print_report(report: dict):
+    conv = report["convergence_t"]
+    print(f"{report['nodes']} nodes, {report['clients']} clients, {report['processes']} processes")
+    print(f"Convergence:    {'not converged' if conv is None else f'{conv:.2f} s'}")
+    ratio = report["delivery_ratio"]
+    print(f"Delivery ratio: {'-' if ratio is None else f'{ratio * 100:.2f} %'} "
+          f"({report['received']} of {report['expected']} expected, {report['sent']} sent)")
+    print(f"{'node':>6} {'messages':>9} {'cpu s':>8} {'cpu %':>6}")
+    for i, s in report["node_stats"].items():
+        print(f"{i:>6} {s['messages']:9} {s['cpu_time']:8.3f} {s['cpu_percent']:6.1f}")
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description="Runs a swarm of p2psc nodes and synthetic clients on loopback")
+    parser.add_argument("-n", "--nodes", dest="nodes", type=int, default=4, help="Number of nodes")
+    parser.add_argument("-m", "--clients", dest="clients", type=int, default=16, help="Number of clients")
+    parser.add_argument("--processes", dest="processes", type=int, default=1,
+                        help="Number of processes the nodes are distributed to")
+    parser.add_argument("--base-port", dest="base_port", type=int, default=40000, help="Port of the first node")
+    parser.add_argument("--paths", dest="paths", type=int, default=4, help="Number of paths subscribed by each client")
+    parser.add_argument("--path-pool", dest="path_pool", type=int, default=64, help="Number of distinct paths")
+    parser.add_argument("-r", "--rate", dest="rate", type=float, default=20,
+                        help="Messages per second sent by each client")
+    parser.add_argument("-d", "--duration", dest="duration", type=float, default=5,
+                        help="Duration of the load phase in seconds")
+    parser.add_argument("--interval", dest="interval", type=float, default=Node.DEFAULT_UPDATE_INTERVAL,
+                        help="Update interval of nodes and discovery in seconds")
+    parser.add_argument("--timeout", dest="timeout", type=float, default=30,
+                        help="Maximum time to wait for convergence in seconds")
+    parser.add_argument("--seed", dest="seed", type=int, default=1, help="Seed for subscriptions and messages")
+    parser.add_argument("-o", "--output", dest="output", default=None, help="Write the report to this JSON file")
+    parser.add_argument("-v", "--verbose", dest="loglevel", help="set loglevel to INFO",
+                        action="store_const", const=logging.INFO)
+    parser.add_argument("-vv", "--very-verbose", dest="loglevel", help="set loglevel to DEBUG",
+                        action="store_const", const=logging.DEBUG)
+    return parser.parse_args(args)
+
+
+def main(args):
+    args = parse_args(args)
+    setup_logging(args.loglevel)
+    report = summarize(args, run_processes(args))
+    print_report(report)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+def run():
+    main(sys.argv[1:])
+
+
+if __name__ == "__main__":
+    run()
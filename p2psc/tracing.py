@@ -0,0 +1,148 @@
+import math
+import time
+from array import array
+from typing import List, Tuple
+
+DEFAULT_SIZE = 8192  # number of trace records
+DEFAULT_SAMPLE_EVERY = 1
+
+# Stages of a record: waiting in the receive queue (with control priority), handling started to parsed,
+# parsed to routed, routed to last send and the total
+STAGES = ("queue", "parse", "route", "send", "total")
+_NUM_STAGES = len(STAGES)
+# Percentile ticks per halving distance to 100% in dumps (as in HdrHistogram)
+_TICKS_PER_HALF = 5
+
+
+class Tracer:
+    """
+    Records the forwarding latency of sampled datagrams in a preallocated ring buffer, older records are overwritten.
+    A datagram is traced by calling begin when handling it starts, then parsed, routed and end after the last send.
+    Datagrams which are not forwarded are discarded.
+    """
+
+    def __init__(self, size: int = DEFAULT_SIZE, sample_every: int = DEFAULT_SAMPLE_EVERY) -> None:
+        self.size = size
+        self.sample_every = max(1, sample_every)
+        self._times = array("d", bytes(8 * _NUM_STAGES * size))  # in seconds
+        self._fanout = array("L", bytes(array("L").itemsize * size))
+        self.recorded = 0  # total number of records, including overwritten ones
+        self.active = False  # true while the current datagram is traced
+        self._countdown = 1
+        self._t_recv = 0.0
+        self._t_start = 0.0
+        self._t_parsed = 0.0
+        self._t_routed = 0.0
+
+    def begin(self, received_t: float = None) -> bool:
+        """
+        Called when handling a received datagram starts, returns true if it is sampled.
+        received_t is the time (perf_counter) the datagram was received at if it was queued.
+        """
+        self._countdown -= 1
+        if self._countdown > 0:
+            return False
+        self._countdown = self.sample_every
+        self.active = True
+        self._t_start = self._t_parsed = self._t_routed = time.perf_counter()
+        self._t_recv = self._t_start if received_t is None else received_t
+        return True
+
+    def parsed(self):
+        self._t_parsed = time.perf_counter()
+
+    def routed(self):
+        self._t_routed = time.perf_counter()
+
+    def end(self, fanout: int):
+        """
+        Stores the record of the current datagram, which was sent to fanout destinations
+        """
+        if not self.active:
+            return
+        t = time.perf_counter()
+        self.active = False
+        i = self.recorded % self.size
+        times = self._times
+        j = i * _NUM_STAGES
+        times[j] = self._t_start - self._t_recv
+        times[j + 1] = self._t_parsed - self._t_start
+        times[j + 2] = self._t_routed - self._t_parsed
+        times[j + 3] = t - self._t_routed
+        times[j + 4] = t - self._t_recv
+        self._fanout[i] = fanout
+        self.recorded += 1
+
+    def discard(self):
+        self.active = False
+
+    def clear(self):
+        self.recorded = 0
+
+    def __len__(self):
+        return min(self.recorded, self.size)
+
+    def samples(self, stage: str) -> List[float]:
+        """
+        Returns the sorted durations of a stage (see STAGES) in seconds
+        """
+        k = STAGES.index(stage)
+        return sorted(self._times[k:len(self) * _NUM_STAGES:_NUM_STAGES])
+
+    def summary(self) -> List[Tuple[str, float]]:
+        """
+        Returns the p50, p99, p99.9 and maximum of every stage in microseconds as (name, value) pairs
+        """
+        values = [("traces", len(self))]
+        for stage in STAGES:
+            s = self.samples(stage)
+            for name, q in [("p50", 0.5), ("p99", 0.99), ("p999", 0.999), ("max", 1)]:
+                values.append((f"{stage}_{name}_us", _percentile(s, q) * 1e6))
+        return values
+
+    def dump(self) -> str:
+        """
+        Returns the percentile distribution of every stage in microseconds, in the text format of HdrHistogram
+        """
+        n = len(self)
+        mean_fanout = sum(self._fanout[:n]) / n if n > 0 else 0
+        lines = [f"# p2psc forwarding latency: {n} traces of {self.recorded} sampled datagrams "
+                 f"(1 in {self.sample_every}), mean fanout {mean_fanout:.2f}"]
+        for stage in STAGES:
+            s = [v * 1e6 for v in self.samples(stage)]
+            lines.append("")
+            lines.append(f"# {stage} (us)")
+            lines.append(f"{'Value':>12} {'Percentile':>14} {'TotalCount':>10} {'1/(1-Percentile)':>16}")
+            lines.append("")
+            for p in _percentile_ticks(n):
+                count = max(1, math.ceil(p * n))
+                inv = f"{1 / (1 - p):16.2f}" if p < 1 else ""
+                lines.append(f"{s[count - 1]:12.3f} {p:14.12f} {count:10d} {inv}".rstrip())
+            if n > 0:
+                mean = sum(s) / n
+                std = math.sqrt(sum((v - mean) ** 2 for v in s) / n)
+                lines.append(f"#[Mean    = {mean:12.3f}, StdDeviation   = {std:12.3f}]")
+                lines.append(f"#[Max     = {s[-1]:12.3f}, Total count    = {n:12d}]")
+        return "\n".join(lines) + "\n"
+
+
+def _percentile(s: List[float], q: float) -> float:
+    if len(s) == 0:
+        return 0
+    return s[max(0, math.ceil(q * len(s)) - 1)]
+
+
+def _percentile_ticks(n: int) -> List[float]:
+    """
+    Returns percentiles which get denser towards 100%, until less than one sample is left above them
+    """
+    if n == 0:
+        return []
+    ticks = [0.0]
+    half = 1
+    while n * 0.5 ** half >= 1:
+        for t in range(_TICKS_PER_HALF):
+            ticks.append(1 - 0.5 ** (half - 1 + (t + 1) / _TICKS_PER_HALF))
+        half += 1
+    ticks.append(1.0)
+    return ticks
@@ -0,0 +1,250 @@
+import asyncio
+import json
+import logging
+import multiprocessing
+import signal
+import socket
+import struct
+from multiprocessing.shared_memory import SharedMemory
+from typing import List, Tuple
+
+from p2psc.common.eventloop import setup_event_loop
+from p2psc.common.logging import configure_log_limits, setup_logging
+from p2psc.node import Node
+from p2psc.peerInfo import PeerInfo, PeerType
+from p2psc.peerProtocol import OscProtocolUdp
+from p2psc.peerRegistry import PeerRegistry
+from p2psc.routeCache import RouteCache
+
+DEFAULT_SNAPSHOT_SIZE = 1 << 22  # in bytes
+
+# Snapshot memory layout: sequence number (odd while writing), payload length, payload
+_HEADER = struct.Struct("<QI")
+_SEQ = struct.Struct("<Q")
+_MAX_READ_ATTEMPTS = 3
+
+# Header of control messages relayed from workers: IPv4 address and port of the original sender
+_RELAY_HEADER = struct.Struct("!4sH")
+
+
+def encode_registry(registry: PeerRegistry) -> bytes:
+    """
+    Returns a compact snapshot of all peers in the registry
+    """
+    peers = [[list(pi.addr), pi.type.value, pi.groups, pi.paths] for pi in registry.addr_peer_map.values()]
+    return json.dumps([registry._node_name, peers], separators=(",", ":")).encode()
+
+
+def decode_registry(data: bytes) -> PeerRegistry:
+    """
+    Returns a new registry from a snapshot created by encode_registry
+    """
+    name, peers = json.loads(data)
+    registry = PeerRegistry(name)
+    for addr, ptype, groups, paths in peers:
+        registry.add_peer(PeerInfo(tuple(addr), groups, paths, PeerType(ptype)))
+    return registry
+
+
+class SnapshotWriter:
+    """
+    Writes registry snapshots to a shared memory buffer. Readers detect concurrent writes using a
+    sequence number which is odd while a snapshot is written (seqlock).
+    """
+
+    def __init__(self, buf: memoryview) -> None:
+        self._buf = buf
+        self._seq = 0
+        _HEADER.pack_into(self._buf, 0, 0, 0)
+
+    def write(self, data: bytes):
+        if _HEADER.size + len(data) > len(self._buf):
+            raise ValueError(f"Registry snapshot ({len(data)} bytes) exceeds shared memory size")
+        self._seq += 1
+        _SEQ.pack_into(self._buf, 0, self._seq)
+        self._buf[_HEADER.size:_HEADER.size + len(data)] = data
+        self._seq += 1
+        _HEADER.pack_into(self._buf, 0, self._seq, len(data))
+
+
+class SnapshotReader:
+    """
+    Reads registry snapshots written by a SnapshotWriter
+    """
+
+    def __init__(self, buf: memoryview) -> None:
+        self._buf = buf
+        self._seq = 0
+
+    def changed(self) -> bool:
+        return _SEQ.unpack_from(self._buf, 0)[0] != self._seq
+
+    def read(self) -> bytes:
+        """
+        Returns the latest snapshot or None if there is no new (consistent) snapshot
+        """
+        for _ in range(_MAX_READ_ATTEMPTS):
+            seq, length = _HEADER.unpack_from(self._buf, 0)
+            if seq == self._seq or seq == 0:
+                return None
+            if seq % 2 == 1:  # snapshot is currently written
+                continue
+            data = bytes(self._buf[_HEADER.size:_HEADER.size + length])
+            if _SEQ.unpack_from(self._buf, 0)[0] == seq:
+                self._seq = seq
+                return data
+        return None
+
+
+def pack_relay(addr: Tuple[str, int], dgram: bytes) -> bytes:
+    return _RELAY_HEADER.pack(socket.inet_aton(addr[0]), addr[1]) + dgram
+
+
+def unpack_relay(data: bytes):
+    ip, port = _RELAY_HEADER.unpack_from(data, 0)
+    return (socket.inet_ntoa(ip), port), data[_RELAY_HEADER.size:]
+
+
+class RelayProtocol(asyncio.DatagramProtocol):
+    """
+    Receives control messages relayed by workers and passes them to the protocol of the control node
+    """
+
+    def __init__(self, protocol: OscProtocolUdp, node_port: int) -> None:
+        self._protocol = protocol
+        self._node_port = node_port
+
+    def datagram_received(self, data, addr):
+        # Workers send from the node port
+        if addr[1] != self._node_port:
+            logging.warning(f"Received relayed message from unknown sender: {addr}")
+            return
+        try:
+            src, dgram = unpack_relay(data)
+        except (struct.error, OSError):
+            logging.warning(f"Received invalid relayed message from {addr}")
+            return
+        self._protocol.datagram_received(dgram, src)
+
+
+class WorkerNode(Node):
+    """
+    Node which only routes messages, using the registry snapshots published by the control node.
+    Control messages are relayed to the control node.
+    """
+
+    def __init__(self, config, snapshot: SnapshotReader, control_addr: Tuple[str, int]) -> None:
+        config = dict(config)
+        config["zeroconf"] = False
+        config["workers"] = 0
+        super().__init__(config)
+        self._snapshot = snapshot
+        self._control_addr = control_addr
+        self._sync_registry()
+
+    def _sync_registry(self):
+        if not self._snapshot.changed():
+            return
+        data = self._snapshot.read()
+        if data is None:
+            return
+        self._registry = decode_registry(data)
+        self._routes = RouteCache(self._registry, self._config.get("route_cache_size", RouteCache.DEFAULT_SIZE))
+
+    async def serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._running = True
+        bind_addr = (self._config.get("bind_ip", "0.0.0.0"), self._addr[1])
+        self._transport, self._protocol = await self._create_endpoint(bind_addr, reuse_port=True)
+        self._set_write_buffer_limits()
+        await self._loop.create_future()  # run until the process is terminated
+
+    def on_osc_sync(self, addr, message):
+        self._sync_registry()
+        super().on_osc_sync(addr, message)
+
+    def _handle_local(self, addr, message):
+        self._transport.sendto(pack_relay(addr, message.dgram), self._control_addr)
+
+
+def _run_worker(index: int, config: dict, shm_name: str, control_addr: Tuple[str, int], loglevel: int):
+    setup_logging(loglevel)
+    configure_log_limits(config.get("log_limits", {}))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # The control process stops the workers
+    setup_event_loop(config.get("event_loop", "asyncio"))
+    shm = SharedMemory(name=shm_name)
+    node = WorkerNode(config, SnapshotReader(shm.buf), control_addr)
+    logging.info(f"Started routing worker {index}")
+    try:
+        asyncio.run(node.serve())
+    finally:
+        node._snapshot = None
+        shm.close()
+
+
+class WorkerPool:
+    """
+    Runs routing workers in separate processes, which bind the node port using SO_REUSEPORT.
+    The control node owns discovery and the registry and publishes registry snapshots to the workers.
+    """
+
+    def __init__(self, node: Node, num_workers: int, snapshot_size: int = DEFAULT_SNAPSHOT_SIZE) -> None:
+        self._node = node
+        self._num_workers = num_workers
+        self._snapshot_size = snapshot_size
+        self._processes = []  # type: List[multiprocessing.Process]
+        self._shm = None  # type: SharedMemory
+        self._writer = None  # type: SnapshotWriter
+        self._relay_transport = None  # type: asyncio.DatagramTransport
+        self._generation = None
+
+    async def start(self):
+        node = self._node
+        self._shm = SharedMemory(create=True, size=self._snapshot_size)
+        self._writer = SnapshotWriter(self._shm.buf)
+        self.publish(node._registry)
+
+        self._relay_transport, _ = await node._loop.create_datagram_endpoint(
+            lambda: RelayProtocol(node._protocol, node._addr[1]), local_addr=("127.0.0.1", 0))
+        control_addr = self._relay_transport.get_extra_info("sockname")
+
+        config = {}
+        for k in ["name", "ip", "bind_ip", "port", "route_cache_size", "udp_transport", "event_loop", "log_limits",
+                  "client_rate_limit", "group_rate_limits", "send_drop_policy", "write_buffer_high", "write_buffer_low",
+                  "control_priority", "data_queue_size"]:
+            if node._config.get(k) is not None:
+                config[k] = node._config.get(k)
+        ctx = multiprocessing.get_context("spawn")
+        for i in range(self._num_workers):
+            p = ctx.Process(target=_run_worker, args=(i, config, self._shm.name, control_addr,
+                            logging.getLogger().level), daemon=True)
+            p.start()
+            self._processes.append(p)
+        logging.info(f"Started {self._num_workers} routing workers")
+
+    def publish(self, registry: PeerRegistry):
+        """
+        Publishes a snapshot of the registry to the workers if it changed since the last call
+        """
+        if registry.generation == self._generation or self._writer is None:
+            return
+        self._generation = registry.generation
+        try:
+            self._writer.write(encode_registry(registry))
+        except ValueError as e:
+            logging.error(str(e))
+
+    def stop(self):
+        for p in self._processes:
+            p.terminate()
+        for p in self._processes:
+            p.join(timeout=1)
+        self._processes = []
+        if self._relay_transport is not None:
+            self._relay_transport.close()
+            self._relay_transport = None
+        if self._shm is not None:
+            self._writer = None
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
@@ -18,6 +18,7 @@ setup(
     entry_points={
         'console_scripts': [
             'p2psc = p2psc.main:run',
+            'p2psc-swarm = p2psc.swarm:run',
         ],
     }
 )
@@ -0,0 +1,190 @@
+import asyncio
+import socket
+
+import pytest
+
+from p2psc import batchTransport
+
+
+class RecordingProtocol(asyncio.DatagramProtocol):
+    def __init__(self) -> None:
+        self.transport = None
+        self.received = []
+        self.errors = []
+        self.lost = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.received.append((data, addr))
+
+    def error_received(self, exc):
+        self.errors.append(exc)
+
+    def connection_lost(self, exc):
+        self.lost = True
+
+
+async def wait_for(cond, timeout=2):
+    for _ in range(int(timeout / 0.01)):
+        if cond():
+            return
+        await asyncio.sleep(0.01)
+    raise TimeoutError()
+
+
+async def roundtrip():
+    loop = asyncio.get_running_loop()
+    transport, protocol = await batchTransport.create_batch_datagram_endpoint(
+        loop, RecordingProtocol, ("127.0.0.1", 0), batch_size=4)
+    await asyncio.sleep(0)
+    assert protocol.transport is transport
+    port = transport.get_extra_info("sockname")[1]
+
+    peer = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    peer.bind(("127.0.0.1", 0))
+    peer.setblocking(False)
+    peer_addr = peer.getsockname()
+
+    # Receive more datagrams than fit into one batch
+    dgrams = [bytes([i]) * (i + 1) for i in range(10)]
+    for d in dgrams:
+        peer.sendto(d, ("127.0.0.1", port))
+    await wait_for(lambda: len(protocol.received) == len(dgrams))
+    assert protocol.received == [(d, peer_addr) for d in dgrams]
+
+    # Sends are queued and flushed in the next loop iteration
+    for d in dgrams:
+        transport.sendto(d, peer_addr)
+    assert transport.get_write_buffer_size() == sum(len(d) for d in dgrams)
+    await asyncio.sleep(0)
+    assert transport.get_write_buffer_size() == 0
+    received = []
+    for _ in dgrams:
+        received.append(await loop.sock_recvfrom(peer, 1024))
+    assert received == [(d, ("127.0.0.1", port)) for d in dgrams]
+
+    # Hostnames are resolved by the socket
+    transport.sendto(b"abc", ("localhost", peer_addr[1]))
+    assert await loop.sock_recvfrom(peer, 1024) == (b"abc", ("127.0.0.1", port))
+
+    transport.close()
+    assert transport.is_closing()
+    await asyncio.sleep(0)
+    assert protocol.lost
+    peer.close()
+
+
+@pytest.mark.skipif(not batchTransport.is_supported(), reason="recvmmsg/sendmmsg not supported")
+def test_mmsg():
+    asyncio.run(roundtrip())
+
+
+def test_fallback(monkeypatch):
+    monkeypatch.setattr(batchTransport, "_libc", None)
+    asyncio.run(roundtrip())
+
+
+class PausingProtocol(RecordingProtocol):
+    def __init__(self) -> None:
+        super().__init__()
+        self.paused = []
+
+    def pause_writing(self):
+        self.paused.append(True)
+
+    def resume_writing(self):
+        self.paused.append(False)
+
+
+async def watermarks():
+    loop = asyncio.get_running_loop()
+    transport, protocol = await batchTransport.create_batch_datagram_endpoint(
+        loop, PausingProtocol, ("127.0.0.1", 0))
+    transport.set_write_buffer_limits(high=100)
+    assert transport.get_write_buffer_limits() == (25, 100)
+    addr = transport.get_extra_info("sockname")
+
+    # Datagrams queued in one loop iteration don't pause the protocol
+    for _ in range(10):
+        transport.sendto(b"x" * 50, addr)
+    assert protocol.paused == []
+    await asyncio.sleep(0)
+    assert transport.get_write_buffer_size() == 0
+
+    # Socket buffer full: the protocol is paused until the queue is sent
+    transport._send_single = lambda queue: None
+    transport._send_mmsg = lambda queue: None
+    for _ in range(3):
+        transport.sendto(b"x" * 50, addr)
+    await asyncio.sleep(0)
+    assert transport._writer_registered and protocol.paused == [True]
+    del transport._send_single, transport._send_mmsg
+    transport._on_writable()
+    assert protocol.paused == [True, False] and transport.get_write_buffer_size() == 0
+    transport.close()
+    await asyncio.sleep(0)
+
+
+def test_watermarks():
+    asyncio.run(watermarks())
+
+
+async def read_batches():
+    loop = asyncio.get_running_loop()
+    transport, protocol = await batchTransport.create_batch_datagram_endpoint(
+        loop, RecordingProtocol, ("127.0.0.1", 0), batch_size=4, read_batches=3)
+    loop.remove_reader(transport.get_extra_info("socket").fileno())
+    addr = transport.get_extra_info("sockname")
+    peer = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    for i in range(14):
+        peer.sendto(bytes([i]), addr)
+    await asyncio.sleep(0.05)
+    # One call receives up to three batches
+    transport._read_ready()
+    assert len(protocol.received) == 12
+    transport._read_ready()
+    assert len(protocol.received) == 14
+    peer.close()
+    transport.close()
+    await asyncio.sleep(0)
+
+
+@pytest.mark.skipif(not batchTransport.is_supported(), reason="recvmmsg/sendmmsg not supported")
+def test_read_batches():
+    asyncio.run(read_batches())
+
+
+def test_read_batches_fallback(monkeypatch):
+    monkeypatch.setattr(batchTransport, "_libc", None)
+    asyncio.run(read_batches())
+
+
+async def sockaddr_eviction():
+    loop = asyncio.get_running_loop()
+    transport, protocol = await batchTransport.create_batch_datagram_endpoint(
+        loop, RecordingProtocol, ("127.0.0.1", 0))
+    peer = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    peer.bind(("0.0.0.0", 0))
+    peer.setblocking(False)
+    port = peer.getsockname()[1]
+
+    # The cache overflows within one batch, all addresses of the batch must stay valid until it is sent
+    for round in range(2):
+        dsts = [(f"127.0.0.{i + 1}", port) for i in range(6)]
+        for i, dst in enumerate(dsts):
+            transport.sendto(bytes([round, i]), dst)
+        await asyncio.sleep(0)
+        assert len(transport._sockaddrs) == 6
+        received = sorted([(await loop.sock_recvfrom(peer, 1024))[0] for _ in dsts])
+        assert received == [bytes([round, i]) for i in range(6)]
+    peer.close()
+    transport.close()
+    await asyncio.sleep(0)
+
+
+@pytest.mark.skipif(not batchTransport.is_supported(), reason="recvmmsg/sendmmsg not supported")
+def test_sockaddr_eviction(monkeypatch):
+    monkeypatch.setattr(batchTransport, "MAX_SOCKADDRS", 4)
+    asyncio.run(sockaddr_eviction())
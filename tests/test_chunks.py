@@ -0,0 +1,101 @@
+import zlib
+
+import pytest
+from pythonosc.osc_message import OscMessage
+
+from p2psc import proto
+from p2psc.chunks import FLAG_ZLIB, ChunkAssembler, split_dgram
+
+ADDR = ("127.0.0.1", 1)
+
+
+def make_dgram(num_paths):
+    return proto.osc_dgram(proto.PEERINFO, [0, "A", " ".join(f"/path/{i}" for i in range(num_paths)), 1])
+
+
+def chunk_args(chunks):
+    return [OscMessage(c).params for c in chunks]
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_split_reassemble(compress):
+    dgram = make_dgram(500)
+    chunks = split_dgram(dgram, 512, 7, compress)
+    assert all(len(c) <= 512 for c in chunks)
+    assert len(chunks) > 1
+
+    assembler = ChunkAssembler()
+    args = chunk_args(chunks)
+    # chunks may arrive in any order
+    for a in reversed(args[1:]):
+        assert assembler.add(ADDR, a) is None
+    assert assembler.add(ADDR, args[0]) == dgram
+    assert len(assembler) == 0
+
+
+def test_compression():
+    dgram = make_dgram(500)
+    assert len(split_dgram(dgram, 1400, 1, True)) < len(split_dgram(dgram, 1400, 1, False))
+    # small messages result in a single chunk
+    assert len(split_dgram(make_dgram(1), 1400, 1)) == 1
+    with pytest.raises(ValueError):
+        split_dgram(dgram, 32, 1)
+
+
+def test_new_transfer():
+    assembler = ChunkAssembler()
+    old = chunk_args(split_dgram(make_dgram(100), 256, 1))
+    dgram = make_dgram(200)
+    new = chunk_args(split_dgram(dgram, 256, 2))
+
+    # A new transfer replaces the incomplete transfer of the same peer
+    assembler.add(ADDR, old[0])
+    assert assembler.add(("127.0.0.1", 2), new[0]) is None
+    for a in new[1:]:
+        assembler.add(ADDR, a)
+    assert assembler.add(ADDR, new[0]) == dgram
+    assert len(assembler) == 1
+
+
+def test_expiry():
+    assembler = ChunkAssembler(timeout=-1)
+    args = chunk_args(split_dgram(make_dgram(100), 256, 1))
+    assembler.add(ADDR, args[0])
+    # Expired transfers are dropped when a new transfer starts
+    assembler.add(("127.0.0.1", 2), args[0])
+    assert len(assembler) == 1
+
+    assembler = ChunkAssembler()
+    with pytest.raises(ValueError):
+        assembler.add(ADDR, [1, 0, 1, 1, b"invalid"])
+
+
+def test_oversize():
+    # Compressed data which would exceed the size limit is rejected without decompressing all of it
+    bomb = zlib.compress(bytes(10 ** 6))
+    args = chunk_args(split_dgram(bomb, 1400, 1))
+    assembler = ChunkAssembler(max_size=64 * 1024)
+    for a in args[:-1]:
+        assert assembler.add(ADDR, a[:3] + [FLAG_ZLIB, a[4]]) is None
+    with pytest.raises(ValueError):
+        assembler.add(ADDR, args[-1][:3] + [FLAG_ZLIB, args[-1][4]])
+    assert len(assembler) == 0
+
+    # Transfers are dropped as soon as their data exceeds the limit
+    args = chunk_args(split_dgram(make_dgram(500), 512, 1))
+    assembler = ChunkAssembler(max_size=1024)
+    with pytest.raises(ValueError):
+        for a in args:
+            assembler.add(ADDR, a)
+    assert len(assembler) == 0
+
+
+def test_max_transfers():
+    assembler = ChunkAssembler(max_transfers=2)
+    args = chunk_args(split_dgram(make_dgram(100), 256, 1))
+    for port in range(4):
+        assembler.add(("127.0.0.1", port), args[0])
+    assert len(assembler) == 2
+    # The oldest transfers were dropped
+    assert assembler.add(("127.0.0.1", 0), args[1]) is None
+    assert len(assembler) == 2
@@ -0,0 +1,55 @@
+import logging
+from unittest.mock import patch
+
+from p2psc.common.logging import SampledLog, configure_log_limits, get_sampled_log
+
+
+def test_sampling(caplog):
+    log = SampledLog("test", logging.WARNING, every=3)
+    with caplog.at_level(logging.WARNING):
+        for i in range(7):
+            log("message %d", i)
+    assert [r.getMessage() for r in caplog.records] == [
+        "message 0", "message 3 (2 similar messages suppressed)", "message 6 (2 similar messages suppressed)"]
+
+
+def test_rate_limit(caplog):
+    log = SampledLog("test", logging.WARNING, max_per_s=2)
+    with caplog.at_level(logging.WARNING), patch("time.monotonic") as monotonic:
+        monotonic.return_value = 10.0
+        for i in range(5):
+            log("message %d", i)
+        assert len(caplog.records) == 2
+        monotonic.return_value = 11.0
+        log("message %d", 5)
+    assert caplog.records[-1].getMessage() == "message 5 (3 similar messages suppressed)"
+
+
+def test_lazy_formatting(caplog):
+    log = SampledLog("test", logging.INFO)
+
+    class Arg:
+        formatted = 0
+
+        def __str__(self):
+            Arg.formatted += 1
+            return "arg"
+
+    with caplog.at_level(logging.WARNING):
+        assert not log.enabled()
+        log("message %s", Arg())
+    assert Arg.formatted == 0 and log.suppressed == 0
+    with caplog.at_level(logging.INFO):
+        log("message %s", Arg())
+    assert Arg.formatted > 0
+
+
+def test_configure():
+    log = get_sampled_log("forward")
+    assert get_sampled_log("forward") is log
+    configure_log_limits({"forward": {"every": 100}, "unknown": {}})
+    assert log.every == 100 and log.max_per_s == 20
+    configure_log_limits({"forward": {"every": 1, "max_per_s": None}})
+    assert log.every == 1 and log.max_per_s is None
+    configure_log_limits({"forward": {}})
+    assert log.max_per_s == 20
@@ -8,4 +8,22 @@ __license__ = "MIT"
 
 
 def test_main(capsys):
-    pass
\ No newline at end of file
+    pass
+
+def test_event_loop():
+    import asyncio
+    from p2psc.common.args import parse_args
+    from p2psc.common.eventloop import setup_event_loop
+
+    assert parse_args(["--loop", "uvloop"]).loop == "uvloop"
+    assert parse_args([]).loop is None
+    assert parse_args(["--profile", "node.prof"]).profile == "node.prof"
+    with pytest.raises(SystemExit):
+        parse_args(["--loop", "invalid"])
+
+    assert setup_event_loop("invalid") == "asyncio"
+    assert setup_event_loop("asyncio") == "asyncio"
+    assert type(asyncio.get_event_loop_policy()) == asyncio.DefaultEventLoopPolicy
+    pytest.importorskip("uvloop")
+    assert setup_event_loop("uvloop") == "uvloop"
+    setup_event_loop("asyncio")
@@ -0,0 +1,57 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase
+
+from p2psc.metrics import Histogram, Metrics, serve_http, write_text
+
+
+def test_histogram():
+    h = Histogram([1, 10, 100])
+    assert h.quantile(0.5) == 0
+    for v in [0, 1, 5, 5, 50, 1000]:
+        h.observe(v)
+    assert h.counts == [2, 2, 1, 1]
+    assert h.count == 6 and h.sum == 1061
+    assert h.quantile(0.5) == 10
+    assert h.quantile(0.8) == 100
+    assert h.quantile(1) == float("inf")
+
+
+def test_values_and_text(tmp_path):
+    m = Metrics()
+    m.packets_in += 2
+    m.forwards[("127.0.0.1", 1)] = 3
+    m.forwards[("127.0.0.1", 2)] = 1
+    m.fanout.observe(2)
+
+    values = dict(m.values({"registry_nodes": 4}))
+    assert values["packets_in"] == 2 and values["registry_nodes"] == 4
+    assert values["fanout_count"] == 1 and values["fanout_p50"] == 2
+
+    text = m.to_text({"registry_nodes": 4})
+    lines = text.splitlines()
+    assert "p2psc_packets_in_total 2" in lines
+    assert "p2psc_registry_nodes 4" in lines
+    assert 'p2psc_forwards_total{peer="127.0.0.1:1"} 3' in lines
+    assert 'p2psc_fanout_bucket{le="2"} 1' in lines
+    assert 'p2psc_fanout_bucket{le="+Inf"} 1' in lines
+
+    m.prune_forwards({("127.0.0.1", 1): None})
+    assert list(m.forwards) == [("127.0.0.1", 1)]
+
+    path = str(tmp_path / "metrics.txt")
+    write_text(path, text)
+    with open(path) as f:
+        assert f.read() == text
+
+
+class Test(IsolatedAsyncioTestCase):
+    async def test_serve_http(self):
+        server = await serve_http(lambda: "p2psc_packets_in_total 1\n", "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        response = await reader.read()
+        writer.close()
+        server.close()
+        assert response.startswith(b"HTTP/1.1 200 OK")
+        assert response.endswith(b"\r\n\r\np2psc_packets_in_total 1\n")
@@ -1,18 +1,21 @@
 
 import asyncio
+import logging
 from unittest import IsolatedAsyncioTestCase
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 from pytest_mock import MockerFixture
 from pythonosc.osc_message import OscMessage
 from pythonosc.osc_bundle import OscBundle
 from pythonosc.osc_bundle_builder import OscBundleBuilder
 from pythonosc.osc_message_builder import OscMessageBuilder
 import zeroconf
-from p2psc import proto
+from p2psc import batchTransport, proto
 from p2psc.common.config import Config
+from p2psc.common.logging import DEFAULT_LOG_LIMITS, get_sampled_log
 
 from p2psc.node import Node
 from p2psc.peerInfo import PeerInfo, PeerType
+from p2psc.peerProtocol import LazyOscMessage, OscProtocolUdp, PriorityOscProtocolUdp
 
 
 def make_config(name='test'):
@@ -50,14 +53,14 @@ def test_zconf_cb():
 
     # Service Added/Updated (peer exists)
     pi = PeerInfo(addr)
-    pi.refresh = MagicMock()
     node._registry.get_peer.return_value = pi
 
-    node._zconf_node_callback(addr, zeroconf.ServiceStateChange.Updated)
+    with patch.object(PeerInfo, "refresh") as refresh:
+        node._zconf_node_callback(addr, zeroconf.ServiceStateChange.Updated)
 
     node._registry.get_peer.assert_called_once_with(addr)
     node._registry.get_peer.reset_mock()
-    pi.refresh.assert_called_once()
+    refresh.assert_called_once()
 
     node._registry.remove_peer.assert_not_called()
     node._registry.add_peer.assert_not_called()
@@ -115,6 +118,72 @@ class Test(IsolatedAsyncioTestCase):
         node._transport.sendto.assert_called_once_with(msg.dgram, addr)
         node._handle_local.assert_not_called()  # make sure nothing else happend
 
+    async def test_on_osc_bundle(self):
+        node = Node(make_config())
+        node._transport = FakeTransport()
+        node._transport.sendto = MagicMock()
+        client = ("127.0.0.1", 1)
+        n1 = PeerInfo(("127.0.0.1", 2), ["B"], ["/a", "/b"], PeerType.node)
+        n2 = PeerInfo(("127.0.0.1", 3), ["C"], ["/a"], PeerType.node)
+        node._registry.add_peer(n1)
+        node._registry.add_peer(n2)
+
+        bb = OscBundleBuilder(1234.5)
+        for path in ["/ALL/a", "/B/b", "/C/b", "/ALL/a"]:
+            bb.add_content(OscMessageBuilder(path).build())
+        bundle = bb.build()
+
+        # One bundle per destination containing only the subscribed messages
+        await node.on_osc(client, bundle)
+        assert node._transport.sendto.call_count == 2
+        sent = {c.args[1]: OscBundle(c.args[0]) for c in node._transport.sendto.call_args_list}
+        assert [m.address for m in sent[n1.addr]] == ["/ALL/a", "/B/b", "/ALL/a"]
+        assert [m.address for m in sent[n2.addr]] == ["/ALL/a", "/ALL/a"]
+        assert sent[n1.addr].timestamp == bundle.timestamp
+        node._transport.sendto.reset_mock()
+
+        # Bundles from nodes are forwarded to clients without group
+        node._registry.add_peer(PeerInfo(client, [], ["/a"], PeerType.client))
+        await node.on_osc(n1.addr, bundle)
+        node._transport.sendto.assert_called_once()
+        dgram, dst = node._transport.sendto.call_args.args
+        assert dst == client
+        assert [m.address for m in OscBundle(dgram)] == ["/a", "/a"]
+        assert dgram[:16] == bundle.dgram[:16]
+
+    async def test_create_endpoint(self):
+        for transport, batched in [("asyncio", False), ("mmsg", True)]:
+            config = make_config()
+            config["udp_transport"] = transport
+            node = Node(config)
+            node._loop = asyncio.get_running_loop()
+            t, p = await node._create_endpoint(("127.0.0.1", 0))
+            assert isinstance(t, batchTransport.BatchDatagramTransport) == batched
+            t.close()
+
+        # Control priority reads in batches with any transport
+        config = make_config()
+        config["control_priority"] = True
+        node = Node(config)
+        node._loop = asyncio.get_running_loop()
+        t, p = await node._create_endpoint(("127.0.0.1", 0))
+        assert isinstance(t, batchTransport.BatchDatagramTransport)
+        assert isinstance(p, PriorityOscProtocolUdp)
+        t.close()
+
+    async def test_serve_bind_ip(self):
+        config = make_config()
+        config["zeroconf"] = False
+        config["port"] = 0
+        config["bind_ip"] = "127.0.0.1"
+        node = Node(config)
+        task = asyncio.create_task(node.serve())
+        while node._transport is None:
+            await asyncio.sleep(0.01)
+        assert node._transport.get_extra_info("sockname")[0] == "127.0.0.1"
+        node.stop()
+        await asyncio.gather(task, return_exceptions=True)
+
 
 def test_handle_local():
     loop = asyncio.new_event_loop()
@@ -157,3 +226,367 @@ def test_handle_local():
     node._transport.sendto.assert_not_called()
     node._registry.add_peer.assert_not_called()
     loop.close()
+
+
+def test_node_queries():
+    node = Node(make_config())
+    node._transport = FakeTransport()
+    node._transport.sendto = MagicMock()
+    addr = ("127.0.0.1", 1)
+    node._registry.add_peer(PeerInfo(("127.0.0.1", 2), ["B", "PERC"], ["/x", "/y"], PeerType.node))
+
+    node._handle_local(addr, OscMessageBuilder(proto.PEERNAMES).build())
+    node._transport.sendto.assert_called_once_with(proto.osc_dgram(proto.PEERNAMES, ["B"]), addr)
+    node._transport.sendto.reset_mock()
+
+    node._handle_local(addr, proto.osc_message(proto.GET_PATHS, ["B"]))
+    node._transport.sendto.assert_called_once_with(proto.osc_dgram(proto.GET_PATHS, ["B", "/x /y"]), addr)
+    node._transport.sendto.reset_mock()
+
+    node._handle_local(addr, proto.osc_message(proto.GROUPS, ["B"]))
+    node._transport.sendto.assert_called_once_with(proto.osc_dgram(proto.GROUPS, ["B PERC"]), addr)
+    node._transport.sendto.reset_mock()
+
+    node._handle_local(addr, proto.osc_message(proto.GROUPS, ["PERC"]))
+    node._transport.sendto.assert_not_called()
+
+
+def test_peerinfo_versions():
+    node = Node(make_config())
+    node._transport = FakeTransport()
+    node._transport.sendto = MagicMock()
+    client = ("127.0.0.1", 1)
+
+    node._update_peerinfo_version()
+    assert node._peerinfo_version == 0 and node._peerinfo_deltas == []
+
+    node._registry.add_peer(PeerInfo(client, ["A"], ["/a", "/b"], PeerType.client))
+    node._update_peerinfo_version()
+    node._update_peerinfo_version()
+    assert node._peerinfo_version == 1
+    assert node._peerinfo_deltas == [proto.osc_dgram(proto.PEERINFO_DELTA, [1, "test A", "/a /b", ""])]
+
+    node._registry.add_peer(PeerInfo(client, ["A"], ["/b", "/c"], PeerType.client))
+    msg = OscMessage(node._get_peerinfo_msg())
+    assert msg.params == [PeerType.node.value, "test A", "/b /c", 2]
+    # The peerinfo is only encoded again after local changes
+    assert node._get_peerinfo_msg() is node._get_peerinfo_msg()
+    assert node._peerinfo_deltas[1] == proto.osc_dgram(proto.PEERINFO_DELTA, [2, "test A", "/c", "/a"])
+
+
+def test_peerinfo_sync():
+    node = Node(make_config())
+    node._transport = FakeTransport()
+    node._transport.sendto = MagicMock()
+    addr = ("127.0.0.1", 2)
+    request = proto.osc_dgram(proto.PEERINFO, [])
+
+    # Versions/deltas of unknown nodes trigger a request for the full peerinfo
+    node._handle_local(addr, proto.osc_message(proto.PEERINFO_VERSION, [3]))
+    node._transport.sendto.assert_called_once_with(request, addr)
+    node._transport.sendto.reset_mock()
+    node._handle_local(addr, proto.osc_message(proto.PEERINFO_DELTA, [3, "B", "/x", ""]))
+    node._transport.sendto.assert_called_once_with(request, addr)
+    node._transport.sendto.reset_mock()
+
+    node._handle_local(addr, proto.osc_message(proto.PEERINFO, [PeerType.node.value, "B", "/a /b", 3]))
+    pi = node._registry.get_peer(addr)
+    assert pi.version == 3 and pi.paths == ("/a", "/b")
+
+    # Matching version only refreshes the peer
+    pi.last_update_t = 0
+    node._handle_local(addr, proto.osc_message(proto.PEERINFO_VERSION, [3]))
+    assert node._registry.get_peer(addr) is pi and pi.last_update_t > 0
+    node._transport.sendto.assert_not_called()
+
+    # Deltas are applied in order
+    node._handle_local(addr, proto.osc_message(proto.PEERINFO_DELTA, [4, "B C", "/c", "/a"]))
+    pi = node._registry.get_peer(addr)
+    assert pi.version == 4 and pi.groups == ("B", "C") and pi.paths == ("/b", "/c")
+    assert node._registry.get_by_path("/C/c") == [pi]
+    node._transport.sendto.assert_not_called()
+
+    # Missed versions trigger a request for the full peerinfo
+    node._handle_local(addr, proto.osc_message(proto.PEERINFO_DELTA, [6, "B", "", "/c"]))
+    node._transport.sendto.assert_called_once_with(request, addr)
+    assert node._registry.get_peer(addr).version == 4
+    node._transport.sendto.reset_mock()
+    node._handle_local(addr, proto.osc_message(proto.PEERINFO_VERSION, [5]))
+    node._transport.sendto.assert_called_once_with(request, addr)
+
+
+def test_peerinfo_unchanged():
+    node = Node(make_config())
+    addr = ("127.0.0.1", 2)
+    msg = proto.osc_message(proto.PEERINFO, [PeerType.node.value, "B", "/a /b", 3])
+
+    node._handle_local(addr, msg)
+    pi = node._registry.get_peer(addr)
+    generation = node._registry.generation
+
+    # Identical peerinfo only refreshes the existing peer
+    node._registry._update_local = MagicMock()
+    pi.last_update_t = 0
+    node._handle_local(addr, proto.osc_message(proto.PEERINFO, [PeerType.node.value, "B", "/a /b", 3]))
+    assert node._registry.get_peer(addr) is pi and pi.last_update_t > 0
+    assert node._registry.generation == generation
+    node._registry._update_local.assert_not_called()
+    assert node._registry.updates_skipped == 1
+
+    node._handle_local(addr, proto.osc_message(proto.PEERINFO, [PeerType.node.value, "B", "/a", 4]))
+    assert node._registry.get_peer(addr).paths == ("/a",)
+    assert node._registry.updates_applied == 2
+
+
+def test_peerinfo_chunked():
+    config = make_config()
+    config["max_datagram_size"] = 512
+    config["peerinfo_compression"] = False
+    node = Node(config)
+    node._transport = FakeTransport()
+    node._transport.sendto = MagicMock()
+    other = Node(make_config("other"))
+    other._transport = FakeTransport()
+    other._transport.sendto = MagicMock()
+    addr = ("127.0.0.1", 2)
+    paths = [f"/path/{i}" for i in range(200)]
+    node._registry.add_peer(PeerInfo(("127.0.0.1", 1), ["A"], paths, PeerType.client))
+
+    # Clients receive the whole peerinfo
+    node._handle_local(("127.0.0.1", 1), proto.osc_message(proto.PEERINFO, []))
+    assert node._transport.sendto.call_count == 1
+    assert OscMessage(node._transport.sendto.call_args[0][0]).address == proto.PEERINFO
+    node._transport.sendto.reset_mock()
+
+    # Nodes receive chunks
+    node._registry.add_peer(PeerInfo(addr, ["B"], [], PeerType.node))
+    node._handle_local(addr, proto.osc_message(proto.PEERINFO, []))
+    dgrams = [c[0][0] for c in node._transport.sendto.call_args_list]
+    assert len(dgrams) > 1 and all(len(d) <= 512 for d in dgrams)
+    # Chunks are only accepted from known nodes
+    for d in dgrams:
+        other._handle_local(("127.0.0.1", 3760), OscMessage(d))
+    assert len(other._chunks) == 0 and ("127.0.0.1", 3760) not in other._registry.addr_peer_map
+    other._registry.add_peer(PeerInfo(("127.0.0.1", 3760), type=PeerType.node))
+    for d in dgrams:
+        other._handle_local(("127.0.0.1", 3760), OscMessage(d))
+    pi = other._registry.get_peer(("127.0.0.1", 3760))
+    assert pi.paths == tuple(sorted(paths)) and pi.version == 1
+
+    # Invalid chunks are ignored
+    other._handle_local(addr, proto.osc_message(proto.PEERINFO_CHUNK, [1, 0, 1, 0]))
+    other._handle_local(addr, proto.osc_message(proto.PEERINFO_CHUNK, [1, 0, 1, 0, proto.osc_dgram(proto.DISCONNECT, [])]))
+    assert addr not in other._registry.addr_peer_map
+
+
+def test_peerinfos():
+    config = make_config()
+    config["max_datagram_size"] = 512
+    node = Node(config)
+    node._transport = FakeTransport()
+    node._transport.sendto = MagicMock()
+    client = ("127.0.0.1", 1)
+    nodes = [PeerInfo(("127.0.0.1", 10 + i), [f"N{i}"], [f"/path/{i}"], PeerType.node, 1) for i in range(20)]
+    for pi in nodes:
+        node._registry.add_peer(pi)
+    node._registry.add_peer(PeerInfo(client, ["A"], ["/a"], PeerType.client))
+
+    node._handle_local(client, proto.osc_message(proto.PEERINFOS, []))
+    dgrams = [c[0][0] for c in node._transport.sendto.call_args_list]
+    assert 1 < len(dgrams) < len(nodes) and all(len(d) <= 512 for d in dgrams)
+    received = [OscMessage(c.dgram).params for d in dgrams for c in OscBundle(d)._contents]
+    assert received == [pi.as_osc() for pi in nodes]
+
+    # Responses are cached until the registry changes
+    assert node._get_peerinfos_msgs() is node._get_peerinfos_msgs()
+    bundles = node._get_peerinfos_msgs()
+    node._registry.remove_peer(nodes[0].addr)
+    assert node._get_peerinfos_msgs() is not bundles
+
+
+def test_metrics():
+    node = Node(make_config())
+    node._transport = FakeTransport()
+    node._transport.sendto = MagicMock()
+    client = ("127.0.0.1", 1)
+    peer = ("127.0.0.1", 2)
+    node._registry.add_peer(PeerInfo(peer, ["B"], ["/test"], PeerType.node))
+
+    dgram = proto.osc_dgram("/ALL/test", [1])
+    node.on_osc_sync(client, OscMessage(dgram))
+    node.on_osc_sync(client, OscMessage(proto.osc_dgram("/ALL/other", [1])))
+    bb = OscBundleBuilder(0)
+    bb.add_content(OscMessageBuilder("/ALL/other").build())
+    node.on_osc_sync(client, bb.build())
+    m = node.metrics
+    assert m.packets_out == 1 and m.bytes_out == len(dgram)
+    assert m.forwards == {peer: 1}
+    assert m.unrouted_messages == 1 and m.dropped_bundles == 1
+    assert m.fanout.count == 3
+
+    node._handle_local(peer, proto.osc_message(proto.PEERINFO_VERSION, [1]))
+    assert m.peerinfo_bytes_in == len(proto.osc_dgram(proto.PEERINFO_VERSION, [1]))
+    assert m.peerinfo_bytes_out == len(proto.osc_dgram(proto.PEERINFO, []))
+
+    node._transport.sendto.reset_mock()
+    node._handle_local(client, proto.osc_message(proto.STATS, []))
+    reply = OscMessage(node._transport.sendto.call_args[0][0])
+    assert reply.address == proto.STATS
+    stats = dict(zip(reply.params[::2], reply.params[1::2]))
+    assert stats["packets_out"] == 2 and stats["registry_nodes"] == 1
+    assert stats["route_cache_hits"] == node._routes.hits and stats["route_cache_misses"] == 2
+    assert stats["peerinfo_updates_applied"] == node._registry.updates_applied
+    assert "p2psc_peerinfo_updates_skipped 0" in node.get_metrics_text()
+    assert "p2psc_forwards_total{peer=\"127.0.0.1:2\"} 1" in node.get_metrics_text()
+
+
+def test_profile(tmp_path):
+    path = str(tmp_path / "node.prof")
+    config = make_config()
+    config["profile_file"] = path
+    node = Node(config)
+    node._transport = FakeTransport()
+    node._transport.sendto = MagicMock()
+    client = ("127.0.0.1", 1)
+    node._registry.add_peer(PeerInfo(("127.0.0.1", 2), ["B"], ["/test"], PeerType.node))
+
+    # Timing is off by default
+    node.on_osc_sync(client, OscMessage(proto.osc_dgram("/ALL/test", [1])))
+    assert node.metrics.handler_times == {}
+
+    node._handle_local(client, proto.osc_message(proto.PROFILE, [1]))
+    assert OscMessage(node._transport.sendto.call_args[0][0]).params == [1, 1]
+    node.on_osc_sync(client, OscMessage(proto.osc_dgram("/ALL/test", [1])))
+    node._handle_local(client, proto.osc_message(proto.STATS, []))
+    assert node.metrics.handler_times["forward"].count == 1
+    assert node.metrics.handler_times["stats"].count == 1
+    assert 'p2psc_handler_seconds_count{handler="forward"} 1' in node.get_metrics_text()
+
+    node._handle_local(client, proto.osc_message(proto.PROFILE, [0]))
+    assert OscMessage(node._transport.sendto.call_args[0][0]).params == [0, 0]
+    assert (tmp_path / "node.prof").exists()
+    node.on_osc_sync(client, OscMessage(proto.osc_dgram("/ALL/test", [1])))
+    assert node.metrics.handler_times["forward"].count == 1
+
+
+def test_trace(tmp_path):
+    config = make_config()
+    config["trace"] = True
+    config["trace_file"] = str(tmp_path / "trace.txt")
+    node = Node(config)
+    node._transport = FakeTransport()
+    node._transport.sendto = MagicMock()
+    client = ("127.0.0.1", 1)
+    node._registry.add_peer(PeerInfo(("127.0.0.1", 2), ["B"], ["/test"], PeerType.node))
+    node._registry.add_peer(PeerInfo(("127.0.0.1", 3), ["C"], ["/test"], PeerType.node))
+    protocol = OscProtocolUdp(node, node.metrics, node.tracer)
+
+    protocol.datagram_received(proto.osc_dgram("/ALL/test", [1]), client)
+    protocol.datagram_received(proto.osc_dgram("/ALL/other", [1]), client)
+    bb = OscBundleBuilder(0)
+    bb.add_content(OscMessageBuilder("/ALL/test").build())
+    protocol.datagram_received(bb.build().dgram, client)
+    # The message which isn't forwarded is not traced
+    assert node.tracer.recorded == 2
+    assert list(node.tracer._fanout[:2]) == [2, 2]
+
+    node._transport.sendto.reset_mock()
+    protocol.datagram_received(proto.osc_dgram(proto.TRACE, []), client)
+    reply = OscMessage(node._transport.sendto.call_args[0][0])
+    assert reply.address == proto.TRACE
+    summary = dict(zip(reply.params[::2], reply.params[1::2]))
+    assert summary["traces"] == 2 and summary["total_max_us"] > 0
+    assert "2 traces" in (tmp_path / "trace.txt").read_text()
+
+
+def test_rate_limit_and_backpressure():
+    config = make_config()
+    config["client_rate_limit"] = {"rate": 1, "burst": 2}
+    node = Node(config)
+    node._transport = FakeTransport()
+    node._transport.sendto = MagicMock()
+    client = ("127.0.0.1", 1)
+    node._registry.add_peer(PeerInfo(("127.0.0.1", 2), ["B"], ["/test"], PeerType.node))
+    node._registry.add_peer(PeerInfo(("127.0.0.1", 3), ["C"], ["/test"], PeerType.node))
+
+    for _ in range(3):
+        node.on_osc_sync(client, OscMessage(proto.osc_dgram("/ALL/test", [1])))
+    assert node._transport.sendto.call_count == 4
+    assert node.metrics.rate_limited_messages == 1
+    # Only messages from clients are limited
+    node.on_osc_sync(("127.0.0.1", 2), OscMessage(proto.osc_dgram("/ALL/test", [1])))
+    assert node.metrics.rate_limited_messages == 1
+
+    # While the transport is paused, forwarded messages are dropped but control messages are sent
+    node._limiter = None
+    node._transport.sendto.reset_mock()
+    node.pause_writing()
+    node.on_osc_sync(client, OscMessage(proto.osc_dgram("/ALL/test", [1])))
+    bb = OscBundleBuilder(0)
+    bb.add_content(OscMessageBuilder("/ALL/test").build())
+    node.on_osc_sync(client, bb.build())
+    assert node._transport.sendto.call_count == 0
+    assert node.metrics.backpressure_drops == 4
+    node._handle_local(client, proto.osc_message(proto.NODENAME, []))
+    assert node._transport.sendto.call_count == 1
+    node.resume_writing()
+    node.on_osc_sync(client, OscMessage(proto.osc_dgram("/ALL/test", [1])))
+    assert node._transport.sendto.call_count == 3
+
+    node._drop_data = False
+    node.pause_writing()
+    node.on_osc_sync(client, OscMessage(proto.osc_dgram("/ALL/test", [1])))
+    assert node._transport.sendto.call_count == 5
+
+
+def test_forward_log_invalid_args(caplog):
+    node = Node(make_config())
+    node._transport = FakeTransport()
+    node._transport.sendto = MagicMock()
+    node._registry.add_peer(PeerInfo(("127.0.0.1", 2), ["B"], ["/test"], PeerType.node))
+    # Valid address, but the type tag announces an argument which is missing
+    dgram = proto.osc_dgram("/ALL/test", [])[:-4] + b",i\x00\x00"
+    with caplog.at_level(logging.INFO):
+        node.on_osc_sync(("127.0.0.1", 1), LazyOscMessage(dgram))
+    node._transport.sendto.assert_called_once_with(dgram, ("127.0.0.1", 2))
+    assert node.metrics.packets_out == 1
+    assert "invalid arguments" in caplog.text
+
+
+def test_control_logs_sampled(caplog):
+    node = Node(make_config())
+    node._transport = FakeTransport()
+    node._transport.sendto = MagicMock()
+    invalid = get_sampled_log("invalid")
+    invalid.configure(1, 2)
+    # Any sender can trigger these logs, only two per second are emitted
+    with caplog.at_level(logging.DEBUG):
+        for _ in range(50):
+            node._handle_local(("127.0.0.1", 1), proto.osc_message(proto.DISCONNECT, []))
+            node._handle_local(("127.0.0.1", 1), proto.osc_message("/p2psc/unknown", []))
+    assert len([r for r in caplog.records if r.levelno == logging.WARNING]) == 2
+    assert invalid.suppressed == 98
+    invalid.configure(1, DEFAULT_LOG_LIMITS["invalid"]["max_per_s"])
+
+
+def test_peerinfo_updates_mixed_versions():
+    node = Node(make_config())
+    node._transport = FakeTransport()
+    node._transport.sendto = MagicMock()
+    node._registry.add_peer(PeerInfo(("127.0.0.1", 1), ["A"], ["/a"], PeerType.client))
+    old = ("127.0.0.1", 2)
+    new = ("127.0.0.1", 3)
+    node._registry.add_peer(PeerInfo(old, ["B"], [], PeerType.node))
+    node._registry.add_peer(PeerInfo(new, ["C"], [], PeerType.node, 1))
+
+    # Nodes without a version (older p2psc versions) receive the full peerinfo, others a delta
+    node._send_peerinfo_updates()
+    sent = {c.args[1]: OscMessage(c.args[0]) for c in node._transport.sendto.call_args_list}
+    assert sent[old].address == proto.PEERINFO and sent[old].params[2] == "/a"
+    assert sent[new].address == proto.PEERINFO_DELTA
+    node._transport.sendto.reset_mock()
+
+    node._send_peerinfo_updates()
+    sent = {c.args[1]: OscMessage(c.args[0]) for c in node._transport.sendto.call_args_list}
+    assert sent[old].address == proto.PEERINFO
+    assert sent[new].address == proto.PEERINFO_VERSION
@@ -0,0 +1,166 @@
+import asyncio
+import time
+
+from pythonosc.osc_bundle import OscBundle
+from pythonosc.osc_bundle_builder import OscBundleBuilder
+from pythonosc.osc_message import OscMessage
+
+from p2psc import proto
+from p2psc.metrics import Metrics
+from p2psc.peerProtocol import LazyOscMessage, OscHandler, OscProtocolUdp, PriorityOscProtocolUdp
+from p2psc.tracing import Tracer
+
+
+def test_lazy_message():
+    args = [1, 2.5, "abc", b"\x00\x01"]
+    dgram = proto.osc_dgram("/ALL/test", args)
+    msg = LazyOscMessage(dgram)
+    assert msg.address == "/ALL/test"
+    assert msg.dgram == dgram
+    assert msg.size == len(dgram)
+    assert msg._message is None  # arguments are not decoded yet
+    assert msg.params == OscMessage(dgram).params
+    assert list(msg) == msg.params
+
+
+class RecordingHandler(OscHandler):
+    def __init__(self) -> None:
+        self.received = []
+
+    async def on_osc(self, addr, message):
+        self.received.append((addr, message))
+
+
+def test_datagram_received():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    handler = RecordingHandler()
+    protocol = OscProtocolUdp(handler)
+    addr = ("127.0.0.1", 1)
+
+    async def receive(dgram):
+        protocol.datagram_received(dgram, addr)
+        await asyncio.sleep(0)
+
+    loop.run_until_complete(receive(proto.osc_dgram("/ALL/test", [1])))
+    assert type(handler.received[-1][1]) == LazyOscMessage
+
+    loop.run_until_complete(receive(proto.osc_dgram(proto.PEERINFO, [])))
+    assert type(handler.received[-1][1]) == OscMessage
+
+    bb = OscBundleBuilder(0)
+    bb.add_content(proto.osc_message("/ALL/test", [1]))
+    loop.run_until_complete(receive(bb.build().dgram))
+    assert type(handler.received[-1][1]) == OscBundle
+
+    # Invalid datagrams are dropped
+    handler.received.clear()
+    loop.run_until_complete(receive(b"invalid"))
+    loop.run_until_complete(receive(b"/\xff\xfe\x00"))
+    assert handler.received == []
+    loop.close()
+
+
+class SyncHandler(OscHandler):
+    def __init__(self) -> None:
+        self.received = []
+
+    def on_osc_sync(self, addr, message):
+        if message.address == "/fail":
+            raise RuntimeError()
+        self.received.append((addr, message))
+
+
+def test_datagram_received_sync():
+    handler = SyncHandler()
+    protocol = OscProtocolUdp(handler)
+    addr = ("127.0.0.1", 1)
+
+    # Handled immediately, without running an event loop
+    protocol.datagram_received(proto.osc_dgram("/ALL/test", [1]), addr)
+    assert len(handler.received) == 1
+
+    # Errors in the handler don't propagate to the transport
+    protocol.datagram_received(proto.osc_dgram("/fail", []), addr)
+    assert len(handler.received) == 1
+
+
+def test_metrics():
+    metrics = Metrics()
+    protocol = OscProtocolUdp(SyncHandler(), metrics)
+    addr = ("127.0.0.1", 1)
+    dgram = proto.osc_dgram("/ALL/test", [1])
+
+    protocol.datagram_received(dgram, addr)
+    protocol.datagram_received(b"invalid", addr)
+    protocol.datagram_received(proto.osc_dgram("/fail", []), addr)
+    assert metrics.packets_in == 3
+    assert metrics.bytes_in == len(dgram) + len(b"invalid") + len(proto.osc_dgram("/fail", []))
+    assert metrics.parse_errors == 1 and metrics.handler_errors == 1
+    assert metrics.handler_latency.count == 2
+
+
+def test_tracing():
+    tracer = Tracer(size=8)
+    handler = SyncHandler()
+    protocol = OscProtocolUdp(handler, tracer=tracer)
+    addr = ("127.0.0.1", 1)
+
+    # The handler ends the trace after forwarding
+    handler.on_osc_sync = lambda addr, msg: tracer.end(1)
+    protocol.datagram_received(proto.osc_dgram("/ALL/test", [1]), addr)
+    assert tracer.recorded == 1 and not tracer.active
+
+    # Datagrams which are not forwarded or invalid are discarded
+    handler.on_osc_sync = lambda addr, msg: None
+    protocol.datagram_received(proto.osc_dgram("/ALL/test", [1]), addr)
+    protocol.datagram_received(b"invalid", addr)
+    assert tracer.recorded == 1 and not tracer.active
+
+
+async def priority():
+    handler = SyncHandler()
+    metrics = Metrics()
+    protocol = PriorityOscProtocolUdp(handler, metrics, queue_size=4, budget=2)
+    addr = ("127.0.0.1", 1)
+    for i in range(5):
+        protocol.datagram_received(proto.osc_dgram("/ALL/test", [i]), addr)
+    protocol.datagram_received(proto.osc_dgram(proto.NODENAME, []), addr)
+
+    # The control message is handled immediately, the oldest data message was dropped
+    assert [m.address for _, m in handler.received] == [proto.NODENAME]
+    assert protocol.queued == 4 and metrics.queue_drops == 1
+    await asyncio.sleep(0)
+    assert protocol.queued == 2
+    await asyncio.sleep(0)
+    assert protocol.queued == 0
+    assert [m.params[0] for _, m in handler.received[1:]] == [1, 2, 3, 4]
+    assert metrics.queue_wait.count == 4 and metrics.queue_wait.sum > 0
+
+    protocol.datagram_received(proto.osc_dgram("/ALL/test", [5]), addr)
+    protocol.connection_lost(None)
+    assert protocol.queued == 0
+    await asyncio.sleep(0)
+    assert len(handler.received) == 5
+
+
+def test_priority():
+    asyncio.run(priority())
+
+
+async def priority_tracing():
+    tracer = Tracer(size=8)
+    handler = SyncHandler()
+    protocol = PriorityOscProtocolUdp(handler, tracer=tracer)
+    handler.on_osc_sync = lambda addr, msg: tracer.end(1)
+    protocol.datagram_received(proto.osc_dgram("/ALL/test", [1]), ("127.0.0.1", 1))
+    time.sleep(0.01)
+    await asyncio.sleep(0)
+    # The time spent in the queue is part of the trace
+    assert tracer.recorded == 1
+    assert tracer.samples("queue")[0] >= 0.01
+    assert tracer.samples("total")[0] >= tracer.samples("queue")[0]
+
+
+def test_priority_tracing():
+    asyncio.run(priority_tracing())
@@ -1,3 +1,4 @@
+import time
 import pytest
 from p2psc import proto
 from p2psc.peerRegistry import PeerRegistry
@@ -65,9 +66,9 @@ def test_cleanup():
     assert reg.get_peer(pi_node.addr) == pi_node
 
     # Check whether node is removed after expiry
-    pi_node.last_update_t = 0
-    assert pi_node.is_expired() == True
-    reg.cleanup()
+    now = time.time() + PeerInfo.NODE_EXPIRY_T
+    assert pi_node.is_expired(now) == True
+    reg.cleanup(now)
     assert reg.get_peer(pi_client.addr) == pi_client
     with pytest.raises(LookupError):
         reg.get_peer(pi_node.addr)
@@ -126,4 +127,139 @@ def test_add():
     assert paths_c[1] in reg._local_paths
     assert groups[0] in reg._local_groups
     assert groups[1] in reg._local_groups
-    assert groups2[0] in reg._local_groups
\ No newline at end of file
+    assert groups2[0] in reg._local_groups
+
+def test_by_path_index():
+    reg = PeerRegistry("name")
+    c = PeerInfo(("127.0.0.1", 1), groups=["A"], paths=["/test*"], type=PeerType.client)
+    n = PeerInfo(("127.0.0.1", 2), groups=["B"], paths=["/test/x"], type=PeerType.node)
+    reg.add_peer(c)
+    reg.add_peer(n)
+
+    assert set(reg.get_by_path("/ALL/test/x")) == {c, n}
+    assert reg.get_by_path("/ALL/test/x", filter_type=PeerType.node) == [n]
+    assert reg.get_by_path("/B/test/*") == [n]
+
+    # Updated peerinfo replaces indexed paths
+    n2 = PeerInfo(n.addr, groups=["B"], paths=["/other"], type=PeerType.node)
+    reg.add_peer(n2)
+    assert reg.get_by_path("/B/test/x") == []
+    assert reg.get_by_path("/B/other") == [n2]
+
+    # Removed and expired peers are no longer matched
+    reg.remove_peer(c.addr)
+    assert reg.get_by_path("/ALL/test/x") == []
+    reg.cleanup(time.time() + PeerInfo.NODE_EXPIRY_T)
+    assert reg.get_by_path("/B/other") == []
+
+
+def test_groups_and_names():
+    reg = PeerRegistry("name")
+    n1 = PeerInfo(("127.0.0.1", 1), groups=["n1", "PERC"], paths=["/hit"], type=PeerType.node)
+    n2 = PeerInfo(("127.0.0.1", 2), groups=["n2"], paths=["/hit"], type=PeerType.node)
+    c = PeerInfo(("127.0.0.1", 3), groups=["PERC"], paths=["/hit"], type=PeerType.client)
+    reg.add_peer(n1)
+    reg.add_peer(n2)
+    reg.add_peer(c)
+
+    assert reg.get_by_group("PERC") == [n1]
+    assert reg.get_by_group("C") == []
+    assert reg.get_by_name("n2") == [n2]
+    assert reg.get_by_name("PERC") == []
+    assert reg.get_names() == ["n1", "n2"]
+    assert reg.get_by_path("/PERC/hit", filter_type=PeerType.node) == [n1]
+    assert reg.get_by_path("/n2/hit", filter_type=PeerType.node) == [n2]
+
+    # Group changes are reflected
+    reg.add_peer(PeerInfo(n1.addr, groups=["n3"], paths=["/hit"], type=PeerType.node))
+    assert reg.get_by_group("PERC") == []
+    assert reg.get_by_name("n1") == []
+    assert reg.get_by_path("/PERC/hit", filter_type=PeerType.node) == []
+
+    reg.remove_peer(n2.addr)
+    assert reg.get_names() == ["n3"]
+    assert reg.get_by_path("/n2/hit") == []
+
+
+def test_refresh_if_unchanged():
+    reg = PeerRegistry("name")
+    n = PeerInfo(("127.0.0.1", 1), groups=["B"], paths=["/a"], type=PeerType.node)
+    assert not reg.refresh_if_unchanged(n.addr, b"1")
+
+    reg.add_peer(n, b"1")
+    generation = reg.generation
+    n.last_update_t = 0
+    assert reg.refresh_if_unchanged(n.addr, b"1")
+    assert n.last_update_t > 0
+    assert not reg.refresh_if_unchanged(n.addr, b"2")
+    assert not reg.refresh_if_unchanged(n.addr, None)
+    assert reg.generation == generation
+    assert reg.updates_applied == 1 and reg.updates_skipped == 1
+
+    # Updates without digest and removed peers are never skipped
+    reg.add_peer(n)
+    assert not reg.refresh_if_unchanged(n.addr, b"1")
+    reg.add_peer(n, b"1")
+    reg.remove_peer(n.addr)
+    assert not reg.refresh_if_unchanged(n.addr, b"1")
+
+
+def test_expiry_schedule():
+    reg = PeerRegistry("name")
+    n1 = PeerInfo(("127.0.0.1", 1), groups=["B"], paths=["/a"], type=PeerType.node)
+    n2 = PeerInfo(("127.0.0.1", 2), groups=["C"], paths=["/a"], type=PeerType.node)
+    reg.add_peer(n1)
+    reg.add_peer(n2)
+    reg.add_peer(PeerInfo(("127.0.0.1", 3), groups=["D"], type=PeerType.client))
+    assert len(reg._expiry_heap) == 2  # clients never expire
+
+    # Refreshed peers are rescheduled instead of removed
+    expiry = n2.expiry_t()
+    n1.last_update_t += 10
+    reg.add_peer(n2)  # updates don't add entries
+    assert len(reg._expiry_heap) == 2
+    generation = reg.generation
+    reg.cleanup(expiry)
+    assert reg.get_by_path("/B/a") == [n1]
+    assert reg.get_by_path("/C/a") == []
+    assert reg.generation == generation + 1
+    assert len(reg._expiry_heap) == 1
+
+    # Entries of removed peers are ignored
+    reg.remove_peer(n1.addr)
+    reg.add_peer(n1)
+    reg.cleanup(expiry + 5)
+    assert reg.get_peer(n1.addr) is n1
+    reg.cleanup(n1.expiry_t())
+    assert len(reg.addr_peer_map) == 1 and len(reg._expiry_heap) == 0
+    assert reg.get_local_groups() == ["name", "D"]
+
+
+def test_local_refcounts():
+    reg = PeerRegistry("name")
+    c1 = PeerInfo(("127.0.0.1", 1), groups=["A", "B"], paths=["/a", "/b", "/a"], type=PeerType.client)
+    c2 = PeerInfo(("127.0.0.1", 2), groups=["B"], paths=["/b"], type=PeerType.client)
+    reg.add_peer(c1)
+    reg.add_peer(c2)
+    reg.add_peer(PeerInfo(("127.0.0.1", 3), groups=["N"], paths=["/n"], type=PeerType.node))
+    assert reg.get_local_groups() == ["name", "A", "B"]
+    assert reg.get_local_paths() == ["/a", "/b"]
+
+    # Changes which don't add or remove groups/paths keep the exported lists
+    version = reg.local_version
+    groups = reg._local_groups
+    reg.add_peer(PeerInfo(c2.addr, groups=["B", "A"], paths=["/a", "/b"], type=PeerType.client))
+    reg.remove_peer(c1.addr)
+    assert reg.local_version == version and reg._local_groups is groups
+
+    reg.add_peer(PeerInfo(c2.addr, groups=["name", "C"], paths=["/c"], type=PeerType.client))
+    assert reg.get_local_groups() == ["name", "C"]
+    assert reg.get_local_paths() == ["/c"]
+    assert reg.local_version > version
+
+    reg.set_name("other")
+    assert reg.get_local_groups() == ["other", "name", "C"]
+    assert reg.get_by_path("/name/c") == [reg.get_peer(c2.addr)]
+    reg.remove_peer(c2.addr)
+    assert reg.get_local_groups() == ["other"] and reg.get_local_paths() == []
+    assert reg._local_group_counts == {} and reg._local_path_counts == {}
@@ -30,13 +30,20 @@ def test_osc():
 
     pi = PeerInfo.from_osc(addr, pi_osc)
     assert pi.addr == addr
-    assert pi.groups == groups
+    assert pi.groups == tuple(groups)
     assert pi.type == t
-    assert pi.paths == paths
+    assert pi.paths == tuple(paths)
 
     pi = PeerInfo.from_osc(addr, [1, "", ""])
-    assert pi.groups == []
-    assert pi.paths == []
+    assert pi.groups == ()
+    assert pi.paths == ()
+    assert pi.version is None
+
+    pi = PeerInfo(addr, groups=["a"], paths=["/a"], type=t, version=5)
+    pi_osc = pi.as_osc()
+    assert proto.is_valid_peerinfo(pi_osc)
+    assert PeerInfo.from_osc(addr, pi_osc).version == 5
+    assert not proto.is_valid_peerinfo(pi_osc[:3] + ["5"])
  
 def test_subscribes():
     pass # tested in registry_by_path
\ No newline at end of file
@@ -0,0 +1,55 @@
+from pythonosc.osc_bundle import OscBundle
+from pythonosc.osc_bundle_builder import OscBundleBuilder
+from pythonosc.osc_message import OscMessage
+from pythonosc.osc_message_builder import OscMessageBuilder
+
+from p2psc import proto
+
+
+def test_osc_string():
+    assert proto.osc_string("") == b"\x00" * 4
+    assert proto.osc_string("abc") == b"abc\x00"
+    assert proto.osc_string("abcd") == b"abcd" + b"\x00" * 4
+
+
+def test_replace_address():
+    args = [1, 2.5, "str", b"\x01\x02\x03" * 100]
+    for old, new in [("/ALL/a", "/a"), ("/abc", "/abcd"), ("/G/abcdefg/h", "/abcdefg/h"), ("/G/x", "/")]:
+        dgram = proto.osc_dgram(old, args)
+        m = proto.replace_address(dgram, new)
+        assert m == proto.osc_dgram(new, args)
+        msg = OscMessage(m)
+        assert msg.address == new
+        assert msg.params == OscMessage(dgram).params
+
+    dgram = OscMessageBuilder("/ALL/test").build().dgram
+    assert proto.replace_address(dgram, "/test") == OscMessageBuilder("/test").build().dgram
+
+
+def test_bundle_dgram():
+    bb = OscBundleBuilder(100.25)
+    msgs = [proto.osc_message("/a", [1]), proto.osc_message("/b", ["x"])]
+    for m in msgs:
+        bb.add_content(m)
+    bundle = bb.build()
+
+    timetag = proto.bundle_timetag(bundle.dgram)
+    assert len(timetag) == 8
+    assert proto.bundle_dgram(timetag, [m.dgram for m in msgs]) == bundle.dgram
+    assert OscBundle(proto.bundle_dgram(timetag, [])).num_contents == 0
+
+
+def test_pack_bundles():
+    msgs = [proto.osc_dgram(f"/a/{i}", [i]) for i in range(20)]
+    bundles = proto.pack_bundles(proto.IMMEDIATELY_TIMETAG, msgs, 128)
+    assert len(bundles) > 1 and all(len(b) <= 128 for b in bundles)
+    contents = [c.dgram for b in bundles for c in OscBundle(b)._contents]
+    assert contents == msgs
+    assert OscBundle(bundles[0]).timestamp == 0  # IMMEDIATELY
+
+    assert len(proto.pack_bundles(proto.IMMEDIATELY_TIMETAG, msgs, 1 << 16)) == 1
+    # contents larger than the limit are sent in their own bundle
+    large = proto.osc_dgram("/large", ["x" * 200])
+    bundles = proto.pack_bundles(proto.IMMEDIATELY_TIMETAG, [msgs[0], large, msgs[1]], 128)
+    assert len(bundles) == 3
+    assert len(proto.pack_bundles(proto.IMMEDIATELY_TIMETAG, [], 128)) == 1
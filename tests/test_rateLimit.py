@@ -0,0 +1,52 @@
+from p2psc import rateLimit
+from p2psc.rateLimit import RateLimiter, TokenBucket
+
+
+def test_token_bucket():
+    b = TokenBucket(10, 2, now=0)
+    assert b.consume(0) and b.consume(0)
+    assert not b.consume(0)
+    assert not b.consume(0.05)  # half a token
+    assert b.consume(0.1)
+    # Tokens don't accumulate beyond the burst size
+    assert b.consume(100) and b.consume(100) and not b.consume(100)
+
+
+def test_sender_limit():
+    limiter = RateLimiter({"rate": 1, "burst": 2})
+    a, b = ("127.0.0.1", 1), ("127.0.0.1", 2)
+    assert [limiter.allow(a, "/ALL/test", 0) for _ in range(3)] == [True, True, False]
+    assert limiter.allow(b, "/ALL/test", 0)
+    assert limiter.allow(a, "/ALL/test", 1)
+
+    # b is full again after one second, a (empty at t=1) after two more seconds
+    limiter.prune(1)
+    assert list(limiter._senders) == [a]
+    limiter.prune(2.9)
+    assert list(limiter._senders) == [a]
+    limiter.prune(3)
+    assert len(limiter._senders) == 0
+
+
+def test_group_limits():
+    limiter = RateLimiter(group_limits={"ALL": {"rate": 1}, "*": {"rate": 2}})
+    a, b = ("127.0.0.1", 1), ("127.0.0.1", 2)
+    assert limiter.allow(a, "/ALL/test", 0)
+    assert not limiter.allow(b, "/ALL/test", 0)
+    assert limiter.allow(a, "/g1/test", 0) and limiter.allow(b, "/g1/test", 0)
+    assert not limiter.allow(a, "/g1/test", 0)
+    assert limiter.allow(a, "/g2/test", 0)
+
+    limiter = RateLimiter(group_limits={"ALL": {"rate": 1}})
+    assert all(limiter.allow(a, "/other/test", 0) for _ in range(10))
+    # Groups without limit don't get a bucket
+    assert limiter._groups == {}
+
+
+def test_max_buckets(monkeypatch):
+    monkeypatch.setattr(rateLimit, "MAX_BUCKETS", 3)
+    limiter = RateLimiter({"rate": 1}, {"*": {"rate": 1}})
+    for i in range(10):
+        assert limiter.allow(("127.0.0.1", i), f"/g{i}/test", 0)
+    assert list(limiter._senders) == [("127.0.0.1", i) for i in range(7, 10)]
+    assert list(limiter._groups) == ["g7", "g8", "g9"]
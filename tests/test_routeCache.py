@@ -0,0 +1,68 @@
+import time
+from unittest.mock import MagicMock
+
+from p2psc.peerRegistry import PeerRegistry
+from p2psc.peerInfo import PeerInfo, PeerType
+from p2psc.routeCache import RouteCache
+
+
+def test_hit_miss():
+    reg = PeerRegistry("name")
+    n = PeerInfo(("127.0.0.1", 1), groups=["A"], paths=["/test"], type=PeerType.node)
+    reg.add_peer(n)
+    cache = RouteCache(reg)
+
+    assert cache.get("/A/test", PeerType.node) == [n.addr]
+    assert cache.misses == 1 and cache.hits == 0
+    assert cache.get("/A/test", PeerType.node) == [n.addr]
+    assert cache.misses == 1 and cache.hits == 1
+
+    # peer type is part of the key
+    assert cache.get("/A/test", PeerType.client) == []
+    assert cache.misses == 2
+
+
+def test_invalidation():
+    reg = PeerRegistry("name")
+    cache = RouteCache(reg)
+    assert cache.get("/ALL/test", PeerType.client) == []
+
+    c = PeerInfo(("127.0.0.1", 1), paths=["/test"], type=PeerType.client)
+    reg.add_peer(c)
+    assert cache.get("/ALL/test", PeerType.client) == [c.addr]
+    assert cache.get("/other/test", PeerType.client) == []
+
+    reg.set_name("other")
+    assert cache.get("/other/test", PeerType.client) == [c.addr]
+
+    reg.remove_peer(c.addr)
+    assert cache.get("/ALL/test", PeerType.client) == []
+    assert cache.hits == 0
+
+    n = PeerInfo(("127.0.0.1", 2), paths=["/test"], type=PeerType.node)
+    reg.add_peer(n)
+    assert cache.get("/ALL/test", PeerType.node) == [n.addr]
+    reg.cleanup(time.time() + PeerInfo.NODE_EXPIRY_T)
+    assert cache.get("/ALL/test", PeerType.node) == []
+
+
+def test_bounded():
+    reg = PeerRegistry("name")
+    reg.get_by_path = MagicMock(return_value=[])
+    cache = RouteCache(reg, maxsize=2)
+
+    cache.get("/ALL/a", PeerType.node)
+    cache.get("/ALL/b", PeerType.node)
+    cache.get("/ALL/a", PeerType.node)  # /ALL/a is now most recently used
+    cache.get("/ALL/c", PeerType.node)
+    assert len(cache) == 2
+
+    reg.get_by_path.reset_mock()
+    cache.get("/ALL/a", PeerType.node)
+    reg.get_by_path.assert_not_called()
+    cache.get("/ALL/b", PeerType.node)
+    reg.get_by_path.assert_called_once()
+
+    cache = RouteCache(reg, maxsize=0)
+    cache.get("/ALL/a", PeerType.node)
+    assert len(cache) == 0
@@ -0,0 +1,81 @@
+import random
+
+from p2psc.peerInfo import PeerInfo, PeerType
+from p2psc.subscriptionIndex import SubscriptionIndex
+
+
+def test_literal():
+    index = SubscriptionIndex()
+    index.add(1, ["/a", "/a/b"])
+    index.add(2, ["/a/b", "/c"])
+
+    assert list(index.match("/a")) == [1]
+    assert set(index.match("/a/b")) == {1, 2}
+    assert list(index.match("/c")) == [2]
+    assert len(index.match("/a/b/c")) == 0
+    assert len(index.match("/")) == 0
+
+
+def test_wildcard_subscription():
+    index = SubscriptionIndex()
+    index.add(1, ["/test*"])
+    index.add(2, ["/a/*/c"])
+
+    assert list(index.match("/test")) == [1]
+    assert list(index.match("/testing/abc")) == [1]
+    assert len(index.match("/tes")) == 0
+    assert list(index.match("/a/b/c")) == [2]
+    assert len(index.match("/a/b")) == 0
+
+
+def test_pattern():
+    index = SubscriptionIndex()
+    index.add(1, ["/a/b1", "/a/c"])
+    index.add(2, ["/a/b2"])
+
+    assert set(index.match("/a/*")) == {1, 2}
+    assert set(index.match("/a/b?")) == {1, 2}
+    assert list(index.match("/*/c")) == [1]
+    assert len(index.match("/*")) == 0
+
+
+def test_add_remove():
+    index = SubscriptionIndex()
+    index.add(1, ["/a/b", "/a/b", "/x*"])
+    index.add(2, ["/a/b"])
+    assert 1 in index and len(index) == 2
+
+    # re-adding replaces previous paths
+    index.add(1, ["/a/c"])
+    assert list(index.match("/a/b")) == [2]
+    assert list(index.match("/a/c")) == [1]
+    assert len(index.match("/xyz")) == 0
+
+    index.remove(1)
+    index.remove(2)
+    index.remove(3)  # unknown peers are ignored
+    assert len(index) == 0
+    assert index._root.is_empty()
+
+
+def test_matches_subscribes():
+    rnd = random.Random(1)
+    segments = ["a", "b", "c1", "c2"]
+    subscriptions = []
+    for _ in range(50):
+        p = "/" + "/".join(rnd.choice(segments) for _ in range(rnd.randint(1, 3)))
+        if rnd.random() < 0.3:
+            p += "*"
+        subscriptions.append(p)
+
+    index = SubscriptionIndex()
+    peers = {}
+    for addr in range(20):
+        paths = rnd.sample(subscriptions, 3)
+        peers[addr] = PeerInfo(addr, groups=["G"], paths=paths, type=PeerType.node)
+        index.add(addr, paths)
+
+    for _ in range(200):
+        path = "/" + "/".join(rnd.choice(segments + ["*", "c?"]) for _ in range(rnd.randint(1, 4)))
+        expected = {a for a, pi in peers.items() if pi.subscribes("/G" + path, [])}
+        assert set(index.match(path)) == expected
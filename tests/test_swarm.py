@@ -0,0 +1,43 @@
+import socket
+
+from p2psc import swarm
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_subscriptions():
+    args = swarm.parse_args(["-n", "3", "-m", "7", "--paths", "2", "--path-pool", "4"])
+    subs = swarm.client_subscriptions(args)
+    assert [n for n, _ in subs] == [0, 1, 2, 0, 1, 2, 0]
+    assert all(len(set(p)) == 2 for _, p in subs)
+    assert subs == swarm.client_subscriptions(args)
+
+    paths = swarm.expected_node_paths(args)
+    assert paths[1] == set(subs[1][1]) | set(subs[4][1])
+
+
+def test_summarize():
+    args = swarm.parse_args(["-n", "2", "-m", "2", "--paths", "1", "--path-pool", "1", "-d", "1"])
+    part = {"convergence_t": 0.5, "sent": {"0": {"/swarm/p0": 3}}, "received": 2,
+            "nodes": {"0": {"cpu_time": 0.1, "messages": 3}}}
+    report = swarm.summarize(args, [part])
+    # only the client of node 1 receives messages sent by the client of node 0
+    assert report["expected"] == 3 and report["delivery_ratio"] == 2 / 3
+    assert report["convergence_t"] == 0.5
+    assert report["node_stats"]["0"]["cpu_percent"] == 10
+
+    report = swarm.summarize(args, [part, dict(part, convergence_t=None)])
+    assert report["convergence_t"] is None
+
+
+def test_run_swarm():
+    args = swarm.parse_args(["-n", "3", "-m", "6", "--interval", "0.2", "-d", "0.5", "--timeout", "5",
+                             "--base-port", str(free_port())])
+    report = swarm.summarize(args, swarm.run_processes(args))
+    assert report["convergence_t"] is not None
+    assert report["expected"] > 0 and report["delivery_ratio"] == 1
+    assert len(report["node_stats"]) == 3
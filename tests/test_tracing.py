@@ -0,0 +1,53 @@
+from p2psc.tracing import STAGES, Tracer
+
+
+def test_sampling():
+    tracer = Tracer(size=4, sample_every=2)
+    sampled = []
+    for _ in range(6):
+        sampled.append(tracer.begin())
+        tracer.discard()
+    assert sampled == [True, False, True, False, True, False]
+    assert len(tracer) == 0
+
+
+def test_ring_buffer():
+    tracer = Tracer(size=4)
+    for i in range(6):
+        assert tracer.begin()
+        tracer.parsed()
+        tracer.routed()
+        tracer.end(i)
+    assert tracer.recorded == 6 and len(tracer) == 4
+    # The oldest records were overwritten
+    assert sorted(tracer._fanout) == [2, 3, 4, 5]
+    assert not tracer.active
+    # end without begin records nothing
+    tracer.end(1)
+    assert tracer.recorded == 6
+
+    for stage in STAGES:
+        s = tracer.samples(stage)
+        assert len(s) == 4 and s == sorted(s) and s[0] >= 0
+    total, parse = tracer.samples("total"), tracer.samples("parse")
+    assert total[-1] >= parse[-1]
+    summary = dict(tracer.summary())
+    assert summary["traces"] == 4
+    assert summary["total_max_us"] == total[-1] * 1e6
+
+    tracer.clear()
+    assert len(tracer) == 0 and tracer.samples("total") == []
+
+
+def test_dump():
+    tracer = Tracer(size=100)
+    assert "0 traces" in tracer.dump()
+    for _ in range(100):
+        tracer.begin()
+        tracer.end(2)
+    text = tracer.dump()
+    assert "100 traces of 100 sampled datagrams" in text and "mean fanout 2.00" in text
+    for stage in STAGES:
+        assert f"# {stage} (us)" in text
+    assert "1.000000000000        100" in text
+    assert "Total count    =          100" in text
@@ -0,0 +1,134 @@
+import asyncio
+import socket
+from unittest.mock import MagicMock
+
+from pythonosc.osc_message import OscMessage
+
+from p2psc import proto
+from p2psc.node import Node
+from p2psc.peerInfo import PeerInfo, PeerType
+from p2psc.peerRegistry import PeerRegistry
+from p2psc.workers import (RelayProtocol, SnapshotReader, SnapshotWriter, WorkerNode, decode_registry,
+                           encode_registry, pack_relay, unpack_relay)
+
+
+def make_config(port=3760):
+    return {"name": "test", "zeroconf": False, "ip": "127.0.0.1", "port": port}
+
+
+def make_registry():
+    reg = PeerRegistry("name")
+    reg.add_peer(PeerInfo(("127.0.0.1", 1), ["A"], ["/a", "/b*"], PeerType.client))
+    reg.add_peer(PeerInfo(("127.0.0.1", 2), ["B", "C"], ["/c"], PeerType.node))
+    return reg
+
+
+def test_snapshot():
+    reg = decode_registry(encode_registry(make_registry()))
+    assert reg._node_name == "name"
+    assert reg.get_local_groups() == make_registry().get_local_groups()
+    assert [pi.addr for pi in reg.get_by_path("/ALL/bcd")] == [("127.0.0.1", 1)]
+    assert [pi.addr for pi in reg.get_by_path("/C/c")] == [("127.0.0.1", 2)]
+
+    buf = memoryview(bytearray(1024))
+    writer = SnapshotWriter(buf)
+    reader = SnapshotReader(buf)
+    assert not reader.changed() and reader.read() is None
+
+    writer.write(b"abc")
+    assert reader.changed()
+    assert reader.read() == b"abc"
+    assert not reader.changed() and reader.read() is None
+
+    writer.write(b"de")
+    buf[0] += 1  # snapshot is being written
+    assert reader.read() is None
+    buf[0] -= 1
+    assert reader.read() == b"de"
+
+
+def test_relay():
+    addr = ("192.168.1.2", 3760)
+    assert unpack_relay(pack_relay(addr, b"/a\x00\x00")) == (addr, b"/a\x00\x00")
+
+    protocol = MagicMock()
+    relay = RelayProtocol(protocol, 3760)
+    relay.datagram_received(pack_relay(addr, b"/a\x00\x00"), ("127.0.0.1", 1))
+    protocol.datagram_received.assert_not_called()
+    relay.datagram_received(pack_relay(addr, b"/a\x00\x00"), ("127.0.0.1", 3760))
+    protocol.datagram_received.assert_called_once_with(b"/a\x00\x00", addr)
+
+
+def test_worker_node():
+    buf = memoryview(bytearray(1024))
+    writer = SnapshotWriter(buf)
+    control = ("127.0.0.1", 9999)
+    node = WorkerNode(make_config(), SnapshotReader(buf), control)
+    node._transport = MagicMock()
+
+    # Control messages are relayed
+    msg = proto.osc_message(proto.PEERINFO, [])
+    node.on_osc_sync(("127.0.0.1", 1), msg)
+    node._transport.sendto.assert_called_once_with(pack_relay(("127.0.0.1", 1), msg.dgram), control)
+    node._transport.sendto.reset_mock()
+
+    # Routing uses the latest snapshot
+    msg = proto.osc_message("/ALL/c", [])
+    node.on_osc_sync(("127.0.0.1", 5), msg)
+    node._transport.sendto.assert_not_called()
+    writer.write(encode_registry(make_registry()))
+    node.on_osc_sync(("127.0.0.1", 5), msg)
+    node._transport.sendto.assert_called_once_with(msg.dgram, ("127.0.0.1", 2))
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def run_pool():
+    port = free_port()
+    config = make_config(port)
+    config["workers"] = 2
+    node = Node(config)
+    serve = asyncio.ensure_future(node.serve())
+
+    peer = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    peer.bind(("127.0.0.1", 0))
+    peer.setblocking(False)
+    loop = asyncio.get_running_loop()
+    try:
+        # wait until the workers are running
+        while node._workers is None or not all(p.is_alive() for p in node._workers._processes):
+            await asyncio.sleep(0.05)
+        await asyncio.sleep(1)
+
+        # Subscribing is handled by the control node, even if the message is received by a worker
+        info = PeerInfo(None, [], ["/x"], PeerType.client).as_osc()
+        peer.sendto(proto.osc_dgram(proto.PEERINFO, info), ("127.0.0.1", port))
+        for _ in range(100):
+            if len(node._registry.get_by_type(PeerType.client)) == 1:
+                break
+            await asyncio.sleep(0.05)
+        assert node._registry.get_by_type(PeerType.client)[0].addr == peer.getsockname()
+
+        # Messages from nodes are routed to the client by any process
+        sent = proto.osc_dgram("/ALL/x", [1])
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.bind(("127.0.0.1", 0))
+            node._registry.add_peer(PeerInfo(s.getsockname(), ["n2"], [], PeerType.node))
+            node._publish_registry()
+            await asyncio.sleep(0.1)
+            s.sendto(sent, ("127.0.0.1", port))
+            data, _ = await asyncio.wait_for(loop.sock_recvfrom(peer, 1024), 5)
+        assert OscMessage(data).address == "/x"
+    finally:
+        node.stop()
+        await asyncio.gather(serve, return_exceptions=True)
+        peer.close()
+    assert node._workers._shm is None
+
+
+def test_worker_pool():
+    asyncio.run(run_pool())